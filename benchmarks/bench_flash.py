@@ -0,0 +1,290 @@
+"""Benchmark voor de flash-pipeline.
+
+Genereert reproduceerbare synthetische versiebomen en meet load_versions_json,
+validate_drive, clear_drive en copy_version_to_drive tegen verschillende doelen:
+
+  dir    gewone map (in --workdir)
+  tmpfs  map in /dev/shm (alleen Linux)
+  image  FAT32-imagebestand: quick_format en image_version_to_drive (raw); een
+         raw doel heeft geen map, dus validate_drive wordt daar overgeslagen
+  loop   FAT32-image via een loop-device gemount (Linux, root, vfat nodig)
+
+Per meting worden mediaan en p95 van de wandkloktijd en MB/s gerapporteerd.
+Met --json worden de resultaten bewaard; --baseline vergelijkt met een eerdere
+run en geeft exitcode 1 bij een regressie groter dan --threshold.
+
+Voorbeeld:
+    python benchmarks/bench_flash.py --repeat 5 --json bench.json
+    python benchmarks/bench_flash.py --baseline bench.json --threshold 0.15
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import sd_manager  # noqa: E402
+
+MB = 1024 * 1024
+IMAGE_SIZE = 256 * MB          # grootte van image- en loop-doelen
+WARMUP = 1                     # niet-gemeten rondes per doel en vorm
+
+# naam -> lijst van (relatief pad, grootte); schaal past aantallen en groottes aan
+SHAPES = {
+    "large": lambda scale: [(f"firmware_{i}.bin", int(32 * MB * scale)) for i in range(4)],
+    "small": lambda scale: [(f"data_{i:05d}.bin", 4096) for i in range(max(1, int(2000 * scale)))],
+    "nested": lambda scale: [(f"map_{a}/sub_{b}/diep_{c}/blok_{i}.bin", 64 * 1024)
+                             for a in range(4) for b in range(4) for c in range(max(1, int(4 * scale)))
+                             for i in range(4)],
+}
+
+
+def _noop_log(message, kind="info"):
+    pass
+
+
+# ── Versiebomen ────────────────────────────────────────────────────────────────
+
+def make_source(root, shapes, scale, seed=1234):
+    """Maakt <root>/<shape> versiemappen met deterministische inhoud. Geeft {shape: bytes}."""
+    sizes = {}
+    for shape in shapes:
+        rnd = random.Random(f"{seed}-{shape}")
+        total = 0
+        for rel, size in SHAPES[shape](scale):
+            path = Path(root) / shape / rel
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "wb") as f:
+                remaining = size
+                while remaining > 0:
+                    n = min(remaining, MB)
+                    f.write(rnd.randbytes(n))
+                    remaining -= n
+            total += size
+        sizes[shape] = total
+    return sizes
+
+
+# ── Doelen ────────────────────────────────────────────────────────────────────
+
+class DirTarget:
+    name = "dir"
+    raw = False
+
+    def __init__(self, workdir):
+        self.path = tempfile.mkdtemp(prefix="bench-doel-", dir=workdir)
+
+    def close(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class TmpfsTarget(DirTarget):
+    name = "tmpfs"
+
+    def __init__(self, workdir):
+        if not os.path.isdir("/dev/shm"):
+            raise RuntimeError("geen /dev/shm")
+        super().__init__("/dev/shm")
+
+
+class ImageTarget:
+    """Imagebestand als raw doel (quick-format en image-modus)."""
+    name = "image"
+    raw = True
+
+    def __init__(self, workdir):
+        fd, self.path = tempfile.mkstemp(prefix="bench-kaart-", suffix=".img", dir=workdir)
+        os.ftruncate(fd, IMAGE_SIZE)
+        os.close(fd)
+
+    def close(self):
+        os.remove(self.path)
+
+
+class LoopTarget(DirTarget):
+    """FAT32-image, quick-geformatteerd en via een loop-device gemount."""
+    name = "loop"
+
+    def __init__(self, workdir):
+        if not sys.platform.startswith("linux") or os.geteuid() != 0:
+            raise RuntimeError("alleen als root op Linux")
+        self.image = ImageTarget(workdir)
+        if not sd_manager.quick_format_drive(self.image.path, _noop_log):
+            self.image.close()
+            raise RuntimeError("quick-format mislukt")
+        super().__init__(workdir)
+        result = subprocess.run(["mount", "-o", "loop", "-t", "vfat", self.image.path, self.path],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            os.rmdir(self.path)
+            self.image.close()
+            raise RuntimeError((result.stderr or result.stdout).strip() or "mount mislukt")
+
+    def close(self):
+        subprocess.run(["umount", self.path], capture_output=True)
+        os.rmdir(self.path)
+        self.image.close()
+
+
+TARGETS = {"dir": DirTarget, "tmpfs": TmpfsTarget, "image": ImageTarget, "loop": LoopTarget}
+
+
+# ── Meten ─────────────────────────────────────────────────────────────────────
+
+def p95(values):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(0.95 * len(ordered)) - 1)]
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0
+
+
+def summarize(op, shape, target, runs, n_bytes):
+    median = statistics.median(runs)
+    return {"op": op, "shape": shape, "target": target, "median": median, "p95": p95(runs),
+            "mbps": n_bytes / median / MB if n_bytes and median > 0 else None, "bytes": n_bytes, "runs": runs}
+
+
+WRITE_OPS = ("copy_version_to_drive", "image_version_to_drive")   # operaties die de versie schrijven
+
+
+def bench_target(target, source, shapes, sizes, repeat, verify, engine):
+    results = []
+    for shape in shapes:
+        if target.raw:
+            runs = {"quick_format": [], "image_version_to_drive": []}
+        else:
+            runs = {"validate_drive": [], "clear_drive": [], "copy_version_to_drive": []}
+        for i in range(WARMUP + repeat):
+            if i == WARMUP:  # opwarmronde (o.a. manifest en image-cache) niet meetellen
+                for values in runs.values():
+                    values.clear()
+            if target.raw:
+                runs["quick_format"].append(timed(lambda: sd_manager.quick_format_drive(target.path, _noop_log)))
+                runs["image_version_to_drive"].append(timed(lambda: sd_manager.image_version_to_drive(
+                    source, shape, target.path, _noop_log, verify=verify)))
+                continue
+            runs["clear_drive"].append(timed(lambda: sd_manager.clear_drive(target.path, _noop_log,
+                                                                            strategy="delete")))
+            runs["copy_version_to_drive"].append(timed(lambda: sd_manager.copy_version_to_drive(
+                source, shape, target.path, _noop_log, verify=verify, engine=engine)))
+            runs["validate_drive"].append(timed(lambda: sd_manager.validate_drive(
+                target.path, [".bin"], 1_000_000, allow_subdirs=True)))
+        for op, values in runs.items():
+            if values:
+                n_bytes = sizes[shape] if op in WRITE_OPS else 0
+                results.append(summarize(op, shape, target.name, values, n_bytes))
+    return results
+
+
+def bench_versions(source, repeat):
+    runs = [timed(lambda: sd_manager.load_versions_json(source)) for _ in range(repeat)]
+    return [summarize("load_versions_json", "-", "bron", runs, 0)]
+
+
+# ── Rapport ───────────────────────────────────────────────────────────────────
+
+def _key(r):
+    return f"{r['op']}|{r['shape']}|{r['target']}"
+
+
+def print_table(results, baseline=None):
+    base = {_key(r): r for r in (baseline or {}).get("results", [])}
+    print(f"{'operatie':<22} {'vorm':<7} {'doel':<6} {'mediaan':>10} {'p95':>10} {'MB/s':>9}"
+          + ("   t.o.v. baseline" if base else ""))
+    for r in results:
+        mbps = f"{r['mbps']:.1f}" if r["mbps"] else "-"
+        line = (f"{r['op']:<22} {r['shape']:<7} {r['target']:<6} {r['median'] * 1000:>8.1f}ms "
+                f"{r['p95'] * 1000:>8.1f}ms {mbps:>9}")
+        old = base.get(_key(r))
+        if old:
+            line += f"   {(r['median'] / old['median'] - 1) * 100:+.1f}%"
+        print(line)
+
+
+def regressions(results, baseline, threshold):
+    base = {_key(r): r for r in baseline.get("results", [])}
+    found = []
+    for r in results:
+        old = base.get(_key(r))
+        if old and old["median"] > 0 and r["median"] > old["median"] * (1 + threshold):
+            found.append((r, old))
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark van de SD-kaart flash-pipeline.")
+    parser.add_argument("--repeat", type=int, default=5, help="aantal herhalingen per meting")
+    parser.add_argument("--shapes", default=",".join(SHAPES), help="komma-gescheiden: " + ", ".join(SHAPES))
+    parser.add_argument("--targets", default="dir,tmpfs,image,loop", help="komma-gescheiden: " + ", ".join(TARGETS))
+    parser.add_argument("--scale", type=float, default=1.0, help="schaal van aantallen en groottes")
+    parser.add_argument("--engine", default="auto", choices=["auto", "kernel", "pipeline"])
+    parser.add_argument("--verify", action="store_true", help="met verificatie (teruglezen)")
+    parser.add_argument("--workdir", default=None, help="map voor bron en doelen (standaard systeem-temp)")
+    parser.add_argument("--json", help="resultaten als JSON opslaan")
+    parser.add_argument("--baseline", help="JSON van een eerdere run om mee te vergelijken")
+    parser.add_argument("--threshold", type=float, default=0.10, help="toegestane vertraging t.o.v. baseline")
+    args = parser.parse_args(argv)
+
+    shapes = [s for s in args.shapes.split(",") if s]
+    workdir = tempfile.mkdtemp(prefix="bench-", dir=args.workdir)
+    skipped = []
+    try:
+        source = os.path.join(workdir, "bron")
+        print(f"Versiebomen genereren in {source}...", file=sys.stderr)
+        sizes = make_source(source, shapes, args.scale)
+        results = bench_versions(source, args.repeat)
+        for name in [t for t in args.targets.split(",") if t]:
+            try:
+                target = TARGETS[name](workdir)
+            except Exception as e:
+                print(f"Doel '{name}' overgeslagen: {e}", file=sys.stderr)
+                continue
+            if target.raw:
+                skipped.append(f"validate_drive op '{name}': raw doel zonder map om te valideren")
+            try:
+                results += bench_target(target, source, shapes, sizes, args.repeat, args.verify, args.engine)
+            finally:
+                target.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+    for note in skipped:
+        print(f"overgeslagen: {note}")
+
+    if args.json:
+        meta = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                "platform": platform.platform(), "repeat": args.repeat, "scale": args.scale,
+                "engine": args.engine, "verify": args.verify, "skipped": skipped}
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=1)
+
+    if baseline:
+        slower = regressions(results, baseline, args.threshold)
+        for r, old in slower:
+            print(f"REGRESSIE {r['op']} {r['shape']} {r['target']}: "
+                  f"{old['median'] * 1000:.1f} ms -> {r['median'] * 1000:.1f} ms", file=sys.stderr)
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
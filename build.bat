@@ -6,7 +6,7 @@ echo ====================================
 :: Installeer dependencies
 pip install customtkinter psutil pyinstaller
 
-:: Bouw de .exe
+:: Bouw de .exe (GUI)
 pyinstaller ^
   --onefile ^
   --windowed ^
@@ -14,6 +14,16 @@ pyinstaller ^
   --add-data "sd_manager_config.json;." ^
   sd_manager.py
 
+:: Bouw de CLI (console, onedir: geen uitpakken bij elke start, zonder GUI-stack)
+pyinstaller ^
+  --onedir ^
+  --console ^
+  --name "SD_Kaart_Manager_CLI" ^
+  --exclude-module sd_manager_gui ^
+  --exclude-module customtkinter ^
+  --exclude-module tkinter ^
+  sd_manager.py
+
 echo.
 echo Klaar! De .exe staat in de "dist" map.
 pause
@@ -0,0 +1,258 @@
+"""Tijdmetingen per fase en een lokale SQLite-historie van flash-jobs.
+
+Elke job (één kaart) krijgt per fase (valideren, leegmaken, formatteren,
+kopiëren, verifiëren, ...) de duur, het aantal bytes en bestanden en de
+doorvoer in MB/s. De historie kan als CSV en als Prometheus-tekstbestand
+geëxporteerd worden, zodat trage kaartlezers of slechte kaartbatches opvallen.
+"""
+import csv
+import os
+import platform
+import sqlite3
+import time
+import uuid
+from contextlib import closing, contextmanager
+from datetime import datetime
+
+PHASES = ("stage", "wait", "check", "validate", "probe", "format", "wipe", "copy", "sync", "image", "verify", "flush")
+PHASE_LABELS = {
+    "stage": "klaarzetten",
+    "wait": "wachten",
+    "check": "stempel controleren",
+    "validate": "valideren",
+    "probe": "kaarttest",
+    "format": "formatteren",
+    "wipe": "leegmaken",
+    "copy": "kopiëren",
+    "sync": "synchroniseren",
+    "image": "image schrijven",
+    "verify": "verifiëren",
+    "flush": "flushen",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id       TEXT PRIMARY KEY,
+    started  REAL NOT NULL,
+    drive    TEXT,
+    version  TEXT,
+    mode     TEXT,
+    station  TEXT,
+    ok       INTEGER,
+    seconds  REAL,
+    bytes    INTEGER,
+    files    INTEGER,
+    mbps     REAL
+);
+CREATE TABLE IF NOT EXISTS phases (
+    job_id   TEXT NOT NULL REFERENCES jobs(id),
+    phase    TEXT NOT NULL,
+    started  REAL,
+    seconds  REAL,
+    bytes    INTEGER,
+    files    INTEGER,
+    mbps     REAL,
+    ok       INTEGER
+);
+CREATE INDEX IF NOT EXISTS jobs_started ON jobs(started);
+CREATE INDEX IF NOT EXISTS jobs_version ON jobs(version, started);
+CREATE INDEX IF NOT EXISTS jobs_drive ON jobs(drive, started);
+CREATE INDEX IF NOT EXISTS phases_job ON phases(job_id);
+CREATE INDEX IF NOT EXISTS phases_phase ON phases(phase, started);
+"""
+
+
+def _mbps(n_bytes, seconds):
+    return n_bytes / seconds / (1024 ** 2) if seconds > 0 and n_bytes else 0.0
+
+
+# ── Tijdmeting ─────────────────────────────────────────────────────────────────
+
+class JobTimer:
+    """Verzamelt de fasen van één flash-job. Gebruik:
+
+        with timer.phase("copy") as p:
+            ...
+            p["bytes"], p["files"] = n_bytes, n_files
+    """
+
+    def __init__(self, drive, version, mode):
+        self.id = uuid.uuid4().hex
+        self.drive = drive
+        self.version = version
+        self.mode = mode
+        self.started = time.time()
+        self.phases = []
+        self.ok = False
+        self.seconds = 0.0
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        entry = {"phase": name, "started": time.time(), "seconds": 0.0, "bytes": 0, "files": 0, "ok": True}
+        self.phases.append(entry)
+        t0 = time.perf_counter()
+        try:
+            yield entry
+        except BaseException:
+            entry["ok"] = False
+            raise
+        finally:
+            entry["seconds"] = time.perf_counter() - t0
+
+    def add_phase(self, name, seconds, n_bytes=0, files=0, ok=True):
+        """Fase die niet apart gemeten kan worden, bijv. verificatie tijdens het kopiëren."""
+        self.phases.append({"phase": name, "started": time.time() - seconds, "seconds": seconds,
+                            "bytes": n_bytes, "files": files, "ok": ok})
+
+    def finish(self, ok):
+        self.ok = ok
+        self.seconds = time.perf_counter() - self._t0
+
+    @property
+    def bytes(self):
+        return sum(p["bytes"] for p in self.phases if p["phase"] in ("copy", "sync", "image"))
+
+    @property
+    def files(self):
+        return sum(p["files"] for p in self.phases if p["phase"] in ("copy", "sync", "image"))
+
+    def summary(self):
+        """Eén regel met de tijd per fase, bijv. 'valideren 0.01 s · kopiëren 3.1 s (12 MB/s)'."""
+        parts = []
+        for p in self.phases:
+            text = f"{PHASE_LABELS.get(p['phase'], p['phase'])} {p['seconds']:.2f} s"
+            if p["bytes"] and p["seconds"] > 0:
+                text += f" ({_mbps(p['bytes'], p['seconds']):.1f} MB/s)"
+            parts.append(text)
+        return f"{' · '.join(parts)} — totaal {self.seconds:.2f} s"
+
+
+# ── Historie ───────────────────────────────────────────────────────────────────
+
+class History:
+    """Lokale SQLite-historie. Elke aanroep opent een eigen verbinding, zodat
+    meerdere kaartthreads tegelijk kunnen schrijven (WAL-modus)."""
+
+    def __init__(self, path):
+        self.path = path
+        with closing(self._connect()) as db, db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def record(self, timer, station=None):
+        station = station or platform.node()
+        with closing(self._connect()) as db, db:
+            db.execute("INSERT INTO jobs VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+                       (timer.id, timer.started, timer.drive, timer.version, timer.mode, station,
+                        int(timer.ok), timer.seconds, timer.bytes, timer.files,
+                        _mbps(timer.bytes, timer.seconds)))
+            db.executemany("INSERT INTO phases VALUES (?,?,?,?,?,?,?,?)",
+                           [(timer.id, p["phase"], p["started"], p["seconds"], p["bytes"], p["files"],
+                             _mbps(p["bytes"], p["seconds"]), int(p["ok"])) for p in timer.phases])
+
+    def jobs(self, since=None, version=None, drive=None):
+        """Jobs (nieuwste eerst) met per fase de duur in kolommen '<fase>_s'."""
+        where, args = self._filter(since, version, drive)
+        columns = ", ".join(
+            f"(SELECT SUM(seconds) FROM phases p WHERE p.job_id = j.id AND p.phase = '{ph}') AS {ph}_s"
+            for ph in PHASES)
+        with closing(self._connect()) as db:
+            rows = db.execute(f"SELECT j.*, {columns} FROM jobs j {where} ORDER BY j.started DESC", args)
+            return [dict(r) for r in rows]
+
+    def phase_summary(self, since=None, version=None, drive=None):
+        """Per drive en fase: aantal, totale duur, bytes en gemiddelde/slechtste doorvoer."""
+        where, args = self._filter(since, version, drive)
+        with closing(self._connect()) as db:
+            rows = db.execute(
+                "SELECT j.drive, p.phase, COUNT(*) AS count, SUM(p.seconds) AS seconds, "
+                "SUM(p.bytes) AS bytes, SUM(1 - p.ok) AS failed, "
+                "MIN(CASE WHEN p.bytes > 0 THEN p.mbps END) AS min_mbps "
+                f"FROM phases p JOIN jobs j ON j.id = p.job_id {where} "
+                "GROUP BY j.drive, p.phase ORDER BY j.drive, p.phase", args)
+            return [dict(r) for r in rows]
+
+    def job_counts(self, since=None, version=None, drive=None):
+        where, args = self._filter(since, version, drive)
+        with closing(self._connect()) as db:
+            rows = db.execute(f"SELECT j.drive, j.version, j.ok, COUNT(*) AS count FROM jobs j {where} "
+                              "GROUP BY j.drive, j.version, j.ok", args)
+            return [dict(r) for r in rows]
+
+    @staticmethod
+    def _filter(since, version, drive):
+        clauses, args = [], []
+        if since is not None:
+            clauses.append("j.started >= ?")
+            args.append(since)
+        if version:
+            clauses.append("j.version = ?")
+            args.append(version)
+        if drive:
+            clauses.append("j.drive = ?")
+            args.append(drive)
+        return ("WHERE " + " AND ".join(clauses)) if clauses else "", args
+
+
+# ── Export ─────────────────────────────────────────────────────────────────────
+
+def export_csv(history, path, **filters):
+    """Schrijft één regel per job (met tijd per fase) naar een CSV-bestand. Geeft het aantal jobs."""
+    rows = history.jobs(**filters)
+    fields = ["started", "drive", "version", "mode", "station", "ok", "seconds", "bytes", "files", "mbps"] + \
+             [f"{ph}_s" for ph in PHASES] + ["id"]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore", delimiter=";")
+        writer.writeheader()
+        for row in rows:
+            row["started"] = datetime.fromtimestamp(row["started"]).isoformat(timespec="seconds")
+            for key, value in row.items():
+                if isinstance(value, float):
+                    row[key] = round(value, 3)
+            writer.writerow(row)
+    return len(rows)
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def export_prometheus(history, path, **filters):
+    """Schrijft een Prometheus-tekstbestand (textfile collector) met samenvattingen
+    per drive en fase. Wordt atomair vervangen."""
+    lines = [
+        "# HELP sdkaart_jobs_total Aantal flash-jobs per drive, versie en resultaat.",
+        "# TYPE sdkaart_jobs_total counter",
+    ]
+    for r in history.job_counts(**filters):
+        result = "ok" if r["ok"] else "failed"
+        lines.append(f'sdkaart_jobs_total{{drive="{_label(r["drive"])}",version="{_label(r["version"])}",'
+                     f'result="{result}"}} {r["count"]}')
+
+    summary = history.phase_summary(**filters)
+    metrics = [
+        ("sdkaart_phase_seconds_sum", "counter", "Totale duur per fase in seconden.", lambda r: r["seconds"] or 0),
+        ("sdkaart_phase_seconds_count", "counter", "Aantal keer dat een fase uitgevoerd is.", lambda r: r["count"]),
+        ("sdkaart_phase_bytes_total", "counter", "Geschreven bytes per fase.", lambda r: r["bytes"] or 0),
+        ("sdkaart_phase_failures_total", "counter", "Mislukte fasen.", lambda r: r["failed"] or 0),
+        ("sdkaart_phase_throughput_mbps", "gauge", "Gemiddelde doorvoer per fase in MB/s.",
+         lambda r: _mbps(r["bytes"] or 0, r["seconds"] or 0)),
+        ("sdkaart_phase_throughput_min_mbps", "gauge", "Traagste job per fase in MB/s.",
+         lambda r: r["min_mbps"] or 0),
+    ]
+    for name, kind, help_text, value in metrics:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        for r in summary:
+            lines.append(f'{name}{{drive="{_label(r["drive"])}",phase="{r["phase"]}"}} {float(value(r)):g}')
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="\n") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+    return len(summary)
@@ -0,0 +1,838 @@
+"""FAT32-images en raw schrijven naar SD-kaarten.
+
+Bouwt een FAT32-bestandssysteem in een imagebestand en schrijft dat als één
+sequentiële blokschrijfactie naar een kaart, een loopback-device of een gewoon
+imagebestand. Het image bevat alleen het begin van het volume (bootsector, FAT's
+en de gebruikte clusters); de rest van de kaart hoeft niet beschreven te worden
+omdat de FAT die clusters als vrij markeert.
+"""
+import io
+import mmap
+import os
+import random
+import struct
+import subprocess
+import sys
+import time
+from array import array
+from datetime import datetime
+
+SECTOR = 512
+ALIGN_SECTORS = 8192            # data-regio uitlijnen op 4 MiB (SD erase block)
+FAT32_MIN_CLUSTERS = 65525
+FAT32_MAX_CLUSTERS = 0x0FFFFFF5
+FAT_EOC = 0x0FFFFFFF
+IMAGE_FORMAT_VERSION = 1        # ophogen als de image-indeling verandert (cache ongeldig)
+IO_CHUNK = 4 * 1024 * 1024
+PROBE_SAMPLE = 64 * 1024        # grootte van een capaciteitssteekproef
+PROBE_RANDOM = 4096             # grootte van een random schrijfactie
+
+ATTR_VOLUME_ID = 0x08
+ATTR_DIRECTORY = 0x10
+ATTR_ARCHIVE = 0x20
+ATTR_LFN = 0x0F
+
+_SHORT_INVALID = set('"*+,./:;<=>?[\\]| ')
+
+
+# ── Indeling ───────────────────────────────────────────────────────────────────
+
+def sectors_per_cluster_for(total_bytes):
+    """Clustergrootte volgens de Microsoft-standaard voor FAT32."""
+    mb = 1024 ** 2
+    gb = 1024 ** 3
+    if total_bytes <= 260 * mb:
+        return 1
+    if total_bytes <= 8 * gb:
+        return 8
+    if total_bytes <= 16 * gb:
+        return 16
+    if total_bytes <= 32 * gb:
+        return 32
+    return 64
+
+
+class Fat32Layout:
+    """Berekent de ligging van bootsector, FAT's en data voor een volume van
+    `total_sectors` sectoren. De data-regio begint op een 4 MiB-grens."""
+
+    def __init__(self, total_sectors, sectors_per_cluster=None):
+        if total_sectors > 0xFFFFFFFF:
+            raise ValueError("volume te groot voor FAT32")
+        self.total_sectors = total_sectors
+        self.spc = sectors_per_cluster or sectors_per_cluster_for(total_sectors * SECTOR)
+
+        reserved = 32
+        fat = 1
+        for _ in range(16):
+            clusters = (total_sectors - reserved - 2 * fat) // self.spc
+            needed = -(-(clusters + 2) * 4 // SECTOR)
+            if needed <= fat:
+                break
+            fat = needed
+        align = ALIGN_SECTORS if total_sectors >= 64 * ALIGN_SECTORS else 1
+        reserved += (-(reserved + 2 * fat)) % align
+
+        self.reserved = reserved
+        self.fat_sectors = fat
+        self.data_start = reserved + 2 * fat
+        self.cluster_count = (total_sectors - self.data_start) // self.spc
+        self.cluster_bytes = self.spc * SECTOR
+        if self.cluster_count < FAT32_MIN_CLUSTERS:
+            raise ValueError(f"volume van {total_sectors * SECTOR // 1024 ** 2} MB is te klein voor FAT32")
+        if self.cluster_count > FAT32_MAX_CLUSTERS:
+            raise ValueError("te veel clusters voor FAT32")
+
+    def cluster_offset(self, cluster):
+        return (self.data_start + (cluster - 2) * self.spc) * SECTOR
+
+    def clusters_for(self, size):
+        return -(-size // self.cluster_bytes)
+
+
+def _boot_sector(layout, volume_id, label, hidden_sectors=0):
+    bs = bytearray(SECTOR)
+    bs[0:3] = b"\xEB\x58\x90"
+    bs[3:11] = b"MSWIN4.1"
+    struct.pack_into("<HBHBHHBHHHII", bs, 11, SECTOR, layout.spc, layout.reserved, 2, 0, 0, 0xF8, 0,
+                     63, 255, hidden_sectors, layout.total_sectors)
+    struct.pack_into("<IHHIHH12sBBBI11s8s", bs, 36, layout.fat_sectors, 0, 0, 2, 1, 6, b"\0" * 12,
+                     0x80, 0, 0x29, volume_id, _label_bytes(label), b"FAT32   ")
+    bs[510:512] = b"\x55\xAA"
+    return bytes(bs)
+
+
+def _fsinfo_sector(free_clusters, next_free):
+    fs = bytearray(SECTOR)
+    struct.pack_into("<I", fs, 0, 0x41615252)
+    struct.pack_into("<III", fs, 484, 0x61417272, free_clusters, next_free)
+    struct.pack_into("<I", fs, 508, 0xAA550000)
+    return bytes(fs)
+
+
+def _label_bytes(label):
+    clean = "".join(c for c in (label or "").upper() if c.isascii() and c not in _SHORT_INVALID.union("."))
+    return (clean[:11] or "NO NAME").ljust(11).encode("ascii")
+
+
+def _volume_id():
+    return int(time.time() * 1000) & 0xFFFFFFFF
+
+
+# ── Directory entries ──────────────────────────────────────────────────────────
+
+def _dos_datetime(mtime):
+    t = datetime.fromtimestamp(max(mtime, 315532800))  # niet vóór 1980
+    date = ((min(t.year, 2107) - 1980) << 9) | (t.month << 5) | t.day
+    tm = (t.hour << 11) | (t.minute << 5) | (t.second // 2)
+    return date, tm
+
+
+def _short_clean(part):
+    out = []
+    for c in part.upper():
+        if c in _SHORT_INVALID:
+            continue
+        out.append(c if c.isascii() and c.isprintable() else "_")
+    return "".join(out)
+
+
+def _short_name(name, taken):
+    """Geeft (11-byte 8.3-naam, lfn_nodig). `taken` bevat de al gebruikte 8.3-namen."""
+    base, dot, ext = name.rpartition(".")
+    if not dot or not base:
+        base, ext = name, ""
+    exact = (len(base) <= 8 and len(ext) <= 3 and name == name.upper()
+             and _short_clean(base) == base and _short_clean(ext) == ext)
+    if exact:
+        short = (base.ljust(8) + ext.ljust(3)).encode("ascii")
+        if short not in taken:
+            return short, False
+    b = _short_clean(base) or "_"
+    e = _short_clean(ext)[:3]
+    for n in range(1, 1000000):
+        tail = f"~{n}"
+        short = (b[:8 - len(tail)] + tail).ljust(8) + e.ljust(3)
+        short = short.encode("ascii")
+        if short not in taken:
+            return short, True
+    raise ValueError(f"geen vrije korte naam voor {name}")
+
+
+def _lfn_checksum(short):
+    s = 0
+    for byte in short:
+        s = (((s & 1) << 7) + (s >> 1) + byte) & 0xFF
+    return s
+
+
+def _lfn_entries(name, short):
+    units = name.encode("utf-16-le")
+    chars = [units[i:i + 2] for i in range(0, len(units), 2)]
+    count = -(-len(chars) // 13)
+    if len(chars) % 13:
+        chars.append(b"\0\0")
+    chars += [b"\xFF\xFF"] * (count * 13 - len(chars))
+    checksum = _lfn_checksum(short)
+    entries = []
+    for i in range(count):
+        part = chars[i * 13:(i + 1) * 13]
+        seq = (i + 1) | (0x40 if i == count - 1 else 0)
+        entries.append(bytes([seq]) + b"".join(part[0:5]) + bytes([ATTR_LFN, 0, checksum])
+                       + b"".join(part[5:11]) + b"\0\0" + b"".join(part[11:13]))
+    return list(reversed(entries))
+
+
+def _short_entry(short, attr, cluster, size, mtime):
+    date, tm = _dos_datetime(mtime)
+    return struct.pack("<11sBBBHHHHHHHI", short, attr, 0, 0, tm, date, date,
+                       cluster >> 16, tm, date, cluster & 0xFFFF, size)
+
+
+class _Node:
+    __slots__ = ("name", "is_dir", "size", "mtime", "opener", "children", "cluster", "n_clusters", "short", "lfn")
+
+    def __init__(self, name, is_dir, size=0, mtime=0.0, opener=None):
+        self.name = name
+        self.is_dir = is_dir
+        self.size = size
+        self.mtime = mtime
+        self.opener = opener
+        self.children = {}
+        self.cluster = 0
+        self.n_clusters = 0
+        self.short = None
+        self.lfn = False
+
+
+def _build_tree(files, dirs):
+    root = _Node("", True, mtime=time.time())
+
+    def node_for(rel_dir):
+        node = root
+        if not rel_dir:
+            return node
+        for part in rel_dir.split("/"):
+            key = part.lower()
+            if key not in node.children:
+                node.children[key] = _Node(part, True, mtime=time.time())
+            node = node.children[key]
+        return node
+
+    for rel in dirs:
+        node_for(rel)
+    for rel, size, mtime, opener in files:
+        parent, _, name = rel.rpartition("/")
+        node_for(parent).children[name.lower()] = _Node(name, False, size, mtime, opener)
+    return root
+
+
+def _file_nodes(node, prefix=""):
+    """(relatief pad, node) voor alle bestanden onder `node`."""
+    for child in node.children.values():
+        rel = f"{prefix}/{child.name}" if prefix else child.name
+        if child.is_dir:
+            yield from _file_nodes(child, rel)
+        else:
+            yield rel, child
+
+
+def _assign_short_names(node):
+    taken = set()
+    for child in node.children.values():
+        child.short, child.lfn = _short_name(child.name, taken)
+        taken.add(child.short)
+        if child.is_dir:
+            _assign_short_names(child)
+
+
+def _dir_entry_count(node, is_root):
+    count = 1 if is_root else 2  # volumelabel of "." en ".."
+    for child in node.children.values():
+        count += 1 + (len(_lfn_entries(child.name, child.short)) if child.lfn else 0)
+    return count
+
+
+def _dir_bytes(node, parent, is_root, label):
+    out = []
+    if is_root:
+        out.append(struct.pack("<11sB20s", _label_bytes(label), ATTR_VOLUME_ID, b"\0" * 20))
+    else:
+        out.append(_short_entry(b".          ", ATTR_DIRECTORY, node.cluster, 0, node.mtime))
+        parent_cluster = 0 if parent is None or parent.cluster == 2 else parent.cluster
+        out.append(_short_entry(b"..         ", ATTR_DIRECTORY, parent_cluster, 0, node.mtime))
+    for child in sorted(node.children.values(), key=lambda c: c.name.lower()):
+        if child.lfn:
+            out.extend(_lfn_entries(child.name, child.short))
+        attr = ATTR_DIRECTORY if child.is_dir else ATTR_ARCHIVE
+        out.append(_short_entry(child.short, attr, child.cluster, 0 if child.is_dir else child.size, child.mtime))
+    return b"".join(out)
+
+
+# ── Image bouwen ───────────────────────────────────────────────────────────────
+
+def _fat_bytes(fat):
+    if sys.byteorder != "little":
+        fat = array("I", fat)
+        fat.byteswap()
+    return fat.tobytes()
+
+
+def build_fat32_image(out_path, total_sectors, files, dirs=(), label="SDKAART", progress=None, stream=None):
+    """
+    Bouwt een FAT32-image voor een volume van `total_sectors` sectoren in `out_path`.
+    `files` is een lijst van (relatief posix-pad, grootte, mtime in seconden, opener),
+    waarbij opener() een binair bestandsobject teruggeeft. Mappen komen vóór de
+    bestanden en elk bestand krijgt aaneengesloten clusters. Het imagebestand loopt
+    tot en met het laatst gebruikte cluster. Geeft de Fat32Layout terug.
+    Met `stream` (iterable van (relatief pad, bestandsobject) in willekeurige
+    volgorde, bijv. uit een archief) komt de inhoud daaruit in plaats van de openers.
+    """
+    layout = Fat32Layout(total_sectors)
+    root = _build_tree(files, dirs)
+    _assign_short_names(root)
+
+    # Clusters toewijzen: eerst alle mappen (breedte-eerst), daarna de bestanden
+    next_cluster = 2
+    dir_order = []
+    queue = [(root, None)]
+    while queue:
+        node, parent = queue.pop(0)
+        size = _dir_entry_count(node, node is root) * 32
+        node.cluster = next_cluster
+        node.n_clusters = max(1, layout.clusters_for(size))
+        next_cluster += node.n_clusters
+        dir_order.append((node, parent))
+        queue.extend((c, node) for c in sorted(node.children.values(), key=lambda c: c.name.lower()) if c.is_dir)
+
+    file_order = []
+    for node, _parent in dir_order:
+        for child in sorted(node.children.values(), key=lambda c: c.name.lower()):
+            if not child.is_dir:
+                file_order.append(child)
+    for node in file_order:
+        node.n_clusters = layout.clusters_for(node.size)
+        if node.n_clusters:
+            node.cluster = next_cluster
+            next_cluster += node.n_clusters
+
+    if next_cluster - 2 > layout.cluster_count:
+        raise ValueError("versie past niet op dit volume")
+
+    fat = array("I", bytes(4 * next_cluster))
+    fat[0] = 0x0FFFFFF8
+    fat[1] = FAT_EOC
+    for node in [n for n, _ in dir_order] + file_order:
+        for i in range(node.n_clusters):
+            c = node.cluster + i
+            fat[c] = FAT_EOC if i == node.n_clusters - 1 else c + 1
+
+    used = next_cluster - 2
+    volume_id = _volume_id()
+    data_end = layout.cluster_offset(next_cluster)
+
+    with open(out_path, "wb") as f:
+        boot = _boot_sector(layout, volume_id, label)
+        fsinfo = _fsinfo_sector(layout.cluster_count - used, next_cluster)
+        for base in (0, 6):
+            f.seek(base * SECTOR)
+            f.write(boot)
+            f.write(fsinfo)
+        fat_data = _fat_bytes(fat)
+        for copy in range(2):
+            f.seek((layout.reserved + copy * layout.fat_sectors) * SECTOR)
+            f.write(fat_data)
+
+        for node, parent in dir_order:
+            f.seek(layout.cluster_offset(node.cluster))
+            f.write(_dir_bytes(node, parent, node is root, label))
+
+        def copy_into(node, src):
+            f.seek(layout.cluster_offset(node.cluster))
+            remaining = node.size
+            while remaining > 0:
+                block = src.read(min(IO_CHUNK, remaining))
+                if not block:
+                    raise IOError(f"{node.name}: bron korter dan verwacht")
+                f.write(block)
+                remaining -= len(block)
+                if progress:
+                    progress(len(block))
+
+        if stream is None:
+            for node in file_order:
+                if node.size:
+                    with node.opener() as src:
+                        copy_into(node, src)
+        else:
+            by_path = {rel.lower(): node for rel, node in _file_nodes(root)}
+            for rel, src in stream:
+                node = by_path.get(rel.lower())
+                if node is not None and node.size:
+                    copy_into(node, src)
+        f.truncate(data_end)
+    return layout
+
+
+# ── Raw doel (kaart, loopback of imagebestand) ──────────────────────────────────
+
+class RawAccessError(OSError):
+    """Het raw doel kan niet geopend worden; er is nog niets geschreven."""
+
+
+class RawTarget:
+    """Open raw doel met een ongebufferd FileIO-object. Alle I/O loopt via
+    pagina-uitgelijnde mmap-buffers, zodat ook ongebufferde Windows-handles werken."""
+
+    def __init__(self, fd, size, path, kind, on_close=None, after_close=None):
+        self.fd = fd
+        self.size = size
+        self.path = path
+        self.kind = kind
+        self.file = io.FileIO(fd, "r+b", closefd=False)
+        self._on_close = on_close
+        self._after_close = after_close
+
+    @property
+    def total_sectors(self):
+        return self.size // SECTOR
+
+    def read_at(self, offset, length):
+        buf = mmap.mmap(-1, max(length, SECTOR))
+        try:
+            self.file.seek(offset)
+            n = self.file.readinto(memoryview(buf)[:length])
+            return bytes(buf[:n])
+        finally:
+            buf.close()
+
+    def write_at(self, offset, data):
+        buf = mmap.mmap(-1, max(len(data), SECTOR))
+        view = memoryview(buf)
+        try:
+            buf[:len(data)] = data
+            self.file.seek(offset)
+            done = 0
+            while done < len(data):
+                n = self.file.write(view[done:len(data)])
+                if not n:
+                    raise OSError(f"schrijven op offset {offset + done} mislukt")
+                done += n
+        finally:
+            view.release()
+            buf.close()
+
+    def flush(self):
+        os.fsync(self.fd)
+
+    def drop_cache(self):
+        """Schone pagina's van het device vergeten, zodat teruglezen echt van de kaart komt."""
+        if hasattr(os, "posix_fadvise"):
+            try:
+                os.posix_fadvise(self.fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            except OSError:
+                pass
+
+    def close(self):
+        try:
+            self.file.close()
+            if self._on_close:
+                self._on_close()
+        finally:
+            os.close(self.fd)
+            if self._after_close:
+                self._after_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _mount_device(mountpoint):
+    """Linux: het blokdevice dat op `mountpoint` gemount is (uit /proc/self/mounts)."""
+    mountpoint = os.path.realpath(mountpoint)
+    with open("/proc/self/mounts", "r", encoding="utf-8") as f:
+        for line in f:
+            device, mp = line.split()[:2]
+            mp = mp.replace("\\040", " ").replace("\\011", "\t").replace("\\134", "\\")
+            if mp == mountpoint:
+                return device
+    return None
+
+
+def _open_windows_volume(drive):
+    """Opent \\\\.\\E: exclusief: volume vergrendelen en ontkoppelen, grootte via
+    IOCTL_DISK_GET_LENGTH_INFO. Vereist administratorrechten."""
+    import ctypes
+    import msvcrt
+    from ctypes import wintypes
+
+    k32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    k32.CreateFileW.restype = wintypes.HANDLE
+    k32.CreateFileW.argtypes = [wintypes.LPCWSTR, wintypes.DWORD, wintypes.DWORD, wintypes.LPVOID,
+                                wintypes.DWORD, wintypes.DWORD, wintypes.HANDLE]
+    k32.DeviceIoControl.argtypes = [wintypes.HANDLE, wintypes.DWORD, wintypes.LPVOID, wintypes.DWORD,
+                                    wintypes.LPVOID, wintypes.DWORD, ctypes.POINTER(wintypes.DWORD),
+                                    wintypes.LPVOID]
+    GENERIC_RW = 0x80000000 | 0x40000000
+    FILE_SHARE_RW = 0x1 | 0x2
+    OPEN_EXISTING = 3
+    FILE_FLAG_NO_BUFFERING = 0x20000000
+    FILE_FLAG_WRITE_THROUGH = 0x80000000
+    FSCTL_LOCK_VOLUME = 0x00090018
+    FSCTL_UNLOCK_VOLUME = 0x0009001C
+    FSCTL_DISMOUNT_VOLUME = 0x00090020
+    IOCTL_DISK_GET_LENGTH_INFO = 0x0007405C
+
+    letter = drive.rstrip("\\/:")[-1]
+    handle = k32.CreateFileW(f"\\\\.\\{letter}:", GENERIC_RW, FILE_SHARE_RW, None, OPEN_EXISTING,
+                             FILE_FLAG_NO_BUFFERING | FILE_FLAG_WRITE_THROUGH, None)
+    if handle is None or handle == wintypes.HANDLE(-1).value:
+        raise ctypes.WinError(ctypes.get_last_error())
+
+    returned = wintypes.DWORD()
+
+    def ioctl(code, out=None, out_size=0):
+        if not k32.DeviceIoControl(handle, code, None, 0, out, out_size, ctypes.byref(returned), None):
+            raise ctypes.WinError(ctypes.get_last_error())
+
+    try:
+        ioctl(FSCTL_LOCK_VOLUME)
+        ioctl(FSCTL_DISMOUNT_VOLUME)
+        length = ctypes.c_longlong()
+        ioctl(IOCTL_DISK_GET_LENGTH_INFO, ctypes.byref(length), ctypes.sizeof(length))
+    except Exception:
+        k32.CloseHandle(handle)
+        raise
+
+    fd = msvcrt.open_osfhandle(handle, os.O_RDWR | os.O_BINARY)
+
+    def unlock():
+        try:
+            ioctl(FSCTL_UNLOCK_VOLUME)
+        except OSError:
+            pass
+
+    return fd, length.value, unlock
+
+
+def open_raw_target(target, log_cb=None):
+    """
+    Opent een raw doel voor sequentieel schrijven:
+    - een bestaand imagebestand (test/loopback-image),
+    - een blokdevice (bijv. /dev/loop0 of /dev/sdb1),
+    - een Linux-mountpoint (het device wordt eerst ontkoppeld),
+    - een Windows-stationsletter (\\\\.\\E:, vergrendeld en ontkoppeld).
+    Gooit RawAccessError als dat niet lukt.
+    """
+    log_cb = log_cb or (lambda m, k="info": None)
+    remount = None
+    try:
+        if os.name == "nt" and not os.path.isfile(target):
+            fd, size, unlock = _open_windows_volume(target)
+            return RawTarget(fd, size, target, "volume", on_close=unlock)
+
+        path = target
+        if os.path.isdir(target):
+            device = _mount_device(target) if os.path.ismount(target) else None
+            if not device or not device.startswith("/dev/"):
+                raise RawAccessError(f"{target} is geen mountpoint van een blokdevice")
+            log_cb(f"⏏️   {target} ontkoppelen ({device}) voor raw schrijven...", "info")
+            result = subprocess.run(["umount", target], capture_output=True, text=True, timeout=30)
+            if result.returncode != 0:
+                raise RawAccessError(f"ontkoppelen mislukt: {(result.stderr or result.stdout).strip()}")
+            path = device
+            remount = _remounter(device, target, log_cb)
+
+        kind = "bestand" if os.path.isfile(path) else "device"
+        flags = os.O_RDWR | getattr(os, "O_BINARY", 0)
+        if kind == "device":
+            flags |= getattr(os, "O_EXCL", 0)  # weigert als het device nog gemount is
+        fd = os.open(path, flags)
+        size = os.lseek(fd, 0, os.SEEK_END)
+        os.lseek(fd, 0, os.SEEK_SET)
+        if size < SECTOR:
+            os.close(fd)
+            raise RawAccessError(f"{path} is leeg; geef een imagebestand met de gewenste volumegrootte op")
+    except (OSError, subprocess.SubprocessError) as e:
+        if remount:
+            remount()
+        if isinstance(e, RawAccessError):
+            raise
+        raise RawAccessError(str(e)) from e
+    return RawTarget(fd, size, path, kind, after_close=remount)
+
+
+def _remounter(device, mountpoint, log_cb):
+    """Linux: koppelt het device na afloop weer op dezelfde plek, zodat er daarna
+    weer bestanden naar de kaart geschreven kunnen worden."""
+    def remount():
+        try:
+            result = subprocess.run(["mount", device, mountpoint], capture_output=True, text=True, timeout=30)
+            failed = result.returncode != 0 and (result.stderr or result.stdout).strip()
+        except (OSError, subprocess.SubprocessError) as e:
+            failed = str(e)
+        if failed:
+            log_cb(f"⚠️   Opnieuw koppelen van {mountpoint} mislukt: {failed}", "warning")
+    return remount
+
+
+def read_hidden_sectors(raw):
+    """Partitie-offset uit de huidige bootsector (FAT of exFAT), anders 0.
+    Nodig zodat het nieuwe bestandssysteem de juiste 'hidden sectors' heeft."""
+    try:
+        bs = raw.read_at(0, SECTOR)
+    except OSError:
+        return 0
+    if len(bs) < SECTOR or bs[510:512] != b"\x55\xAA":
+        return 0
+    if bs[3:11] == b"EXFAT   ":
+        return struct.unpack_from("<Q", bs, 64)[0] & 0xFFFFFFFF
+    if struct.unpack_from("<H", bs, 11)[0] == SECTOR:
+        return struct.unpack_from("<I", bs, 28)[0]
+    return 0
+
+
+def _write_regions(raw, length, pieces):
+    """Schrijft `length` bytes vanaf offset 0 sequentieel in blokken van IO_CHUNK:
+    nullen, met daarover de (offset, bytes)-stukken uit `pieces`."""
+    buf = mmap.mmap(-1, IO_CHUNK)
+    view = memoryview(buf)
+    try:
+        raw.file.seek(0)
+        offset = 0
+        while offset < length:
+            n = min(IO_CHUNK, length - offset)
+            buf[:n] = bytes(n)
+            for start, data in pieces:
+                lo = max(start, offset)
+                hi = min(start + len(data), offset + n)
+                if lo < hi:
+                    buf[lo - offset:hi - offset] = data[lo - start:hi - start]
+            raw.file.write(view[:n])
+            offset += n
+        raw.flush()
+    finally:
+        view.release()
+        buf.close()
+
+
+def quick_format(raw, label="SDKAART", hidden_sectors=None):
+    """
+    Schrijft een leeg FAT32-bestandssysteem naar het raw doel: bootsector, FSInfo,
+    back-ups, twee lege FAT's en een lege rootmap. De rest van het volume blijft
+    onaangeroerd. Zonder `hidden_sectors` worden die overgenomen van de huidige
+    bootsector. Geeft de Fat32Layout terug.
+    """
+    layout = Fat32Layout(raw.total_sectors)
+    hidden = read_hidden_sectors(raw) if hidden_sectors is None else hidden_sectors
+    boot = _boot_sector(layout, _volume_id(), label, hidden)
+    fsinfo = _fsinfo_sector(layout.cluster_count - 1, 3)
+    fat_head = struct.pack("<III", 0x0FFFFFF8, FAT_EOC, FAT_EOC)
+    root = struct.pack("<11sB20s", _label_bytes(label), ATTR_VOLUME_ID, b"\0" * 20)
+    pieces = [(0, boot), (SECTOR, fsinfo), (6 * SECTOR, boot), (7 * SECTOR, fsinfo),
+              (layout.reserved * SECTOR, fat_head),
+              ((layout.reserved + layout.fat_sectors) * SECTOR, fat_head),
+              (layout.cluster_offset(2), root)]
+    _write_regions(raw, layout.cluster_offset(3), pieces)
+    return layout
+
+
+BLKDISCARD = 0x1277
+
+
+def discard(raw):
+    """
+    Markeert het hele doel als ongebruikt (discard/TRIM), zodat de kaartcontroller
+    de blokken vooraf kan wissen en latere schrijfacties geen oude data hoeven te
+    verplaatsen. Linux-blokdevices via BLKDISCARD, imagebestanden worden sparse
+    gemaakt. Geeft False als het doel dit niet ondersteunt.
+    """
+    if raw.kind == "device" and sys.platform.startswith("linux"):
+        import fcntl
+        try:
+            fcntl.ioctl(raw.fd, BLKDISCARD, struct.pack("QQ", 0, raw.size))
+            return True
+        except OSError:
+            return False
+    if raw.kind == "bestand":
+        os.ftruncate(raw.fd, 0)
+        os.ftruncate(raw.fd, raw.size)
+        return True
+    return False
+
+
+def write_image(image_path, raw, progress=None, verify=False, hasher_factory=None):
+    """
+    Schrijft het image in één sequentiële stroom vanaf offset 0 naar het raw doel
+    en flusht. De 'hidden sectors' in de (backup-)bootsector worden overgenomen van
+    het doel. Met verify wordt het beschreven gebied teruggelezen en vergeleken.
+    Geeft (geschreven bytes, schrijftijd, verificatietijd) terug.
+    """
+    import hashlib
+
+    new_hash = hasher_factory or hashlib.sha256
+    size = os.path.getsize(image_path)
+    if size > raw.size:
+        raise OSError(f"image ({size} bytes) is groter dan het doel ({raw.size} bytes)")
+    hidden = read_hidden_sectors(raw)
+    buf = mmap.mmap(-1, IO_CHUNK)
+    view = memoryview(buf)
+    written_hash = new_hash()
+    t0 = time.perf_counter()
+    try:
+        with open(image_path, "rb", buffering=0) as img:
+            raw.file.seek(0)
+            offset = 0
+            while True:
+                n = img.readinto(view)
+                if not n:
+                    break
+                if offset == 0 and hidden:
+                    for base in (0, 6 * SECTOR):
+                        if base + SECTOR <= n:
+                            struct.pack_into("<I", buf, base + 28, hidden)
+                written_hash.update(view[:n])
+                raw.file.write(view[:n])
+                offset += n
+                if progress:
+                    progress(n)
+        raw.flush()
+        write_time = time.perf_counter() - t0
+
+        verify_time = 0.0
+        if verify:
+            t1 = time.perf_counter()
+            raw.drop_cache()
+            read_hash = new_hash()
+            raw.file.seek(0)
+            remaining = size
+            while remaining > 0:
+                n = raw.file.readinto(view[:min(IO_CHUNK, remaining)])
+                if not n:
+                    break
+                read_hash.update(view[:n])
+                remaining -= n
+            verify_time = time.perf_counter() - t1
+            if remaining or read_hash.digest() != written_hash.digest():
+                raise IOError("verificatie van het image mislukt — kaart mogelijk defect")
+    finally:
+        view.release()
+        buf.close()
+    return size, write_time, verify_time
+
+
+# ── Kaarttest ─────────────────────────────────────────────────────────────────
+
+def _probe_pattern(token, offset, length):
+    """Uniek patroon per offset: een kaart die adressen laat overlappen (neppe
+    capaciteit) overschrijft zo het patroon van een andere steekproef."""
+    return (token + offset.to_bytes(8, "little")) * (length // 16)
+
+
+def probe(raw, samples=16, seq_bytes=8 * 1024 * 1024, random_writes=64, budget=5.0):
+    """
+    Snelle, niet-destructieve kaarttest op een raw doel. Schrijft steekproeven
+    verspreid over de opgegeven capaciteit en leest ze pas terug als ze allemaal
+    geschreven zijn (vangt kaarten die minder opslag hebben dan ze melden), meet
+    sequentieel schrijven en lezen en random 4K-schrijfacties. De oorspronkelijke
+    inhoud van elk beschreven blok wordt vooraf gelezen en na afloop teruggezet.
+    Stopt netjes zodra `budget` seconden op zijn. Geeft een dict met size, samples,
+    bad (offsets), seq_write_mbps, seq_read_mbps, random_iops, seconds en complete.
+    """
+    t_start = time.perf_counter()
+    deadline = t_start + budget
+    token = os.urandom(8)
+    result = {"size": raw.size, "samples": 0, "bad": [], "seq_write_mbps": None, "seq_read_mbps": None,
+              "random_iops": None, "seconds": 0.0, "complete": False}
+    saved = []  # (offset, oorspronkelijke inhoud), in volgorde van beschrijven
+
+    def backup_and_write(offset, data):
+        try:
+            original = raw.read_at(offset, len(data))
+        except OSError:
+            result["bad"].append(offset)
+            return False
+        if len(original) != len(data):
+            result["bad"].append(offset)
+            return False
+        saved.append((offset, original))
+        raw.write_at(offset, data)
+        return True
+
+    try:
+        # 1. Capaciteit: steekproeven tot en met het laatste blok van het volume
+        last = (raw.size - PROBE_SAMPLE) // PROBE_SAMPLE * PROBE_SAMPLE
+        offsets = sorted({min(last, raw.size * i // samples // PROBE_SAMPLE * PROBE_SAMPLE)
+                          for i in range(1, samples + 1)})
+        written = []
+        for offset in offsets:
+            if time.perf_counter() > deadline:
+                break
+            if backup_and_write(offset, _probe_pattern(token, offset, PROBE_SAMPLE)):
+                written.append(offset)
+        raw.flush()
+        raw.drop_cache()
+        for offset in written:
+            try:
+                ok = raw.read_at(offset, PROBE_SAMPLE) == _probe_pattern(token, offset, PROBE_SAMPLE)
+            except OSError:
+                ok = False
+            if not ok:
+                result["bad"].append(offset)
+        result["samples"] = len(offsets)
+
+        # 2. Sequentieel schrijven en lezen, midden op de kaart (uitgelijnd op 4 MiB)
+        offset = raw.size // 2 // IO_CHUNK * IO_CHUNK
+        length = min(seq_bytes, raw.size - offset) // SECTOR * SECTOR
+        if time.perf_counter() < deadline and length > 0:
+            pattern = _probe_pattern(token, offset, length)
+            try:
+                original = raw.read_at(offset, length)
+            except OSError:
+                original = b""
+            if len(original) != length:
+                result["bad"].append(offset)
+            else:
+                saved.append((offset, original))
+                t0 = time.perf_counter()
+                raw.write_at(offset, pattern)
+                raw.flush()
+                result["seq_write_mbps"] = length / max(time.perf_counter() - t0, 1e-6) / 1024 ** 2
+                raw.drop_cache()
+                t0 = time.perf_counter()
+                data = raw.read_at(offset, length)
+                result["seq_read_mbps"] = length / max(time.perf_counter() - t0, 1e-6) / 1024 ** 2
+                if data != pattern:
+                    result["bad"].append(offset)
+
+        # 3. Random 4K-schrijfacties, elk direct geflusht
+        rnd = random.Random()
+        count = 0
+        spent = 0.0
+        for _ in range(random_writes):
+            if time.perf_counter() > deadline:
+                break
+            offset = rnd.randrange(raw.size // PROBE_RANDOM) * PROBE_RANDOM
+            try:
+                original = raw.read_at(offset, PROBE_RANDOM)
+            except OSError:
+                continue
+            saved.append((offset, original))
+            t0 = time.perf_counter()
+            raw.write_at(offset, _probe_pattern(token, offset, PROBE_RANDOM))
+            raw.flush()
+            spent += time.perf_counter() - t0
+            count += 1
+        if count:
+            result["random_iops"] = count / max(spent, 1e-6)
+        result["complete"] = time.perf_counter() <= deadline
+    finally:
+        # Oorspronkelijke inhoud terug, in omgekeerde volgorde (overlappende blokken kloppen dan)
+        for offset, original in reversed(saved):
+            raw.write_at(offset, original)
+        raw.flush()
+    result["seconds"] = time.perf_counter() - t_start
+    return result
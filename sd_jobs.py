@@ -0,0 +1,220 @@
+"""Persistente wachtrij van kaarten en schrijfjournaal voor het hervatten van kopieën.
+
+De wachtrij bewaart elke gedetecteerde kaart (drive, kaartherkenning, versie,
+bronmap) tot die geflasht of verwijderd is, ook over een herstart van het
+programma heen. Het journaal houdt per kopieeropdracht bij welke bestanden (met
+hash en grootte) aantoonbaar op de kaart staan: een bestand wordt pas vastgelegd
+nadat het volume geflusht is. Komt dezelfde kaart na een onderbreking terug, dan
+gaat het kopiëren verder vanaf het laatste duurzame bestand in plaats van opnieuw
+te wissen en alles te schrijven. Afgeronde items worden na JOBS_RETENTION opgeruimd.
+"""
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+
+JOURNAL_CHECKPOINT_BYTES = 64 * 1024 * 1024   # zoveel geschreven data tussen twee flushes
+JOURNAL_CHECKPOINT_FILES = 200                # of zoveel bestanden
+JOBS_RETENTION = 7 * 24 * 3600                # afgeronde wachtrij-items en kopieën zolang bewaren
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue (
+    id       TEXT PRIMARY KEY,
+    created  REAL NOT NULL,
+    drive    TEXT NOT NULL,
+    version  TEXT NOT NULL,
+    source   TEXT NOT NULL,
+    state    TEXT NOT NULL,
+    updated  REAL,
+    card     TEXT
+);
+CREATE TABLE IF NOT EXISTS copies (
+    id       TEXT PRIMARY KEY,
+    card     TEXT NOT NULL,
+    version  TEXT NOT NULL,
+    digest   TEXT NOT NULL,
+    state    TEXT NOT NULL,
+    started  REAL,
+    updated  REAL
+);
+CREATE TABLE IF NOT EXISTS journal (
+    copy_id  TEXT NOT NULL REFERENCES copies(id),
+    rel      TEXT NOT NULL,
+    hash     TEXT,
+    size     INTEGER,
+    PRIMARY KEY (copy_id, rel)
+);
+CREATE INDEX IF NOT EXISTS queue_state ON queue(state, created);
+CREATE INDEX IF NOT EXISTS copies_card ON copies(card, version, digest, state);
+"""
+
+
+class JobStore:
+    """SQLite-opslag van wachtrij en journaal. Elke aanroep opent een eigen
+    verbinding, zodat kaartthreads tegelijk kunnen schrijven (WAL-modus)."""
+
+    def __init__(self, path):
+        self.path = path
+        with closing(self._connect()) as db, db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+            columns = {row["name"] for row in db.execute("PRAGMA table_info(queue)")}
+            if "card" not in columns:   # database van vóór de kaartherkenning
+                db.execute("ALTER TABLE queue ADD COLUMN card TEXT")
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def recover(self):
+        """Bij het opstarten: wat als 'bezig' achterbleef is onderbroken, en oude
+        afgeronde items worden opgeruimd. Geeft (aantal wachtrij-items, aantal
+        onderbroken kopieën)."""
+        now = time.time()
+        with closing(self._connect()) as db, db:
+            queued = db.execute("UPDATE queue SET state = 'queued', updated = ? WHERE state = 'running'",
+                                (now,)).rowcount
+            copies = db.execute("UPDATE copies SET state = 'interrupted', updated = ? WHERE state = 'running'",
+                                (now,)).rowcount
+        self.prune()
+        return queued, copies
+
+    def prune(self, max_age=JOBS_RETENTION):
+        """Verwijdert afgeronde wachtrij-items en kopieën (met hun journaal) die langer
+        dan `max_age` seconden niet meer bijgewerkt zijn. Geeft het aantal verwijderde rijen."""
+        cutoff = time.time() - max_age
+        with closing(self._connect()) as db, db:
+            removed = db.execute("DELETE FROM queue WHERE state IN ('done', 'failed', 'cancelled') "
+                                 "AND updated < ?", (cutoff,)).rowcount
+            db.execute("DELETE FROM journal WHERE copy_id IN "
+                       "(SELECT id FROM copies WHERE state != 'running' AND updated < ?)", (cutoff,))
+            removed += db.execute("DELETE FROM copies WHERE state != 'running' AND updated < ?",
+                                  (cutoff,)).rowcount
+        return removed
+
+    # ── Wachtrij ──
+
+    def enqueue(self, drive, version, source, card=None):
+        """Zet een kaart in de wachtrij; een drive staat er hooguit één keer in. Staat
+        de drive al in de wachtrij, dan krijgt dat item de nieuwe versie, bronmap en
+        kaart (`card`: sd_manager.card_identity) — behalve terwijl het al loopt."""
+        now = time.time()
+        with closing(self._connect()) as db, db:
+            row = db.execute("SELECT id, state FROM queue WHERE drive = ? AND state IN ('queued', 'running')",
+                             (drive,)).fetchone()
+            if row:
+                if row["state"] == "queued":
+                    db.execute("UPDATE queue SET version = ?, source = ?, card = COALESCE(?, card), updated = ? "
+                               "WHERE id = ?", (version, source, card, now, row["id"]))
+                return row["id"]
+            job_id = uuid.uuid4().hex
+            db.execute("INSERT INTO queue (id, created, drive, version, source, state, updated, card) "
+                       "VALUES (?,?,?,?,?,?,?,?)", (job_id, now, drive, version, source, "queued", now, card))
+            return job_id
+
+    def cancel(self, drive):
+        """Haalt de wachtende kaart van deze drive uit de wachtrij (bijv. omdat hij
+        verwijderd is). Een lopend item blijft staan. Geeft het aantal geannuleerde items."""
+        with closing(self._connect()) as db, db:
+            return db.execute("UPDATE queue SET state = 'cancelled', updated = ? WHERE drive = ? AND state = 'queued'",
+                              (time.time(), drive)).rowcount
+
+    def set_card(self, drive, card):
+        """Vult de kaartherkenning in van het wachtende of lopende item van deze drive,
+        als die nog onbekend was (de herkenning wordt op de achtergrond bepaald)."""
+        with closing(self._connect()) as db, db:
+            db.execute("UPDATE queue SET card = ?, updated = ? WHERE drive = ? AND card IS NULL "
+                       "AND state IN ('queued', 'running')", (card, time.time(), drive))
+
+    def queued(self):
+        """Wachtende items, oudste eerst."""
+        with closing(self._connect()) as db:
+            rows = db.execute("SELECT * FROM queue WHERE state = 'queued' ORDER BY created")
+            return [dict(r) for r in rows]
+
+    def set_state(self, job_id, state):
+        with closing(self._connect()) as db, db:
+            db.execute("UPDATE queue SET state = ?, updated = ? WHERE id = ?", (state, time.time(), job_id))
+
+    # ── Schrijfjournaal ──
+
+    def open_journal(self, card, version, digest):
+        """Journaal voor deze kaart en versie-inhoud: een onderbroken kopie wordt
+        hervat, anders wordt een nieuwe begonnen. Een mislukte kopie wordt nooit
+        hervat: wat er op de kaart staat is dan niet te vertrouwen."""
+        now = time.time()
+        with closing(self._connect()) as db, db:
+            row = db.execute("SELECT id FROM copies WHERE card = ? AND version = ? AND digest = ? "
+                             "AND state IN ('interrupted', 'running') ORDER BY updated DESC",
+                             (card, version, digest)).fetchone()
+            if row:
+                copy_id = row["id"]
+                db.execute("UPDATE copies SET state = 'running', updated = ? WHERE id = ?", (now, copy_id))
+                done = {r["rel"]: {"hash": r["hash"], "size": r["size"]}
+                        for r in db.execute("SELECT rel, hash, size FROM journal WHERE copy_id = ?", (copy_id,))}
+            else:
+                copy_id = uuid.uuid4().hex
+                db.execute("INSERT INTO copies VALUES (?,?,?,?,?,?,?)",
+                           (copy_id, card, version, digest, "running", now, now))
+                done = {}
+        return WriteJournal(self, copy_id, done)
+
+    def resumable(self, card, version, digest):
+        """True als er voor deze kaart en versie-inhoud een onderbroken kopie met
+        vastgelegde bestanden is."""
+        with closing(self._connect()) as db:
+            row = db.execute("SELECT COUNT(*) AS n FROM copies c JOIN journal j ON j.copy_id = c.id "
+                             "WHERE c.card = ? AND c.version = ? AND c.digest = ? "
+                             "AND c.state IN ('interrupted', 'running')",
+                             (card, version, digest)).fetchone()
+            return bool(row["n"])
+
+    def _record(self, copy_id, entries):
+        with closing(self._connect()) as db, db:
+            db.executemany("INSERT OR REPLACE INTO journal VALUES (?,?,?,?)",
+                           [(copy_id, rel, h, size) for rel, h, size in entries])
+            db.execute("UPDATE copies SET updated = ? WHERE id = ?", (time.time(), copy_id))
+
+    def _finish(self, copy_id, ok):
+        with closing(self._connect()) as db, db:
+            db.execute("UPDATE copies SET state = ?, updated = ? WHERE id = ?",
+                       ("done" if ok else "failed", time.time(), copy_id))
+            if ok:
+                db.execute("DELETE FROM journal WHERE copy_id = ?", (copy_id,))
+
+
+class WriteJournal:
+    """Journaal van één kopie. `done` bevat de bestanden die al duurzaam op de kaart
+    staan; add() verzamelt nieuwe bestanden en checkpoint() legt ze vast na een flush."""
+
+    def __init__(self, store, copy_id, done):
+        self.store = store
+        self.id = copy_id
+        self.done = done
+        self._pending = []
+        self._pending_bytes = 0
+
+    def add(self, rel, digest, size, target):
+        self._pending.append((rel, digest, size, target))
+        self._pending_bytes += size
+
+    def due(self):
+        return self._pending_bytes >= JOURNAL_CHECKPOINT_BYTES or len(self._pending) >= JOURNAL_CHECKPOINT_FILES
+
+    def pending_targets(self):
+        return [target for _rel, _digest, _size, target in self._pending]
+
+    def checkpoint(self):
+        """Vastleggen wat sinds de vorige checkpoint geschreven is. Alleen aanroepen
+        nadat die bestanden naar de kaart geflusht zijn."""
+        if not self._pending:
+            return
+        self.store._record(self.id, [(rel, digest, size) for rel, digest, size, _target in self._pending])
+        for rel, digest, size, _target in self._pending:
+            self.done[rel] = {"hash": digest, "size": size}
+        self._pending.clear()
+        self._pending_bytes = 0
+
+    def finish(self, ok):
+        self.store._finish(self.id, ok)
@@ -1,21 +1,56 @@
-import customtkinter as ctk
-import tkinter as tk
-from tkinter import filedialog, messagebox
+import abc
+import argparse
+import errno
+import hashlib
 import json
+import logging
+import logging.handlers
+import mmap
 import os
+import queue
 import shutil
+import stat
 import threading
-import psutil
 import subprocess
+import sys
+import tarfile
 import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
 
-# ── Thema ──────────────────────────────────────────────────────────────────────
-ctk.set_appearance_mode("dark")
-ctk.set_default_color_theme("blue")
+# customtkinter/tkinter (GUI) en psutil worden pas geladen waar ze nodig zijn,
+# zodat de CLI snel opstart.
 
 CONFIG_FILE = "sd_manager_config.json"
+LOG_FILE = "sd_manager_log.jsonl"
+LOG_MAX_BYTES = 5 * 1024 * 1024     # roteren bij deze grootte
+LOG_BACKUPS = 3                     # aantal oude logbestanden (.1, .2, ...)
+HISTORY_DB = "sd_manager_history.sqlite"
+JOBS_DB = "sd_manager_jobs.sqlite"  # wachtrij en schrijfjournaal
+VERSION_CACHE_FILE = "sd_manager_versions_cache.json"  # lokale kopie van de versielijst per bronmap
+VERSION_POLL_INTERVAL = 5.0     # seconden tussen mtime-controles van de bronmap
+VERSION_FULL_RESCAN = 120.0     # toch volledig herscannen als er zo lang niets veranderde
+CACHE_DIRNAME = ".sdkaart"      # sidecar cache in de bronmap (wordt als versie genegeerd)
+MANIFEST_WORKERS = 8
+COPY_CHUNK = 1024 * 1024
+COPY_BUFFER = 4 * 1024 * 1024   # veelvoud van de gangbare SD allocation unit (4 MiB)
+VERIFY_RETRIES = 2              # extra schrijfpogingen bij een hash-mismatch
+PIPELINE_DEPTH = 4              # max. blokken van COPY_BUFFER tussen lezer en schrijver
+PROGRESS_INTERVAL = 0.25        # seconden tussen voortgangsmeldingen
+REMOTE_FSTYPES = {"nfs", "nfs4", "cifs", "smbfs", "smb3", "fuse.sshfs", "9p"}
+DRIVE_DEBOUNCE = 0.3            # seconden stilte na device-events voor een herscan
+DRIVE_POLL_INTERVAL = 2.0       # alleen voor de polling-backend
+DRIVE_FULL_RESCAN = 30.0        # volledige herscan (incl. wmic) als er zo lang niets gebeurde
+STAGING_BUDGET_GB = 20.0        # standaard grootte van de lokale staging-cache
+STAMP_FILE = "sdkaart-versie.json"  # versiestempel op de kaart na een geslaagde flash
+IMAGE_LABEL = "SDKAART"         # volumelabel van geschreven images
+ARCHIVE_SUFFIXES = (".zip", ".tar.xz", ".txz", ".tar.zst", ".tzst")
+WIPE_DELETE_MAX_ENTRIES = 200   # meer items: quick-format is sneller dan losse deletes
+WIPE_DISCARD_MIN_BYTES = 1024 ** 3  # zoveel data: ook discard/TRIM zodat nieuwe writes snel blijven
+JOURNAL_SPOT_CHECKS = 8         # zoveel journaalbestanden teruglezen voordat een kopie hervat wordt
 
 DEFAULT_CONFIG = {
     "source_dir": "",
@@ -26,15 +61,121 @@ DEFAULT_CONFIG = {
     "last_version": "",
     "max_drive_gb": 5.0,
     "auto_format_corrupt": False,
+    "multi_drive": False,
+    "sync_mode": False,
+    "verify_writes": False,
+    "copy_engine": "auto",      # auto | kernel | pipeline
+    "drive_watcher": "auto",    # auto | windows | mountinfo | polling
+    "image_mode": False,        # FAT32-image raw naar de kaart schrijven
+    "wipe_strategy": "auto",    # auto | delete | quickformat | discard
+    "log_file": LOG_FILE,       # leeg = geen logbestand
+    "history_db": HISTORY_DB,   # SQLite-historie met tijden per fase; leeg = uit
+    "staging_dir": "",          # lokale kopie van versies van een share; leeg = uit
+    "staging_budget_gb": STAGING_BUDGET_GB,
+    "job_db": JOBS_DB,          # wachtrij en hervatten van onderbroken kopieën; leeg = uit
+    "probe_cards": False,       # kaarttest (capaciteit en snelheid) vóór het schrijven
+    "probe_budget_s": 5.0,      # maximale duur van de kaarttest
+    "probe_min_write_mbps": 0.0,  # kaarten die trager sequentieel schrijven weigeren; 0 = niet weigeren
+    "skip_up_to_date": True,    # kaart met geldig versiestempel niet opnieuw schrijven
+    "flush_policy": "end",      # end (één flush van het volume) | file (fsync per bestand)
+    "concurrency": 0,           # kaarten tegelijk per hub/lezer; 0 = geen limiet, "auto" = adaptief
+    "concurrency_max": 8,       # bovengrens (en beginwaarde) van de adaptieve regeling
+    "drive_provider": "system", # system (echte kaarten) | sim (nepkaarten voor load-tests)
+    "sim_root": "",             # map voor de nepkaarten; leeg = tijdelijke map
+    "sim_cards": 8,
+    "sim_size_gb": 1.0,
+    "sim_backing": "dir",       # dir (map per kaart) | image (imagebestand per kaart)
+    "sim_write_mbps": 20.0,     # schrijfsnelheid per nepkaart; 0 = onbeperkt
+    "sim_latency_ms": 0.0,
+    "sim_failure_rate": 0.0,    # kans op een schrijffout per kaart
+    "sim_script": "",           # scriptbestand met plaats/verwijder-momenten; leeg = alle kaarten geplaatst
+    "sim_hubs": 1,
+    "sim_hub_mbps": 0.0,        # gedeelde bandbreedte per gesimuleerde hub; 0 = geen
+    "sim_contention": 0.0,      # doorvoerverlies per extra schrijver op een hub
 }
 
 
 # ── Hulpfuncties ───────────────────────────────────────────────────────────────
 
-def load_config():
-    if os.path.exists(CONFIG_FILE):
+class _JsonlFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+                 "kind": record.kind, "message": record.getMessage()}
+        entry.update(record.fields)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class JsonlLog:
+    """
+    Persistent logbestand met één JSON-record per regel ({"ts", "kind", "message",
+    ...extra velden}), geroteerd bij LOG_MAX_BYTES. write() zet het record alleen in
+    een queue; een achtergrondthread schrijft naar schijf, zodat de GUI- en
+    kopieerthreads nooit op de schijf wachten.
+    """
+
+    def __init__(self, path=LOG_FILE, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS):
+        self.path = path
+        self._queue = queue.SimpleQueue()
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                       encoding="utf-8", delay=True)
+        handler.setFormatter(_JsonlFormatter())
+        self._listener = logging.handlers.QueueListener(self._queue, handler)
+
+    def start(self):
+        self._listener.start()
+        return self
+
+    def write(self, message, kind="info", **fields):
+        record = logging.LogRecord("sdkaart", logging.INFO, "", 0, message, None, None)
+        record.kind = kind
+        record.fields = {k: v for k, v in fields.items() if v is not None}
+        self._queue.put(record)
+
+    def stop(self):
+        """Schrijft wat nog in de queue staat weg en stopt de schrijfthread."""
+        self._listener.stop()
+        for handler in self._listener.handlers:
+            handler.close()
+
+
+def open_log(config):
+    """Start het persistente log uit de config, of None als het uitgeschakeld is."""
+    path = config.get("log_file", LOG_FILE)
+    if not path:
+        return None
+    try:
+        return JsonlLog(path).start()
+    except OSError:
+        return None
+
+
+_job_stores = {}
+_job_stores_lock = threading.Lock()
+
+
+def open_jobs(config):
+    """Wachtrij en schrijfjournaal uit de config, of None als die uitgeschakeld zijn.
+    Eén JobStore per databasebestand: het openen (WAL, schema, migratie) gebeurt zo
+    één keer per proces in plaats van bij elke flash."""
+    path = config.get("job_db", JOBS_DB)
+    if not path:
+        return None
+    key = os.path.abspath(path)
+    with _job_stores_lock:
+        store = _job_stores.get(key)
+        if store is None:
+            try:
+                from sd_jobs import JobStore
+                store = _job_stores[key] = JobStore(path)
+            except Exception:
+                return None
+        return store
+
+
+def load_config(path=CONFIG_FILE):
+    if os.path.exists(path):
         try:
-            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+            with open(path, "r", encoding="utf-8") as f:
                 cfg = json.load(f)
                 # merge met defaults voor ontbrekende sleutels
                 for k, v in DEFAULT_CONFIG.items():
@@ -45,53 +186,110 @@ def load_config():
     return DEFAULT_CONFIG.copy()
 
 
-def save_config(cfg):
-    with open(CONFIG_FILE, "w", encoding="utf-8") as f:
+def save_config(cfg, path=CONFIG_FILE):
+    with open(path, "w", encoding="utf-8") as f:
         json.dump(cfg, f, indent=2, ensure_ascii=False)
 
 
 def get_removable_drives():
     """Geeft lijst van verwisselbare schijven terug als (letter, label, size_gb).
     Lege slots (geen media) worden gefilterd."""
+    import psutil
+    drives = _drives_from_partitions(psutil.disk_partitions(all=False))
+    # Windows-specifieke fallback via wmic
+    if not drives:
+        drives = _wmic_removable_drives()
+    return drives
+
+
+def _drives_from_partitions(partitions, usage_cache=None):
+    """Verwisselbare drives uit een psutil-partitielijst. Met `usage_cache`
+    ({(device, mountpoint, fstype): size_gb}) wordt disk_usage alleen voor nieuwe
+    partities opgevraagd."""
+    import psutil
     drives = []
-    for part in psutil.disk_partitions(all=False):
+    for part in partitions:
         if "removable" in part.opts or part.fstype in ("FAT32", "FAT", "exFAT"):
+            key = (part.device, part.mountpoint, part.fstype)
             try:
-                usage = psutil.disk_usage(part.mountpoint)
-                size_gb = usage.total / (1024 ** 3)
+                if usage_cache is not None and key in usage_cache:
+                    size_gb = usage_cache[key]
+                else:
+                    size_gb = psutil.disk_usage(part.mountpoint).total / (1024 ** 3)
+                    if usage_cache is not None:
+                        usage_cache[key] = size_gb
                 if size_gb < 0.01:  # lege slot in multicard lezer
                     continue
                 label = part.mountpoint.rstrip("\\")
                 drives.append((label, f"{label}  [{size_gb:.1f} GB]", size_gb))
             except Exception:
                 pass  # niet mountbaar = lege slot, overslaan
-    # Windows-specifieke fallback via wmic
-    if not drives:
+    return drives
+
+
+def card_identity(drive_letter):
+    """
+    Herkenning van een kaart over uitnemen en terugplaatsen heen: het
+    volumeserienummer (Windows) of de bestandssysteem-UUID (Linux). Verandert bij
+    formatteren. Voor een gewone map (geen mountpoint) het pad. None als onbekend.
+    """
+    path = os.path.abspath(drive_letter)
+    if os.name == "nt":
         try:
-            result = subprocess.run(
-                ["wmic", "logicaldisk", "where", "drivetype=2", "get",
-                 "deviceid,volumename,size", "/format:csv"],
-                capture_output=True, text=True, timeout=5
-            )
-            for line in result.stdout.splitlines():
-                parts = line.strip().split(",")
-                if len(parts) >= 4 and parts[1]:
-                    letter = parts[1].strip()
-                    name = parts[3].strip() or "Geen label"
-                    try:
-                        size_gb = int(parts[2].strip()) / (1024 ** 3)
-                        if size_gb < 0.01:
-                            continue
-                        drives.append((letter, f"{letter}  {name}  [{size_gb:.1f} GB]", size_gb))
-                    except Exception:
-                        pass  # geen grootte = lege slot
+            import ctypes
+            serial = ctypes.c_uint32()
+            root = os.path.splitdrive(path)[0] + "\\"
+            if ctypes.windll.kernel32.GetVolumeInformationW(root, None, 0, ctypes.byref(serial),
+                                                            None, None, None, 0):
+                return f"vol:{serial.value:08X}"
         except Exception:
             pass
+        return None
+    if not os.path.ismount(path):
+        return f"pad:{path}"
+    try:
+        import psutil
+        device = next((p.device for p in psutil.disk_partitions(all=False) if p.mountpoint == path), None)
+        if device:
+            real = os.path.realpath(device)
+            for uuid in os.listdir("/dev/disk/by-uuid"):
+                if os.path.realpath(os.path.join("/dev/disk/by-uuid", uuid)) == real:
+                    return f"uuid:{uuid}"
+    except Exception:
+        pass
+    return None
+
+
+def _wmic_removable_drives():
+    """Verwisselbare drives via wmic (Windows), voor als psutil niets vindt."""
+    drives = []
+    try:
+        result = subprocess.run(
+            ["wmic", "logicaldisk", "where", "drivetype=2", "get",
+             "deviceid,volumename,size", "/format:csv"],
+            capture_output=True, text=True, timeout=5
+        )
+        for line in result.stdout.splitlines():
+            parts = line.strip().split(",")
+            if len(parts) >= 4 and parts[1]:
+                letter = parts[1].strip()
+                name = parts[3].strip() or "Geen label"
+                try:
+                    size_gb = int(parts[2].strip()) / (1024 ** 3)
+                    if size_gb < 0.01:
+                        continue
+                    drives.append((letter, f"{letter}  {name}  [{size_gb:.1f} GB]", size_gb))
+                except Exception:
+                    pass  # geen grootte = lege slot
+    except Exception:
+        pass
     return drives
 
 
-def load_versions_json(source_dir):
-    """Laad of maak het versions.json bestand in de hoofdmap."""
+def load_versions_json(source_dir, present_only=False):
+    """Laad of maak het versions.json bestand in de hoofdmap. Met present_only alleen
+    de versies die nu als map of pakket aanwezig zijn (beschrijvingen van verdwenen
+    versies blijven in versions.json bewaard)."""
     json_path = Path(source_dir) / "versions.json"
     data = {}
 
@@ -102,86 +300,103 @@ def load_versions_json(source_dir):
         except Exception:
             data = {}
 
-    # Submappen scannen en ontbrekende toevoegen
+    # Submappen en versiepakketten (.zip, .tar.xz, .tar.zst) scannen en ontbrekende toevoegen.
+    # os.scandir levert het type uit de listing, zonder extra stat per item over de share.
     changed = False
-    for item in Path(source_dir).iterdir():
-        if item.is_dir() and not item.name.startswith("."):
-            if item.name not in data:
-                data[item.name] = {"omschrijving": "", "functie": ""}
+    present = set()
+    with os.scandir(source_dir) as it:
+        for entry in it:
+            if entry.name.startswith("."):
+                continue
+            name = entry.name if entry.is_dir() else archive_version_name(entry.name)
+            if name:
+                present.add(name)
+            if name and name not in data:
+                data[name] = {"omschrijving": "", "functie": ""}
                 changed = True
 
     if changed or not json_path.exists():
         with open(json_path, "w", encoding="utf-8") as f:
             json.dump(data, f, indent=2, ensure_ascii=False)
 
+    if present_only:
+        data = {name: info for name, info in data.items() if name in present}
     return data, json_path
 
 
+# Windows systeemmappen die altijd aanwezig kunnen zijn op een SD-kaart
+SYSTEM_DIRS = {
+    "system volume information",
+    "$recycle.bin",
+    "recycler",
+    "$recyclebin",
+    "found.000",
+}
+
+
+def is_system_name(name):
+    """True voor systeemmappen, het versiestempel en verborgen items (beginnen met $ of .)."""
+    if name.lower() in SYSTEM_DIRS or name.lower() == STAMP_FILE:
+        return True
+    return name.startswith("$") or name.startswith(".")
+
+
 def validate_drive(drive_letter, allowed_exts, max_files, allow_subdirs=False, max_drive_gb=None, drive_size_gb=None):
     """
     Valideert of de drive veilig leeggemaakt mag worden.
-    Geeft (ok: bool, reden: str) terug.
+    Geeft (ok: bool, reden: str, mogelijk_corrupt: bool) terug.
     Windows systeemmappen en verborgen items worden genegeerd.
+    De root wordt in één os.scandir-doorgang gelezen (bestandstype uit de listing)
+    en de controle stopt bij de eerste overtreding, zodat een verkeerde drive met
+    duizenden items niet eerst volledig uitgelezen wordt.
     """
-    # Windows systeemmappen die altijd aanwezig kunnen zijn op een SD-kaart
-    SYSTEM_DIRS = {
-        "system volume information",
-        "$recycle.bin",
-        "recycler",
-        "$recyclebin",
-        "found.000",
-    }
-
-    root = Path(drive_letter)
-    try:
-        all_items = list(root.iterdir())
-    except PermissionError:
-        return False, "Geen leesrechten op deze drive.", False
-    except Exception:
-        # Niet leesbaar = mogelijk corrupt
-        return False, f"Drive {drive_letter} is niet leesbaar — mogelijk corrupt bestandssysteem.", True
-
-    # Filter verborgen items en systeemmappen eruit
-    def is_system(item):
-        name_lower = item.name.lower()
-        if name_lower in SYSTEM_DIRS:
-            return True
-        # verborgen bestanden/mappen (beginnen met $ of zijn hidden via attrib)
-        if item.name.startswith("$") or item.name.startswith("."):
-            return True
-        return False
-
-    real_items = [i for i in all_items if not is_system(i)]
-
-    # Drive grootte check
+    # Drive grootte check (geen I/O nodig)
     if max_drive_gb and drive_size_gb is not None:
         if drive_size_gb > max_drive_gb:
             return False, f"SD-kaart is {drive_size_gb:.1f} GB, maximaal toegestaan is {max_drive_gb:.1f} GB — mogelijk verkeerde drive.", False
 
-    # Geen gebruikersmappen toegestaan (tenzij instelling aan staat)
-    subdirs = [i for i in real_items if i.is_dir()]
-    if subdirs and not allow_subdirs:
-        return False, f"SD-kaart bevat submappen ({len(subdirs)}x) — mogelijk verkeerde drive. (Of schakel 'mappen toestaan' in bij Instellingen)", False
+    files = 0
+    try:
+        with os.scandir(drive_letter) as it:
+            for entry in it:
+                if is_system_name(entry.name):
+                    continue
 
-    files = [i for i in real_items if i.is_file()]
+                # Geen gebruikersmappen toegestaan (tenzij instelling aan staat)
+                if entry.is_dir():
+                    if not allow_subdirs:
+                        return False, f"SD-kaart bevat submappen (bijv. {entry.name}) — mogelijk verkeerde drive. (Of schakel 'mappen toestaan' in bij Instellingen)", False
+                    continue
+                if not entry.is_file():
+                    continue
 
-    # Max aantal bestanden
-    if len(files) > max_files:
-        return False, f"Drive bevat {len(files)} bestanden (max {max_files}) — mogelijk verkeerde drive.", False
+                # Max aantal bestanden
+                files += 1
+                if files > max_files:
+                    return False, f"Drive bevat meer dan {max_files} bestanden — mogelijk verkeerde drive.", False
 
-    # Extensie check
-    if allowed_exts:
-        bad = [f for f in files if f.suffix.lower() not in allowed_exts]
-        if bad:
-            return False, f"Drive bevat niet-toegestane bestanden (bijv. {bad[0].name}) — mogelijk verkeerde drive.", False
+                # Extensie check
+                if allowed_exts and os.path.splitext(entry.name)[1].lower() not in allowed_exts:
+                    return False, f"Drive bevat niet-toegestane bestanden (bijv. {entry.name}) — mogelijk verkeerde drive.", False
+    except PermissionError:
+        return False, "Geen leesrechten op deze drive.", False
+    except Exception:
+        # Niet leesbaar = mogelijk corrupt
+        return False, f"Drive {drive_letter} is niet leesbaar — mogelijk corrupt bestandssysteem.", True
 
     return True, "OK", False
 
 
 def format_drive(drive_letter, log_cb, drive_size_gb=None):
-    """Probeert drive te formatteren via Windows format commando."""
+    """Formatteert de drive: FAT32 in-process (quick-format), anders of als dat niet
+    lukt via het Windows format commando."""
     # Kies bestandssysteem op basis van grootte: FAT32 voor ≤32 GB, exFAT voor groter
     fs = "FAT32" if (drive_size_gb is None or drive_size_gb <= 32) else "exFAT"
+    if fs == "FAT32" and quick_format_drive(drive_letter, log_cb):
+        return True
+    if os.name != "nt":
+        log_cb(f"❌  Formatteren van {drive_letter} niet mogelijk.", "error")
+        return False
     log_cb(f"⚠️  Formatteren van {drive_letter} als {fs} wordt gestart...", "warning")
     try:
         format_exe = os.path.join(os.environ.get("SystemRoot", r"C:\Windows"), "System32", "format.com")
@@ -203,548 +418,2775 @@ def format_drive(drive_letter, log_cb, drive_size_gb=None):
         return False
 
 
-def clear_drive(drive_letter, log_cb, drive_size_gb=None):
-    """Verwijdert alle bestanden van de drive, probeert formatteren bij fouten."""
+def quick_format_drive(drive_letter, log_cb, discard=False):
+    """
+    In-process quick-format naar FAT32: schrijft alleen bootsector, FAT's en een lege
+    rootmap rechtstreeks naar het volume (of imagebestand), zonder extern proces.
+    Met discard wordt eerst het hele volume als ongebruikt gemarkeerd (TRIM).
+    Geeft True bij succes; False als er geen raw toegang is of het mislukt.
+    """
+    import sd_image
+
+    t0 = time.perf_counter()
+    try:
+        with sd_image.open_raw_target(drive_letter, log_cb) as raw:
+            hidden = sd_image.read_hidden_sectors(raw)  # vóór discard, dat wist ook de bootsector
+            trimmed = sd_image.discard(raw) if discard else False
+            if discard and not trimmed:
+                log_cb("ℹ️   Discard/TRIM niet ondersteund door dit doel, alleen quick-format.", "info")
+            sd_image.quick_format(raw, label=IMAGE_LABEL, hidden_sectors=hidden)
+    except sd_image.RawAccessError as e:
+        log_cb(f"⚠️   Geen raw toegang tot {drive_letter}: {e}", "warning")
+        return False
+    except Exception as e:
+        log_cb(f"❌  Quick-format van {drive_letter} mislukt: {e}", "error")
+        return False
+    extra = " + discard" if trimmed else ""
+    log_cb(f"✅  {drive_letter} geformatteerd als FAT32 (quick-format{extra}) in {time.perf_counter() - t0:.2f} s.",
+           "success")
+    return True
+
+
+def _count_tree(root, max_entries=None, max_bytes=None):
+    """
+    Aantal items (bestanden + mappen) en totale bestandsgrootte onder `root`, plus
+    of de telling volledig is. Stopt zodra `max_entries` items overschreden of
+    `max_bytes` bereikt zijn: meer tellen verandert de wisstrategie niet meer.
+    """
+    entries = 0
+    used = 0
+    stack = [root]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    entries += 1
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        else:
+                            used += entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        pass
+                    if (max_entries is not None and entries > max_entries) or \
+                            (max_bytes is not None and used >= max_bytes):
+                        return entries, used, False
+        except OSError:
+            pass
+    return entries, used, True
+
+
+def plan_wipe(entries, used_bytes):
+    """
+    Kiest de snelste manier om een kaart leeg te maken:
+    - "delete": weinig items, losse deletes zijn het goedkoopst;
+    - "quickformat": veel items, één quick-format kost een vaste, korte tijd;
+    - "discard": veel data, eerst TRIM zodat de kaart daarna snel beschrijfbaar is.
+    """
+    if entries == 0:
+        return "none"
+    if used_bytes >= WIPE_DISCARD_MIN_BYTES:
+        return "discard"
+    if entries > WIPE_DELETE_MAX_ENTRIES:
+        return "quickformat"
+    return "delete"
+
+
+WIPE_LABELS = {"none": "al leeg", "delete": "bestanden verwijderen",
+               "quickformat": "quick-format", "discard": "discard + quick-format"}
+
+
+def _clear_readonly(func, path, _exc):
+    os.chmod(path, stat.S_IREAD | stat.S_IWRITE)
+    func(path)
+
+
+def force_remove(path):
+    """Verwijdert een bestand of map (recursief). Een alleen-lezen attribuut, zoals
+    FAT dat op kaarten kent, wordt eerst weggehaald. Gooit OSError als het niet lukt."""
+    path = Path(path)
+    if path.is_dir() and not path.is_symlink():
+        handler = {"onexc" if sys.version_info >= (3, 12) else "onerror": _clear_readonly}
+        shutil.rmtree(path, **handler)
+        return
+    try:
+        path.unlink()
+    except PermissionError:
+        os.chmod(path, stat.S_IREAD | stat.S_IWRITE)
+        path.unlink()
+
+
+def clear_drive(drive_letter, log_cb, drive_size_gb=None, strategy="auto"):
+    """Maakt de drive leeg. Met strategy="auto" kiest plan_wipe() tussen losse deletes,
+    een in-process quick-format en discard + quick-format. Lukt formatteren niet, dan
+    wordt per bestand verwijderd; lukt dat niet, dan via format_drive."""
     root = Path(drive_letter)
+    t0 = time.perf_counter()
+    entries, used, complete = _count_tree(root, WIPE_DELETE_MAX_ENTRIES, WIPE_DISCARD_MIN_BYTES)
+    if strategy == "auto":
+        strategy = plan_wipe(entries, used)
+    at_least = "" if complete else "minstens "
+    log_cb(f"🧹  Wisstrategie: {WIPE_LABELS.get(strategy, strategy)} "
+           f"({at_least}{entries} item(s), {format_bytes(used)}).", "info")
+    if strategy == "none":
+        return True
+
+    if strategy in ("quickformat", "discard"):
+        if (drive_size_gb is None or drive_size_gb <= 32) and \
+                quick_format_drive(drive_letter, log_cb, discard=strategy == "discard"):
+            return True
+        log_cb("↩️   Terugvallen op bestanden verwijderen.", "warning")
+
     errors = []
     for item in root.iterdir():
         try:
-            if item.is_file():
-                item.unlink()
-            elif item.is_dir():
-                shutil.rmtree(item)
+            force_remove(item)
         except Exception as e:
             errors.append(str(e))
 
     if errors:
         log_cb(f"⚠️  Kon {len(errors)} item(s) niet verwijderen. Formatteren proberen...", "warning")
         return format_drive(drive_letter, log_cb, drive_size_gb=drive_size_gb)
+    log_cb(f"🗑️   {entries} item(s) verwijderd in {time.perf_counter() - t0:.2f} s.", "info")
     return True
 
 
-def copy_version_to_drive(source_dir, version_name, drive_letter, log_cb):
-    """Kopieert bestanden én mappen van de gekozen versie naar de drive."""
+# errno's waarbij een kernel-kopieerroute niet beschikbaar is voor dit paar bestanden
+_FASTCOPY_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP,
+                         errno.ENOTSUP, errno.EBADF, errno.EPERM}
+
+
+def preallocate(fd, size):
+    """
+    Reserveert `size` bytes voor een net geopend doelbestand zonder de bestandsgrootte
+    te veranderen, zodat FAT de clusters in één keer (en zo aaneengesloten mogelijk)
+    toewijst in plaats van bij elke schrijfactie. Windows: FileAllocationInfo;
+    Linux: fallocate met FALLOC_FL_KEEP_SIZE (ook op vfat). Best effort: geeft False
+    als het OS of bestandssysteem het niet ondersteunt.
+    """
+    if size <= 0:
+        return False
+    try:
+        import ctypes
+        if os.name == "nt":
+            import msvcrt
+            FileAllocationInfo = 5
+            info = ctypes.c_longlong(size)
+            return bool(ctypes.windll.kernel32.SetFileInformationByHandle(
+                msvcrt.get_osfhandle(fd), FileAllocationInfo, ctypes.byref(info), ctypes.sizeof(info)))
+        if sys.platform.startswith("linux"):
+            FALLOC_FL_KEEP_SIZE = 1
+            libc = ctypes.CDLL(None, use_errno=True)
+            libc.fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong]
+            return libc.fallocate(fd, FALLOC_FL_KEEP_SIZE, 0, size) == 0
+    except Exception:
+        pass
+    return False
+
+
+def _flush_windows_volume(drive_letter):
+    """FlushFileBuffers op het volume van de kaart: schrijft de cache van het hele
+    volume inclusief FAT en mappen weg. Vereist administratorrechten."""
+    import ctypes
+    from ctypes import wintypes
+
+    k32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    k32.CreateFileW.restype = wintypes.HANDLE
+    k32.CreateFileW.argtypes = [wintypes.LPCWSTR, wintypes.DWORD, wintypes.DWORD, wintypes.LPVOID,
+                                wintypes.DWORD, wintypes.DWORD, wintypes.HANDLE]
+    GENERIC_RW = 0x80000000 | 0x40000000
+    FILE_SHARE_RW = 0x1 | 0x2
+    OPEN_EXISTING = 3
+    INVALID_HANDLE = wintypes.HANDLE(-1).value
+    letter = os.path.splitdrive(os.path.abspath(drive_letter))[0].rstrip(":")
+    handle = k32.CreateFileW(f"\\\\.\\{letter}:", GENERIC_RW, FILE_SHARE_RW, None, OPEN_EXISTING, 0, None)
+    if handle in (None, INVALID_HANDLE):
+        return False
+    try:
+        return bool(k32.FlushFileBuffers(handle))
+    finally:
+        k32.CloseHandle(handle)
+
+
+def flush_volume(drive_letter, written=()):
+    """
+    Zorgt dat alles wat naar de kaart geschreven is ook echt op de kaart staat:
+    Linux syncfs op het bestandssysteem van de kaart, Windows FlushFileBuffers op het
+    volume. Lukt dat niet (bijv. geen administratorrechten), dan wordt elk geschreven
+    bestand apart geflusht. Geeft de duur in seconden.
+    """
+    t0 = time.perf_counter()
+    if os.name == "nt":
+        try:
+            flushed = _flush_windows_volume(drive_letter)
+        except Exception:
+            flushed = False
+        if not flushed:
+            for path in written:
+                with open(path, "r+b") as f:
+                    os.fsync(f.fileno())
+    else:
+        fd = os.open(drive_letter, os.O_RDONLY)
+        try:
+            import ctypes
+            libc = ctypes.CDLL(None, use_errno=True)
+            if libc.syncfs(fd) != 0:
+                os.sync()
+        except (OSError, AttributeError):
+            os.sync()
+        finally:
+            os.close(fd)
+    return time.perf_counter() - t0
+
+
+def card_write_order(jobs):
+    """Volgorde voor het schrijven naar FAT: grote bestanden eerst, zodat die lange
+    aaneengesloten clusterreeksen krijgen voordat kleine bestanden de vrije ruimte
+    versnipperen; bij gelijke grootte op pad (voorspelbaar)."""
+    return sorted(jobs, key=lambda job: (-job[3], str(job[2])))
+
+
+def _copy_windows_kernel(src_path, dst_path, size):
+    """CopyFileExW: de kopie gebeurt volledig in de Windows kernel. Grote bestanden
+    gaan ongebufferd (COPY_FILE_NO_BUFFERING) zodat de file cache niet volloopt."""
+    import ctypes
+    from ctypes import wintypes
+
+    k32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    k32.CopyFileExW.argtypes = [wintypes.LPCWSTR, wintypes.LPCWSTR, ctypes.c_void_p, ctypes.c_void_p,
+                                ctypes.c_void_p, wintypes.DWORD]
+    COPY_FILE_NO_BUFFERING = 0x00001000
+    flags = COPY_FILE_NO_BUFFERING if size >= 16 * COPY_BUFFER else 0
+    if not k32.CopyFileExW(str(src_path), str(dst_path), None, None, None, flags):
+        raise ctypes.WinError(ctypes.get_last_error())
+
+
+def copy_file_fast(src_path, dst_path, buffer_size=COPY_BUFFER, progress=None, fsync=False):
+    """
+    Kopieert een bestand via de snelste route die het OS biedt en geeft de naam van
+    die route terug: CopyFileEx (Windows), copy_file_range of sendfile (Linux), of
+    als terugval een gebufferde kopie met een groot, pagina-uitgelijnd buffer.
+    Valt een route halverwege af, dan gaat de volgende verder vanaf dezelfde offset.
+    `progress(n)` wordt aangeroepen met het aantal geschreven bytes per stap.
+    Het doel wordt vooraf op de eindgrootte gereserveerd; met fsync=True wordt het
+    na het schrijven naar de kaart geflusht.
+    """
+    size = os.stat(src_path).st_size
+    step = 16 * buffer_size if progress else 1 << 30
+    if progress is None:
+        progress = lambda n: None  # noqa: E731
+    if os.name == "nt":
+        try:
+            _copy_windows_kernel(src_path, dst_path, size)
+            if fsync:
+                with open(dst_path, "r+b") as fo:
+                    os.fsync(fo.fileno())
+            progress(size)
+            return "CopyFileEx"
+        except Exception:
+            pass  # bijv. oud Windows of netwerkpad: gebufferd kopiëren
+
+    method = None
+    done = 0
+    with open(src_path, "rb") as fi, open(dst_path, "wb") as fo:
+        fin, fout = fi.fileno(), fo.fileno()
+        preallocate(fout, size)
+        if size and hasattr(os, "copy_file_range"):
+            try:
+                while done < size:
+                    n = os.copy_file_range(fin, fout, min(size - done, step), done, done)
+                    if n == 0:
+                        break
+                    done += n
+                    progress(n)
+                method = "copy_file_range"
+            except OSError as e:
+                if e.errno not in _FASTCOPY_UNSUPPORTED:
+                    raise
+        if method is None and done < size and sys.platform.startswith("linux") and hasattr(os, "sendfile"):
+            try:
+                os.lseek(fout, done, os.SEEK_SET)
+                while done < size:
+                    n = os.sendfile(fout, fin, done, min(size - done, step))
+                    if n == 0:
+                        break
+                    done += n
+                    progress(n)
+                method = "sendfile"
+            except OSError as e:
+                if e.errno not in _FASTCOPY_UNSUPPORTED:
+                    raise
+        if method is None:
+            fi.seek(done)
+            fo.seek(done)
+            buf = mmap.mmap(-1, buffer_size)  # anoniem mmap = pagina-uitgelijnd
+            view = memoryview(buf)
+            try:
+                while True:
+                    n = fi.readinto(view)
+                    if not n:
+                        break
+                    fo.write(view[:n])
+                    progress(n)
+            finally:
+                view.release()
+                buf.close()
+            method = "gebufferd"
+        if fsync:
+            fo.flush()
+            os.fsync(fout)
+    shutil.copystat(src_path, dst_path)
+    return method
+
+
+def _copy_and_hash(src_path, dst_path, buffer_size=COPY_BUFFER, progress=None):
+    """Kopieert een bestand en hasht het tijdens het streamen (bron wordt één keer
+    gelezen). Het doelbestand wordt geflusht naar de kaart. Geeft de hex-hash."""
+    h = hashlib.sha256()
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    with open(src_path, "rb") as fi, open(dst_path, "wb") as fo:
+        preallocate(fo.fileno(), os.fstat(fi.fileno()).st_size)
+        while True:
+            n = fi.readinto(view)
+            if not n:
+                break
+            h.update(view[:n])
+            fo.write(view[:n])
+            if progress:
+                progress(n)
+        fo.flush()
+        os.fsync(fo.fileno())
+    shutil.copystat(src_path, dst_path)
+    return h.hexdigest()
+
+
+def _hash_unbuffered_windows(path, chunk_size=COPY_CHUNK):
+    """Leest een bestand met FILE_FLAG_NO_BUFFERING, zodat de hash van de kaart
+    zelf komt en niet uit de Windows file cache."""
+    import ctypes
+    from ctypes import wintypes
+
+    k32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    k32.CreateFileW.restype = wintypes.HANDLE
+    k32.CreateFileW.argtypes = [wintypes.LPCWSTR, wintypes.DWORD, wintypes.DWORD, wintypes.LPVOID,
+                                wintypes.DWORD, wintypes.DWORD, wintypes.HANDLE]
+    k32.ReadFile.argtypes = [wintypes.HANDLE, ctypes.c_void_p, wintypes.DWORD,
+                             ctypes.POINTER(wintypes.DWORD), wintypes.LPVOID]
+    k32.VirtualAlloc.restype = ctypes.c_void_p
+    k32.VirtualAlloc.argtypes = [ctypes.c_void_p, ctypes.c_size_t, wintypes.DWORD, wintypes.DWORD]
+    k32.VirtualFree.argtypes = [ctypes.c_void_p, ctypes.c_size_t, wintypes.DWORD]
+    k32.CloseHandle.argtypes = [wintypes.HANDLE]
+
+    GENERIC_READ = 0x80000000
+    FILE_SHARE_READ_WRITE = 0x1 | 0x2
+    OPEN_EXISTING = 3
+    FILE_FLAG_NO_BUFFERING = 0x20000000
+    FILE_FLAG_SEQUENTIAL_SCAN = 0x08000000
+
+    handle = k32.CreateFileW(str(path), GENERIC_READ, FILE_SHARE_READ_WRITE, None, OPEN_EXISTING,
+                             FILE_FLAG_NO_BUFFERING | FILE_FLAG_SEQUENTIAL_SCAN, None)
+    if handle is None or handle == wintypes.HANDLE(-1).value:
+        raise ctypes.WinError(ctypes.get_last_error())
+    # VirtualAlloc geeft pagina-uitgelijnd geheugen, vereist voor NO_BUFFERING
+    buf = k32.VirtualAlloc(None, chunk_size, 0x3000, 0x04)  # MEM_COMMIT|MEM_RESERVE, PAGE_READWRITE
+    h = hashlib.sha256()
+    read = wintypes.DWORD()
+    try:
+        while True:
+            if not k32.ReadFile(handle, buf, chunk_size, ctypes.byref(read), None):
+                raise ctypes.WinError(ctypes.get_last_error())
+            if read.value == 0:
+                break
+            h.update(ctypes.string_at(buf, read.value))
+    finally:
+        k32.VirtualFree(buf, 0, 0x8000)  # MEM_RELEASE
+        k32.CloseHandle(handle)
+    return h.hexdigest()
+
+
+def hash_card_file(path, chunk_size=COPY_CHUNK):
+    """Hash van een bestand zoals het op de kaart staat (OS-cache omzeild waar mogelijk)."""
+    if os.name == "nt":
+        try:
+            return _hash_unbuffered_windows(path, chunk_size)
+        except Exception:
+            pass  # bijv. netwerkpad zonder sector-uitlijning: gewoon lezen
+    elif hasattr(os, "posix_fadvise"):
+        # schone pagina's uit de page cache gooien zodat we echt van de kaart lezen
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    return file_hash(path, chunk_size)
+
+
+class ProgressTracker:
+    """Telt geschreven bytes en meldt voortgang (bytes, huidig bestand, MB/s, ETA)
+    aan een callback, hooguit eens per PROGRESS_INTERVAL seconden."""
+
+    def __init__(self, total, callback=None, interval=PROGRESS_INTERVAL):
+        self.total = total
+        self.done = 0
+        self.current = ""
+        self.callback = callback
+        self.interval = interval
+        self.start = time.perf_counter()
+        self._last = self.start
+
+    def advance(self, n, current=None):
+        self.done += n
+        if current is not None:
+            self.current = current
+        if self.callback:
+            now = time.perf_counter()
+            if now - self._last >= self.interval:
+                self._last = now
+                self._emit(now)
+
+    def file_callback(self, relative):
+        """Callback voor copy_file_fast/_copy_and_hash die het huidige bestand meegeeft."""
+        return lambda n: self.advance(n, str(relative))
+
+    def finish(self):
+        if self.callback:
+            self._emit(time.perf_counter())
+
+    def _emit(self, now):
+        elapsed = max(now - self.start, 1e-6)
+        rate = self.done / elapsed
+        eta = (self.total - self.done) / rate if rate > 0 and self.total >= self.done else None
+        self.callback({"done": self.done, "total": self.total, "current": self.current,
+                       "mbps": rate / (1024 ** 2), "eta": eta})
+
+
+def _count_method(stats, method, size):
+    stats["methods"][method] = stats["methods"].get(method, 0) + 1
+    stats["bytes"] += size
+
+
+def _write_file(src_path, target, relative, verify, log_cb, stats, progress=None, fsync=False):
+    """Schrijft één bestand naar de kaart; met verify wordt het teruggelezen en
+    vergeleken, en bij een mismatch tot VERIFY_RETRIES keer opnieuw geschreven."""
+    progress = progress or ProgressTracker(0)
+    if not verify:
+        t0 = time.perf_counter()
+        method = copy_file_fast(src_path, target, progress=progress.file_callback(relative), fsync=fsync)
+        stats["write_time"] += time.perf_counter() - t0
+        _count_method(stats, method, os.path.getsize(target))
+        return
+
+    for attempt in range(1 + VERIFY_RETRIES):
+        done_before = progress.done
+        t0 = time.perf_counter()
+        expected = _copy_and_hash(src_path, target, progress=progress.file_callback(relative))
+        t1 = time.perf_counter()
+        actual = hash_card_file(target)
+        stats["write_time"] += t1 - t0
+        stats["verify_time"] += time.perf_counter() - t1
+        if actual == expected:
+            stats["verified"] += 1
+            _count_method(stats, "gebufferd+hash", os.path.getsize(target))
+            return
+        stats["retries"] += 1
+        progress.advance(done_before - progress.done)  # voortgang van deze poging terugdraaien
+        log_cb(f"⚠️  Verificatie mislukt voor {relative} (poging {attempt + 1}), opnieuw schrijven...", "warning")
+    raise IOError(f"verificatie van {relative} mislukt na {1 + VERIFY_RETRIES} pogingen — kaart mogelijk defect")
+
+
+def _write_stream(fileobj, target, relative, expected_hash, log_cb, stats, progress, size=0, fsync=False,
+                  hash_stream=False, verify=False):
+    """Schrijft een geopende stroom (bijv. een archieflid) naar de kaart. Met
+    `expected_hash` wordt teruggelezen en vergeleken; opnieuw schrijven kan alleen
+    als de stroom terug te spoelen is (zip), niet bij een doorlopende tar-stroom.
+    Met `hash_stream` wordt de stroom tijdens het schrijven gehasht en die hash
+    teruggegeven; `verify` vergelijkt de kaart dan met die hash."""
+    buf = bytearray(COPY_BUFFER)
+    view = memoryview(buf)
+    callback = progress.file_callback(relative)
+    for attempt in range(1 + VERIFY_RETRIES):
+        done_before = progress.done
+        written = 0
+        h = hashlib.sha256() if hash_stream else None
+        t0 = time.perf_counter()
+        with open(target, "wb") as fo:
+            preallocate(fo.fileno(), size)
+            while True:
+                n = fileobj.readinto(view)
+                if not n:
+                    break
+                fo.write(view[:n])
+                if h is not None:
+                    h.update(view[:n])
+                written += n
+                callback(n)
+            if expected_hash is not None or verify or fsync:
+                fo.flush()
+                os.fsync(fo.fileno())
+        t1 = time.perf_counter()
+        stats["write_time"] += t1 - t0
+        digest = h.hexdigest() if h is not None else None
+        expected = expected_hash if expected_hash is not None else (digest if verify else None)
+        if expected is None:
+            _count_method(stats, "archief", written)
+            return digest
+        actual = hash_card_file(target)
+        stats["verify_time"] += time.perf_counter() - t1
+        if actual == expected:
+            stats["verified"] += 1
+            _count_method(stats, "archief", written)
+            return digest
+        stats["retries"] += 1
+        progress.advance(done_before - progress.done)
+        if not fileobj.seekable():
+            break
+        log_cb(f"⚠️  Verificatie mislukt voor {relative} (poging {attempt + 1}), opnieuw schrijven...", "warning")
+        fileobj.seek(0)
+    raise IOError(f"verificatie van {relative} mislukt — kaart mogelijk defect")
+
+
+def _pipeline_reader(jobs, q, stop):
+    """Lezer-stage: leest de bronbestanden vooruit in blokken naar de begrensde queue."""
+    def put(item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        for src_path, _target, _relative, _size in jobs:
+            with open(src_path, "rb") as fi:
+                while True:
+                    block = fi.read(COPY_BUFFER)
+                    if not block:
+                        break
+                    if not put(("data", block)):
+                        return
+            if not put(("eof", None)):
+                return
+    except Exception as e:
+        put(("error", e))
+
+
+def _pipelined_write(jobs, verify, log_cb, stats, progress, fsync=False, on_file=None):
+    """Schrijver-stage: de lezer haalt de volgende bestanden/blokken al op (bijv.
+    van een netwerkshare) terwijl hier naar de kaart geschreven wordt."""
+    q = queue.Queue(maxsize=PIPELINE_DEPTH)
+    stop = threading.Event()
+    reader = threading.Thread(target=_pipeline_reader, args=(jobs, q, stop), daemon=True)
+    reader.start()
+    try:
+        for src_path, target, relative, size in jobs:
+            done_before = progress.done
+            h = hashlib.sha256() if verify else None
+            t0 = time.perf_counter()
+            with open(target, "wb") as fo:
+                preallocate(fo.fileno(), size)
+                while True:
+                    kind, payload = q.get()
+                    if kind == "error":
+                        raise payload
+                    if kind == "eof":
+                        break
+                    if h:
+                        h.update(payload)
+                    fo.write(payload)
+                    progress.advance(len(payload), str(relative))
+                if verify or fsync:
+                    fo.flush()
+                    os.fsync(fo.fileno())
+            shutil.copystat(src_path, target)
+            t1 = time.perf_counter()
+            stats["write_time"] += t1 - t0
+            if not verify:
+                _count_method(stats, "pipeline", size)
+                if on_file:
+                    on_file(relative, target, size)
+                continue
+            ok = hash_card_file(target) == h.hexdigest()
+            stats["verify_time"] += time.perf_counter() - t1
+            if ok:
+                stats["verified"] += 1
+                _count_method(stats, "pipeline+hash", size)
+                if on_file:
+                    on_file(relative, target, size)
+                continue
+            # mismatch: buiten de pipeline om opnieuw schrijven met de gewone retry-logica
+            stats["retries"] += 1
+            progress.advance(done_before - progress.done)
+            log_cb(f"⚠️  Verificatie mislukt voor {relative}, opnieuw schrijven...", "warning")
+            _write_file(src_path, target, relative, True, log_cb, stats, progress)
+            if on_file:
+                on_file(relative, target, size)
+    finally:
+        stop.set()
+        reader.join(timeout=5)
+
+
+def is_remote_path(path):
+    """True als het pad op een netwerkshare staat (UNC, netwerkschijf of NFS/CIFS mount)."""
+    path = os.path.abspath(path)
+    if os.name == "nt":
+        if path.startswith("\\\\"):
+            return True
+        try:
+            import ctypes
+            DRIVE_REMOTE = 4
+            return ctypes.windll.kernel32.GetDriveTypeW(os.path.splitdrive(path)[0] + "\\") == DRIVE_REMOTE
+        except Exception:
+            return False
+    best = None
+    try:
+        import psutil
+        for part in psutil.disk_partitions(all=True):
+            mp = part.mountpoint
+            if (path == mp or path.startswith(mp.rstrip("/") + "/")) and (best is None or len(mp) > len(best.mountpoint)):
+                best = part
+    except Exception:
+        return False
+    return best is not None and best.fstype in REMOTE_FSTYPES
+
+
+def _use_pipeline(source_root, verify, engine):
+    """Kiest de kopieerroute: 'kernel' (zero-copy per bestand) of 'pipeline'
+    (lezen en schrijven overlappen). Bij 'auto' wint de pipeline als er toch al
+    gehasht wordt of als de bron op een netwerkshare staat."""
+    if engine == "pipeline":
+        return True
+    if engine == "kernel":
+        return False
+    return verify or is_remote_path(source_root)
+
+
+def _write_files(jobs, verify, log_cb, stats, progress_cb=None, engine="auto", source_root=None, fsync=False,
+                 on_file=None):
+    """Schrijft een lijst (bron, doel, relatief pad, grootte) naar de kaart, in de
+    volgorde van card_write_order. Met fsync wordt elk bestand apart geflusht.
+    `on_file(relatief pad, doel, grootte)` volgt na elk volledig geschreven bestand."""
+    jobs = card_write_order(jobs)
+    progress = ProgressTracker(sum(job[3] for job in jobs), progress_cb)
+    if jobs and _use_pipeline(source_root or os.path.dirname(str(jobs[0][0])), verify, engine):
+        _pipelined_write(jobs, verify, log_cb, stats, progress, fsync, on_file)
+    else:
+        for src_path, target, relative, size in jobs:
+            _write_file(src_path, target, relative, verify, log_cb, stats, progress, fsync)
+            if on_file:
+                on_file(relative, target, size)
+    progress.finish()
+
+
+def _new_write_stats():
+    return {"write_time": 0.0, "verify_time": 0.0, "flush_time": 0.0, "verified": 0, "retries": 0,
+            "bytes": 0, "methods": {}}
+
+
+def _log_write_stats(stats, log_cb):
+    if stats["methods"]:
+        routes = ", ".join(f"{m} ({n}x)" for m, n in sorted(stats["methods"].items()))
+        mbps = stats["bytes"] / (1024 ** 2) / stats["write_time"] if stats["write_time"] > 0 else 0.0
+        log_cb(f"⚡  Kopieerroute: {routes} — {format_bytes(stats['bytes'])} in "
+               f"{stats['write_time']:.2f} s ({mbps:.1f} MB/s).", "info")
+    if stats["verified"] or stats["retries"]:
+        retry_info = f", {stats['retries']} herhaald" if stats["retries"] else ""
+        log_cb(f"🔍  Verificatie: {stats['verified']} bestand(en) OK in {stats['verify_time']:.2f} s "
+               f"(schrijven {stats['write_time']:.2f} s){retry_info}.", "success")
+    if stats["flush_time"]:
+        log_cb(f"💽  Cache naar de kaart geschreven in {stats['flush_time']:.2f} s.", "info")
+
+
+def copy_version_to_drive(source_dir, version_name, drive_letter, log_cb, verify=False,
+                          progress_cb=None, engine="auto", flush="end", journal=None):
+    """Kopieert bestanden én mappen van de gekozen versie naar de drive.
+    Met verify=True wordt elk bestand na het schrijven teruggelezen en gecontroleerd.
+    `progress_cb` krijgt periodiek een dict met done/total/current/mbps/eta.
+    Een versiepakket wordt rechtstreeks vanuit het archief naar de kaart gestreamd.
+    Eerst worden alle mappen aangemaakt, daarna de bestanden (grootste eerst, vooraf
+    gereserveerd). Met flush="file" wordt elk bestand apart geflusht; in beide gevallen
+    wordt het volume aan het eind geflusht, zodat de kaart daarna veilig uit kan.
+    Met een `journal` (sd_jobs.WriteJournal) worden bestanden die al duurzaam op de
+    kaart staan overgeslagen en wordt elk checkpoint na een flush vastgelegd.
+    Het manifest in het resultaat is None als er geen nodig was (losse map, geen journaal)."""
     src = Path(source_dir) / version_name
     dst = Path(drive_letter)
-    copied_files = 0
-    copied_dirs = 0
-
-    for item in src.rglob("*"):
-        relative = item.relative_to(src)
-        target = dst / relative
-        if item.is_dir():
-            target.mkdir(parents=True, exist_ok=True)
-            copied_dirs += 1
-        elif item.is_file():
-            target.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(item, target)
-            copied_files += 1
+    stats = _new_write_stats()
+    jobs = []
+    fsync = flush == "file"
+
+    archive = version_archive(source_dir, version_name)
+    manifest = None
+    if archive is not None:
+        manifest = cached_version_manifest(source_dir, version_name)
+        dirs = manifest["dirs"] if manifest is not None else []
+    else:
+        dirs = []
+        for rel, entry in _walk_files(src):
+            if entry is None:
+                dirs.append(rel)
+            else:
+                jobs.append((Path(entry.path), dst / rel, Path(rel), entry.stat().st_size))
+
+    # Alle mappen in één keer vooraf, zodat de directory-clusters vooraan liggen
+    for rel in sorted(dirs):
+        (dst / rel).mkdir(parents=True, exist_ok=True)
+    copied_dirs = len(dirs)
+
+    on_file = None
+    if journal is not None:
+        manifest = manifest or load_version_manifest(source_dir, version_name)
+        hashes = {rel: info["hash"] for rel, info in manifest["files"].items()}
+        wanted = {rel for rel in hashes if not _journaled(journal, rel, hashes[rel], dst / rel)}
+        resumed = len(hashes) - len(wanted)
+        if resumed:
+            log_cb(f"⏯️   Hervatten: {resumed} bestand(en) staan al op de kaart, nog {len(wanted)} te schrijven.",
+                   "info")
+        jobs = [job for job in jobs if job[2].as_posix() in wanted]
+
+        def record(relative, target, size):
+            journal.add(relative.as_posix(), hashes[relative.as_posix()], size, target)
+            if journal.due():
+                stats["flush_time"] += flush_volume(drive_letter, journal.pending_targets())
+                journal.checkpoint()
+        on_file = record
+
+    if archive is not None and manifest is None:
+        key = _archive_key(archive)
+        manifest = _write_archive(archive, dst, None, verify, log_cb, stats, progress_cb, fsync=fsync)
+        save_archive_manifest(source_dir, version_name, archive, key, manifest)
+        copied_dirs = len(manifest["dirs"])
+        written = [dst / rel for rel in manifest["files"]]
+    elif archive is not None:
+        only = wanted if journal is not None else None
+        _write_archive(archive, dst, manifest, verify, log_cb, stats, progress_cb, only=only, fsync=fsync,
+                       on_file=on_file)
+        written = [dst / rel for rel in (manifest["files"] if only is None else only)]
+    else:
+        _write_files(jobs, verify, log_cb, stats, progress_cb, engine, source_root=src, fsync=fsync,
+                     on_file=on_file)
+        written = [target for _src_path, target, _relative, _size in jobs]
+    copied_files = len(written)
+    stats["flush_time"] += flush_volume(drive_letter, written)
+    if journal is not None:
+        journal.checkpoint()
 
     now = datetime.now().strftime("%H:%M")
     dir_info = f", {copied_dirs} map(pen)" if copied_dirs else ""
     log_cb(f"✅  {copied_files} bestand(en){dir_info} vanuit [{version_name}] naar [{drive_letter}] geschreven om {now}.", "success")
+    _log_write_stats(stats, log_cb)
+    return dict(stats, files=copied_files, manifest=manifest)
 
 
-# ── Hoofd applicatie ───────────────────────────────────────────────────────────
-
-class App(ctk.CTk):
-    def __init__(self):
-        super().__init__()
-        self.title("SD Kaart Overschrijven")
-        self.geometry("780x620")
-        self.resizable(False, False)
-
-        self.config = load_config()
-        self.config["auto_start"] = False  # altijd uit bij opstarten
-        self.versions_data = {}
-        self.versions_json_path = None
-        self.drive_poll_job = None
-        self.known_drives = set()
-        self._busy = False
-
-        self._build_ui()
-        self._load_source_if_set()
-        self._poll_drives()
-        self._center_window(self, 780, 620)
-
-    def _center_window(self, win, width, height):
-        """Centreert een venster op het scherm."""
-        win.update_idletasks()
-        sw = win.winfo_screenwidth()
-        sh = win.winfo_screenheight()
-        x = (sw - width) // 2
-        y = (sh - height) // 2
-        win.geometry(f"{width}x{height}+{x}+{y}")
-
-    # ── UI opbouw ──────────────────────────────────────────────────────────────
-
-    def _build_ui(self):
-        self.grid_columnconfigure(0, weight=1)
-
-        # ── Titel ──
-        ctk.CTkLabel(self, text="SD Kaart Overschrijven", font=ctk.CTkFont(size=22, weight="bold")).grid(
-            row=0, column=0, pady=(12, 2), sticky="ew")
-
-        # ── Bronmap sectie ──
-        src_frame = ctk.CTkFrame(self)
-        src_frame.grid(row=1, column=0, padx=20, pady=3, sticky="ew")
-        src_frame.grid_columnconfigure(1, weight=1)
-
-        ctk.CTkLabel(src_frame, text="Bronmap:", width=100, anchor="w").grid(row=0, column=0, padx=12, pady=10)
-        self.src_label = ctk.CTkLabel(src_frame, text=self.config["source_dir"] or "— nog niet gekozen —",
-                                      anchor="w", wraplength=480)
-        self.src_label.grid(row=0, column=1, padx=8, pady=10, sticky="ew")
-        ctk.CTkButton(src_frame, text="Kiezen", width=90, command=self._choose_source).grid(
-            row=0, column=2, padx=12, pady=10)
-
-        # ── Versie dropdown ──
-        ver_frame = ctk.CTkFrame(self)
-        ver_frame.grid(row=2, column=0, padx=20, pady=3, sticky="ew")
-        ver_frame.grid_columnconfigure(1, weight=1)
-
-        ctk.CTkLabel(ver_frame, text="Schrijf versie:", width=100, anchor="w").grid(row=0, column=0, padx=12, pady=10)
-        self.version_var = ctk.StringVar(value="— kies versie om naar SD-kaart te schrijven —")
-        self.version_menu = ctk.CTkOptionMenu(ver_frame, variable=self.version_var,
-                                               values=["— kies versie om naar SD-kaart te schrijven —"],
-                                               command=self._on_version_change)
-        self.version_menu.grid(row=0, column=1, padx=8, pady=10, sticky="ew")
-        ctk.CTkButton(ver_frame, text="Info bewerken", width=110, command=self._edit_version_info).grid(
-            row=0, column=2, padx=12, pady=10)
-
-        # ── Versie info ──
-        self.ver_info_label = ctk.CTkLabel(self, text="", anchor="w", wraplength=720,
-                                            text_color="gray70", font=ctk.CTkFont(size=12))
-        self.ver_info_label.grid(row=3, column=0, padx=24, pady=(0, 4), sticky="ew")
-
-        # ── Drive sectie ──
-        drv_frame = ctk.CTkFrame(self)
-        drv_frame.grid(row=4, column=0, padx=20, pady=3, sticky="ew")
-        drv_frame.grid_columnconfigure(1, weight=1)
-
-        ctk.CTkLabel(drv_frame, text="Doeldrive\n(SD-kaart):", width=100, anchor="w").grid(row=0, column=0, padx=12, pady=10)
-        self.drive_var = ctk.StringVar(value="— geen verwisselbare SD-kaart gevonden —")
-        self.drive_menu = ctk.CTkOptionMenu(drv_frame, variable=self.drive_var, values=["— geen verwisselbare SD-kaart gevonden —"])
-        self.drive_menu.grid(row=0, column=1, padx=8, pady=10, sticky="ew")
-        ctk.CTkButton(drv_frame, text="↻", width=40, command=self._refresh_drives).grid(
-            row=0, column=2, padx=4, pady=10)
-
-        # ── Rij 1: Start overschrijven + auto-start switch ──
-        row1_frame = ctk.CTkFrame(self)
-        row1_frame.grid(row=5, column=0, padx=20, pady=(6, 3), sticky="ew")
-        row1_frame.grid_columnconfigure(0, weight=1)
-
-        self.start_btn = ctk.CTkButton(row1_frame, text="▶  Start overschrijven", height=42,
-                                        font=ctk.CTkFont(size=15, weight="bold"),
-                                        command=self._start_process)
-        self.start_btn.grid(row=0, column=0, padx=(12, 8), pady=10, sticky="ew")
-
-        self.auto_var = ctk.BooleanVar(value=self.config["auto_start"])
-        ctk.CTkSwitch(row1_frame, text="Automatisch starten\nbij drive detectie",
-                      variable=self.auto_var, command=self._save_config).grid(
-            row=0, column=1, padx=(4, 16), pady=10, sticky="e")
-
-        # ── Rij 2: Formateer knop + corrupt-switch ──
-        row2_frame = ctk.CTkFrame(self)
-        row2_frame.grid(row=6, column=0, padx=20, pady=(3, 6), sticky="ew")
-        row2_frame.grid_columnconfigure(0, weight=1)
-
-        self.format_btn = ctk.CTkButton(row2_frame, text="🗂  Formatteer geselecteerde drive", height=38,
-                                         fg_color="gray30", hover_color="#b45309",
-                                         font=ctk.CTkFont(size=13),
-                                         command=self._format_selected_drive)
-        self.format_btn.grid(row=0, column=0, padx=(12, 8), pady=10, sticky="ew")
-
-        self.auto_format_var = ctk.BooleanVar(value=self.config.get("auto_format_corrupt", False))
-        self.auto_format_switch = ctk.CTkSwitch(row2_frame, text="Automatisch formatteren\nbij corrupte SD-kaart",
-                                                  variable=self.auto_format_var,
-                                                  command=self._on_auto_format_toggle)
-        self.auto_format_switch.grid(row=0, column=1, padx=(4, 16), pady=10, sticky="e")
-        self._update_auto_format_switch_state()
-
-        # ── Log venster ──
-        log_frame = ctk.CTkFrame(self)
-        log_frame.grid(row=7, column=0, padx=20, pady=(4, 6), sticky="ew")
-        log_frame.grid_columnconfigure(0, weight=1)
-
-        ctk.CTkLabel(log_frame, text="Meldingen", anchor="w",
-                     font=ctk.CTkFont(weight="bold")).grid(row=0, column=0, padx=12, pady=(8, 2), sticky="w")
-        self.log_box = ctk.CTkTextbox(log_frame, height=130, state="disabled",
-                                       font=ctk.CTkFont(family="Consolas", size=12))
-        self.log_box.grid(row=1, column=0, padx=12, pady=(0, 12), sticky="ew")
-
-        # kleurtags instellen via onderliggende tk widget
-        self.log_box._textbox.tag_config("success", foreground="#4ade80")
-        self.log_box._textbox.tag_config("warning", foreground="#facc15")
-        self.log_box._textbox.tag_config("error", foreground="#f87171")
-        self.log_box._textbox.tag_config("info", foreground="#93c5fd")
-
-        # ── Instellingen knop ──
-        ctk.CTkButton(self, text="⚙  Instellingen", fg_color="gray30", hover_color="gray40",
-                      command=self._open_settings).grid(row=8, column=0, padx=20, pady=(0, 28), sticky="e")
-
-    # ── Logging ───────────────────────────────────────────────────────────────
-
-    def log(self, message, kind="info"):
-        ts = datetime.now().strftime("%H:%M:%S")
-        line = f"[{ts}]  {message}\n"
-        self.log_box.configure(state="normal")
-        self.log_box._textbox.insert("end", line, kind)
-        self.log_box._textbox.see("end")
-        self.log_box.configure(state="disabled")
-
-    # ── Drive polling ──────────────────────────────────────────────────────────
-
-    def _poll_drives(self):
-        current_drives = get_removable_drives()
-        current = set(d[0] for d in current_drives)
-        new_drives = current - self.known_drives
-        removed_drives = self.known_drives - current
-
-        if new_drives:
-            for d in new_drives:
-                self.log(f"🔌  Nieuwe drive gevonden: {d}", "info")
-            self._refresh_drives(current_drives)
-            if self.auto_var.get() and not self._busy:
-                self._start_process()
-
-        if removed_drives:
-            for d in removed_drives:
-                self.log(f"📤  Drive verwijderd: {d}", "warning")
-            self._refresh_drives(current_drives)
-
-        # Alleen updaten als er iets veranderd is
-        if new_drives or removed_drives:
-            self._update_auto_format_switch_state()
-
-        self.known_drives = current
-        self.drive_poll_job = self.after(2000, self._poll_drives)
-
-    def _refresh_drives(self, drives=None):
-        if drives is None:
-            drives = get_removable_drives()
-        current_selection = self.drive_var.get()
-        if drives:
-            labels = [d[1] for d in drives]
-            letters = [d[0] for d in drives]
-            sizes = [d[2] for d in drives]
-            self.drive_menu.configure(values=labels)
-            self._drive_map = dict(zip(labels, letters))
-            self._drive_size_map = dict(zip(labels, sizes))
-            # Bewaar huidige selectie als die nog bestaat, anders eerste
-            if current_selection in labels:
-                self.drive_var.set(current_selection)
+def _journaled(journal, rel, digest, target):
+    """True als het journaal dit bestand met dezelfde inhoud als duurzaam geschreven
+    kent en het nog met die grootte op de kaart staat."""
+    entry = journal.done.get(rel)
+    if not entry or entry["hash"] != digest:
+        return False
+    try:
+        return os.path.getsize(target) == entry["size"]
+    except OSError:
+        return False
+
+
+def _journal_trusted(journal, drive_letter, log_cb, samples=JOURNAL_SPOT_CHECKS):
+    """Steekproef vóór het hervatten: een paar willekeurige bestanden uit het journaal
+    worden van de kaart teruggelezen en gehasht. Kloonkaarten kunnen hetzelfde
+    volumeserienummer hebben, dus grootte en kaartherkenning alleen zijn niet genoeg."""
+    import random
+    root = Path(drive_letter)
+    for rel in random.sample(sorted(journal.done), min(samples, len(journal.done))):
+        try:
+            ok = hash_card_file(root / rel) == journal.done[rel]["hash"]
+        except OSError:
+            ok = False
+        if not ok:
+            log_cb(f"⚠️   {rel} op de kaart wijkt af van het journaal — niet hervatten.", "warning")
+            return False
+    return True
+
+
+def format_bytes(n):
+    """Leesbare grootte, bijv. 3.1 MB."""
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """SHA-256 van de inhoud van een bestand."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _walk_files(root, relative=""):
+    """Recursieve os.scandir-walk. Geeft (relatief posix-pad, DirEntry) voor
+    bestanden en (relatief posix-pad, None) voor mappen. DirEntry.stat() wordt op
+    Windows uit de directory-listing gehaald, zonder extra round-trip naar de share."""
+    with os.scandir(root) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    for entry in entries:
+        rel = f"{relative}/{entry.name}" if relative else entry.name
+        if entry.is_dir(follow_symlinks=False):
+            yield rel, None
+            yield from _walk_files(entry.path, rel)
+        elif entry.is_file():
+            yield rel, entry
+
+
+def manifest_digest(files):
+    """Eén hash over alle (pad, grootte, hash) regels van een manifest."""
+    h = hashlib.sha256()
+    for rel in sorted(files):
+        info = files[rel]
+        h.update(f"{rel}\0{info['size']}\0{info['hash']}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+# ── Versiepakketten ────────────────────────────────────────────────────────────
+
+def archive_version_name(filename):
+    """Versienaam van een versiepakket (bestandsnaam zonder archief-extensie), anders None."""
+    lower = filename.lower()
+    for suffix in ARCHIVE_SUFFIXES:
+        if lower.endswith(suffix) and len(filename) > len(suffix):
+            return filename[:-len(suffix)]
+    return None
+
+
+def version_archive(source_dir, version_name):
+    """Pad van het versiepakket van deze versie, of None als de versie een gewone map is."""
+    if (Path(source_dir) / version_name).is_dir():
+        return None
+    for suffix in ARCHIVE_SUFFIXES:
+        path = Path(source_dir) / f"{version_name}{suffix}"
+        if path.is_file():
+            return path
+    return None
+
+
+def _archive_rel(name):
+    """Genormaliseerd relatief pad van een archieflid; None voor lege of onveilige paden."""
+    parts = [p for p in name.replace("\\", "/").split("/") if p not in ("", ".")]
+    if not parts or ".." in parts:
+        return None
+    return "/".join(parts)
+
+
+def _open_tar_stream(path, raw):
+    lower = path.name.lower()
+    if lower.endswith((".tar.zst", ".tzst")):
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("voor .tar.zst-pakketten is het pakket 'zstandard' nodig (pip install zstandard)")
+        return tarfile.open(fileobj=zstandard.ZstdDecompressor().stream_reader(raw), mode="r|")
+    return tarfile.open(fileobj=raw, mode="r|xz")
+
+
+def iter_archive(path, wanted=None):
+    """
+    Loopt in één doorgang door een versiepakket zonder iets uit te pakken naar schijf.
+    Geeft (relatief pad, grootte, mtime in ns, bestandsobject) voor bestanden en
+    (relatief pad, None, None, None) voor mappen. Het bestandsobject is alleen geldig
+    tot het volgende item. Met `wanted` (set relatieve paden) worden andere bestanden
+    overgeslagen; bij zip worden die dan ook niet van de share gelezen.
+    """
+    if path.name.lower().endswith(".zip"):
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                rel = _archive_rel(info.filename)
+                if rel is None:
+                    continue
+                if info.is_dir():
+                    yield rel, None, None, None
+                elif wanted is None or rel in wanted:
+                    mtime_ns = int(datetime(*info.date_time).timestamp() * 1e9)
+                    with zf.open(info) as f:
+                        yield rel, info.file_size, mtime_ns, f
+        return
+
+    with open(path, "rb", buffering=COPY_BUFFER) as raw, _open_tar_stream(path, raw) as tf:
+        for member in tf:
+            rel = _archive_rel(member.name)
+            if rel is None:
+                continue
+            if member.isdir():
+                yield rel, None, None, None
+            elif member.isfile() and (wanted is None or rel in wanted):
+                with tf.extractfile(member) as f:
+                    yield rel, member.size, int(member.mtime * 1e9), f
+
+
+def _write_archive(archive, dst, manifest, verify, log_cb, stats, progress_cb=None, only=None, targets=None,
+                   fsync=False, on_file=None):
+    """Streamt bestanden uit een versiepakket rechtstreeks naar de kaart. `only` beperkt
+    tot een set relatieve paden; `targets` geeft per relatief pad een afwijkend doelpad.
+    De volgorde is die van het archief (een tar-stroom kan niet anders gelezen worden).
+    Zonder `manifest` (eerste gebruik van het pakket) wordt alles geschreven, elk
+    bestand tijdens het schrijven gehasht en het manifest teruggegeven: zo gaat het
+    pakket maar één keer over de share."""
+    if manifest is None:
+        return _write_archive_hashing(archive, dst, verify, log_cb, stats, progress_cb, fsync, on_file)
+    files = manifest["files"]
+    wanted = set(files) if only is None else set(only)
+    progress = ProgressTracker(sum(files[rel]["size"] for rel in wanted), progress_cb)
+    for rel, _size, mtime_ns, fileobj in iter_archive(archive, wanted):
+        if fileobj is None or rel not in files:
+            continue
+        target = (targets or {}).get(rel) or dst / rel
+        target.parent.mkdir(parents=True, exist_ok=True)
+        _write_stream(fileobj, target, rel, files[rel]["hash"] if verify else None, log_cb, stats, progress,
+                      size=files[rel]["size"], fsync=fsync)
+        os.utime(target, ns=(mtime_ns, mtime_ns))
+        if on_file:
+            on_file(Path(rel), target, files[rel]["size"])
+    progress.finish()
+
+
+def _write_archive_hashing(archive, dst, verify, log_cb, stats, progress_cb, fsync, on_file):
+    files = {}
+    dirs = set()
+    progress = ProgressTracker(_archive_size_hint(archive), progress_cb)
+    for rel, size, mtime_ns, fileobj in iter_archive(archive):
+        if fileobj is None:
+            dirs.add(rel)
+            (dst / rel).mkdir(parents=True, exist_ok=True)
+            continue
+        target = dst / rel
+        target.parent.mkdir(parents=True, exist_ok=True)
+        digest = _write_stream(fileobj, target, rel, None, log_cb, stats, progress, size=size, fsync=fsync,
+                               hash_stream=True, verify=verify)
+        os.utime(target, ns=(mtime_ns, mtime_ns))
+        files[rel] = {"size": size, "mtime": mtime_ns, "hash": digest}
+        _add_parents(dirs, rel)
+        if on_file:
+            on_file(Path(rel), target, size)
+    progress.finish()
+    return {"files": files, "dirs": sorted(dirs), "digest": manifest_digest(files)}
+
+
+def _archive_size_hint(archive):
+    """Uitgepakte grootte voor de voortgang: bij zip uit de centrale directory, bij een
+    tar-stroom onbekend (0)."""
+    if not archive.name.lower().endswith(".zip"):
+        return 0
+    with zipfile.ZipFile(archive) as zf:
+        return sum(info.file_size for info in zf.infolist() if not info.is_dir())
+
+
+def _add_parents(dirs, rel):
+    parent = rel.rpartition("/")[0]
+    while parent:
+        dirs.add(parent)
+        parent = parent.rpartition("/")[0]
+
+
+def _archive_manifest(archive):
+    """Manifest van een versiepakket: één doorgang door het archief, hashen tijdens het lezen."""
+    files = {}
+    dirs = set()
+    for rel, size, mtime_ns, fileobj in iter_archive(archive):
+        if fileobj is None:
+            dirs.add(rel)
+            continue
+        h = hashlib.sha256()
+        for block in iter(lambda: fileobj.read(COPY_CHUNK), b""):
+            h.update(block)
+        files[rel] = {"size": size, "mtime": mtime_ns, "hash": h.hexdigest()}
+        _add_parents(dirs, rel)
+    return {"files": files, "dirs": sorted(dirs), "digest": manifest_digest(files)}
+
+
+_manifest_guard = threading.Lock()
+_manifest_locks = {}    # (bronmap, versie) -> Lock; andere versies laden niet op elkaar te wachten
+
+
+def _manifest_lock(source_dir, version_name):
+    with _manifest_guard:
+        return _manifest_locks.setdefault((os.path.abspath(source_dir), version_name), threading.Lock())
+
+
+def _save_manifest(cache_path, manifest):
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass  # alleen-lezen share: manifest blijft alleen in geheugen
+
+
+def _manifest_cache_path(source_dir, version_name):
+    return Path(source_dir) / CACHE_DIRNAME / "manifests" / f"{version_name}.json"
+
+
+def _read_manifest_cache(cache_path):
+    if not cache_path.exists():
+        return {}
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def _archive_key(archive):
+    st = archive.stat()
+    return {"name": archive.name, "size": st.st_size, "mtime": st.st_mtime_ns}
+
+
+def cached_version_manifest(source_dir, version_name):
+    """
+    Zoals load_version_manifest, maar zonder een versiepakket te lezen: None als het
+    manifest van het pakket nog niet (of niet meer actueel) bewaard is. Het manifest
+    ontstaat dan tijdens het eerste schrijven (zie save_archive_manifest).
+    """
+    archive = version_archive(source_dir, version_name)
+    if archive is None:
+        return load_version_manifest(source_dir, version_name)
+    with _manifest_lock(source_dir, version_name):
+        cached_doc = _read_manifest_cache(_manifest_cache_path(source_dir, version_name))
+        if cached_doc.get("archive") == _archive_key(archive):
+            return {k: cached_doc[k] for k in ("files", "dirs", "digest")}
+    return None
+
+
+def save_archive_manifest(source_dir, version_name, archive, key, manifest):
+    """Bewaart een tijdens het schrijven bepaald manifest, als het pakket sinds `key`
+    (vóór het lezen bepaald) niet veranderd is."""
+    with _manifest_lock(source_dir, version_name):
+        if _archive_key(archive) == key:
+            _save_manifest(_manifest_cache_path(source_dir, version_name), dict(manifest, archive=key))
+
+
+def load_version_manifest(source_dir, version_name, workers=MANIFEST_WORKERS):
+    """
+    Geeft het inhoudsmanifest van een versie terug:
+    {"files": {rel: {"size", "mtime", "hash"}}, "dirs": [rel, ...], "digest": str}.
+    Het manifest wordt bewaard in <bronmap>/.sdkaart/manifests/<versie>.json en een
+    bestand wordt alleen opnieuw gehasht als grootte of mtime veranderd is.
+    Hashen gebeurt parallel in een thread pool. Van een versiepakket wordt het
+    manifest alleen opnieuw bepaald als het archief zelf veranderd is.
+    """
+    src = Path(source_dir) / version_name
+    cache_path = _manifest_cache_path(source_dir, version_name)
+    archive = version_archive(source_dir, version_name)
+
+    with _manifest_lock(source_dir, version_name):
+        cached_doc = _read_manifest_cache(cache_path)
+
+        if archive is not None:
+            key = _archive_key(archive)
+            if cached_doc.get("archive") == key:
+                return {k: cached_doc[k] for k in ("files", "dirs", "digest")}
+            manifest = _archive_manifest(archive)
+            _save_manifest(cache_path, dict(manifest, archive=key))
+            return manifest
+
+        cached = cached_doc.get("files", {}) if "archive" not in cached_doc else {}
+        files = {}
+        dirs = []
+        to_hash = []
+        for rel, entry in _walk_files(src):
+            if entry is None:
+                dirs.append(rel)
+                continue
+            st = entry.stat()
+            info = {"size": st.st_size, "mtime": st.st_mtime_ns, "hash": None}
+            old = cached.get(rel)
+            if old and old.get("size") == info["size"] and old.get("mtime") == info["mtime"] and old.get("hash"):
+                info["hash"] = old["hash"]
             else:
-                self.drive_var.set(labels[0])
-        else:
-            self.drive_menu.configure(values=["— geen verwisselbare SD-kaart gevonden —"])
-            self.drive_var.set("— geen verwisselbare SD-kaart gevonden —")
-            self._drive_map = {}
-            self._drive_size_map = {}
-
-    def _get_selected_drive(self):
-        return getattr(self, "_drive_map", {}).get(self.drive_var.get(), None)
-
-    def _get_selected_drive_size(self):
-        return getattr(self, "_drive_size_map", {}).get(self.drive_var.get(), None)
-
-    # ── Bronmap ───────────────────────────────────────────────────────────────
-
-    def _choose_source(self):
-        folder = filedialog.askdirectory(title="Kies de hoofdmap met versies")
-        if folder:
-            self.config["source_dir"] = folder
-            save_config(self.config)
-            self.src_label.configure(text=folder)
-            self._load_source_if_set()
-
-    def _load_source_if_set(self):
-        src = self.config.get("source_dir", "")
-        if src and os.path.isdir(src):
-            self.versions_data, self.versions_json_path = load_versions_json(src)
-            versions = [k for k in self.versions_data.keys()]
-            if versions:
-                self.version_menu.configure(values=versions)
-                # herstel laatste versie, of val terug op eerste
-                last = self.config.get("last_version", "")
-                selected = last if last in versions else versions[0]
-                self.version_var.set(selected)
-                self._on_version_change(selected)
+                to_hash.append(rel)
+            files[rel] = info
+
+        if to_hash:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for rel, digest in zip(to_hash, pool.map(file_hash, (src / rel for rel in to_hash))):
+                    files[rel]["hash"] = digest
+
+        manifest = {"files": files, "dirs": dirs, "digest": manifest_digest(files)}
+        if to_hash or set(cached) != set(files) or "archive" in cached_doc:
+            _save_manifest(cache_path, manifest)
+        return manifest
+
+
+def _scan_tree(root, skip_system=False):
+    """Geeft ({sleutel: (relatief pad, Path)}, {sleutel van mappen}) voor een map.
+    Sleutels zijn lowercase omdat FAT/exFAT niet hoofdlettergevoelig is."""
+    files = {}
+    dirs = {}
+    for item in Path(root).rglob("*"):
+        relative = item.relative_to(root)
+        if skip_system and is_system_name(relative.parts[0]):
+            continue
+        key = relative.as_posix().lower()
+        if item.is_dir():
+            dirs[key] = relative
+        elif item.is_file():
+            files[key] = (relative, item)
+    return files, dirs
+
+
+def sync_version_to_drive(source_dir, version_name, drive_letter, log_cb, verify=False,
+                          progress_cb=None, engine="auto", flush="end"):
+    """
+    Synchroniseert de drive met de gekozen versie in plaats van wissen + kopiëren.
+    Vergelijkt op relatief pad, grootte en inhoud-hash; schrijft alleen nieuwe of
+    gewijzigde bestanden en verwijdert alleen bestanden die niet in de versie zitten.
+    Van een versiepakket zonder bewaard manifest (eerste gebruik) is er niets om mee
+    te vergelijken: dan wordt alles in één doorgang geschreven en tijdens het schrijven
+    gehasht, net als bij copy_version_to_drive. Geeft een dict met statistieken terug,
+    inclusief het manifest van de geschreven versie.
+    """
+    write_stats = _new_write_stats()
+    src = Path(source_dir) / version_name
+    dst = Path(drive_letter)
+    archive = version_archive(source_dir, version_name)
+    manifest = cached_version_manifest(source_dir, version_name)
+    dst_files, dst_dirs = _scan_tree(dst, skip_system=True)
+    stats = {"written": 0, "written_bytes": 0, "skipped": 0, "skipped_bytes": 0, "deleted": 0,
+             "delete_errors": 0}
+    fsync = flush == "file"
+
+    if manifest is None:
+        key = _archive_key(archive)
+        manifest = _write_archive(archive, dst, None, verify, log_cb, write_stats, progress_cb, fsync=fsync)
+        save_archive_manifest(source_dir, version_name, archive, key, manifest)
+        _sync_remove_extra(dst, dst_files, dst_dirs, manifest, stats, log_cb)
+        written = [dst / rel for rel in manifest["files"]]
+        stats["written"] = len(written)
+        stats["written_bytes"] = sum(info["size"] for info in manifest["files"].values())
+    else:
+        # Eerst overbodige bestanden weg, zodat er ruimte vrijkomt voor het schrijven
+        _sync_remove_extra(dst, dst_files, dst_dirs, manifest, stats, log_cb)
+        for rel in sorted(manifest["dirs"]):
+            (dst / rel).mkdir(parents=True, exist_ok=True)
+
+        jobs = []
+        for rel, info in sorted(manifest["files"].items()):
+            size = info["size"]
+            existing = dst_files.get(rel.lower())
+            if existing is not None:
+                target = existing[1]
+                if target.stat().st_size == size and file_hash(target) == info["hash"]:
+                    stats["skipped"] += 1
+                    stats["skipped_bytes"] += size
+                    continue
             else:
-                self.version_menu.configure(values=["— geen submappen gevonden —"])
-                self.version_var.set("— geen submappen gevonden —")
-
-    def _on_version_change(self, choice):
-        # Onthoud de gekozen versie
-        if choice in self.versions_data:
-            self.config["last_version"] = choice
-            save_config(self.config)
-        info = self.versions_data.get(choice, {})
-        omschr = info.get("omschrijving", "")
-        functie = info.get("functie", "")
-        parts = []
-        if omschr:
-            parts.append(omschr)
-        if functie:
-            parts.append(f"Functie: {functie}")
-        self.ver_info_label.configure(text="  ".join(parts) if parts else "Geen beschrijving.")
-
-    # ── Versie info bewerken ───────────────────────────────────────────────────
-
-    def _edit_version_info(self):
-        version = self.version_var.get()
-        if version not in self.versions_data:
-            return
+                target = dst / rel
+                target.parent.mkdir(parents=True, exist_ok=True)
+            jobs.append((src / rel, target, Path(rel), size))
+            stats["written"] += 1
+            stats["written_bytes"] += size
+        if archive is not None:
+            _write_archive(archive, dst, manifest, verify, log_cb, write_stats, progress_cb,
+                           only={relative.as_posix() for _src, _target, relative, _size in jobs},
+                           targets={relative.as_posix(): target for _src, target, relative, _size in jobs},
+                           fsync=fsync)
+        else:
+            _write_files(jobs, verify, log_cb, write_stats, progress_cb, engine, source_root=src, fsync=fsync)
+        written = [target for _src, target, _rel, _size in jobs]
+    write_stats["flush_time"] = flush_volume(drive_letter, written)
 
-        win = ctk.CTkToplevel(self)
-        win.title(f"Info bewerken — {version}")
-        win.geometry("440x240")
-        win.grab_set()
-        self._center_window(win, 440, 240)
-
-        ctk.CTkLabel(win, text="Omschrijving:").grid(row=0, column=0, padx=16, pady=(16, 4), sticky="w")
-        omschr_entry = ctk.CTkEntry(win, width=350)
-        omschr_entry.insert(0, self.versions_data[version].get("omschrijving", ""))
-        omschr_entry.grid(row=1, column=0, padx=16, pady=4, sticky="ew")
-
-        ctk.CTkLabel(win, text="Functie:").grid(row=2, column=0, padx=16, pady=(12, 4), sticky="w")
-        functie_entry = ctk.CTkEntry(win, width=350)
-        functie_entry.insert(0, self.versions_data[version].get("functie", ""))
-        functie_entry.grid(row=3, column=0, padx=16, pady=4, sticky="ew")
-
-        def save():
-            self.versions_data[version]["omschrijving"] = omschr_entry.get()
-            self.versions_data[version]["functie"] = functie_entry.get()
-            with open(self.versions_json_path, "w", encoding="utf-8") as f:
-                json.dump(self.versions_data, f, indent=2, ensure_ascii=False)
-            self._on_version_change(version)
-            win.destroy()
-
-        ctk.CTkButton(win, text="Opslaan", command=save).grid(row=4, column=0, padx=16, pady=16, sticky="e")
-        win.grid_columnconfigure(0, weight=1)
-
-    # ── Hoofdproces ───────────────────────────────────────────────────────────
-
-    def _start_process(self):
-        if self._busy:
-            return
+    now = datetime.now().strftime("%H:%M")
+    log_cb(f"✅  Sync [{version_name}] → [{drive_letter}] om {now}: "
+           f"{stats['written']} geschreven ({format_bytes(stats['written_bytes'])}), "
+           f"{stats['skipped']} ongewijzigd ({format_bytes(stats['skipped_bytes'])} overgeslagen), "
+           f"{stats['deleted']} verwijderd.", "success")
+    _log_write_stats(write_stats, log_cb)
+    stats.update(files=stats["written"], bytes=write_stats["bytes"],
+                 verify_time=write_stats["verify_time"], verified=write_stats["verified"],
+                 flush_time=write_stats["flush_time"], manifest=manifest)
+    return stats
+
+
+def _sync_remove_extra(dst, dst_files, dst_dirs, manifest, stats, log_cb):
+    """Verwijdert bestanden en mappen van de kaart die niet in de versie zitten.
+    Wat niet weg kan wordt gelogd en in stats["delete_errors"] geteld."""
+    src_files = {rel.lower() for rel in manifest["files"]}
+    src_dirs = {rel.lower() for rel in manifest["dirs"]}
+    errors = []
+    for key in sorted(dst_files.keys() - src_files):
+        try:
+            force_remove(dst_files[key][1])
+            stats["deleted"] += 1
+        except OSError as e:
+            errors.append(f"{dst_files[key][0]}: {e}")
+    for key in sorted(dst_dirs.keys() - src_dirs, key=len, reverse=True):
+        try:
+            force_remove(dst / dst_dirs[key])
+        except OSError as e:
+            errors.append(f"{dst_dirs[key]}: {e}")
+    stats["delete_errors"] = len(errors)
+    if errors:
+        log_cb(f"⚠️  Kon {len(errors)} overbodig(e) item(s) niet verwijderen (bijv. {errors[0]}).", "warning")
 
-        drive = self._get_selected_drive()
-        version = self.version_var.get()
-        src = self.config.get("source_dir", "")
 
-        if not drive:
-            self.log("❌  Geen geldige drive geselecteerd.", "error")
-            return
-        if not src or not os.path.isdir(src):
-            self.log("❌  Hoofdmap niet ingesteld of niet gevonden.", "error")
-            return
-        if version not in self.versions_data:
-            self.log("❌  Geen geldige versie gekozen.", "error")
-            return
+_image_lock = threading.Lock()
 
-        self._busy = True
-        self.start_btn.configure(state="disabled", text="Bezig...")
-        threading.Thread(target=self._process_thread, args=(drive, version, src), daemon=True).start()
-
-    def _process_thread(self, drive, version, src):
-        allowed_exts = self.config.get("allowed_extensions", [])
-        max_files = self.config.get("max_files", 100)
-        max_drive_gb = self.config.get("max_drive_gb", 5.0)
-        drive_size_gb = self._get_selected_drive_size()
-
-        # 1. Valideer drive
-        ok, reason, is_corrupt = validate_drive(drive, allowed_exts, max_files,
-                                                 allow_subdirs=self.config.get("allow_subdirs", False),
-                                                 max_drive_gb=max_drive_gb,
-                                                 drive_size_gb=drive_size_gb)
-        if not ok:
-            self.after(0, self.log, f"🛑  Drive validatie mislukt: {reason}", "error")
-            if is_corrupt and self.config.get("auto_format_corrupt", False):
-                self.after(0, self.log, "🗂️   Corrupte SD-kaart gedetecteerd — automatisch formatteren...", "warning")
-                format_ok = format_drive(drive, lambda m, k="warning": self.after(0, self.log, m, k),
-                                          drive_size_gb=drive_size_gb)
-                if not format_ok:
-                    self.after(0, self.log, "❌  Automatisch formatteren mislukt. Probeer als administrator.", "error")
-                    self.after(0, self._reset_busy)
-                    return
-                self.after(0, self.log, f"✅  {drive} geformatteerd, doorgaan met kopiëren...", "success")
-            else:
-                self.after(0, self.log, "Schrijven naar deze drive is niet mogelijk.", "error")
-                self.after(0, self._reset_busy)
-                return
 
-        # 2. Leegmaken
-        self.after(0, self.log, f"🗑️   Drive wordt leeg gemaakt: {drive}", "info")
-        ok = clear_drive(drive, lambda m, k="warning": self.after(0, self.log, m, k), drive_size_gb=drive_size_gb)
+def _image_cache_dir(source_dir):
+    """<bronmap>/.sdkaart/images, of een lokale tempmap als de share alleen-lezen is."""
+    path = Path(source_dir) / CACHE_DIRNAME / "images"
+    try:
+        path.mkdir(parents=True, exist_ok=True)
+        probe = path / ".schrijftest"
+        probe.touch()
+        probe.unlink()
+        return path
+    except OSError:
+        import tempfile
+        path = Path(tempfile.gettempdir()) / "sdkaart-images"
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+
+def version_image(source_dir, version_name, total_sectors, log_cb):
+    """
+    Geeft (pad, aantal bestanden) van een FAT32-image van de versie voor een volume van
+    `total_sectors` sectoren. Het image wordt alleen opnieuw gebouwd als de inhoud
+    (manifest-digest) of de volumegrootte verandert; oude images van dezelfde
+    versie worden daarbij opgeruimd.
+    """
+    import sd_image
+
+    manifest = load_version_manifest(source_dir, version_name)
+    src = Path(source_dir) / version_name
+    cache_dir = _image_cache_dir(source_dir)
+    name = f"{version_name}@{manifest['digest'][:16]}@{total_sectors}@v{sd_image.IMAGE_FORMAT_VERSION}.img"
+    path = cache_dir / name
+
+    with _image_lock:
+        if path.exists():
+            return path, len(manifest["files"])
+        log_cb(f"🧱  FAT32-image voor [{version_name}] wordt gebouwd...", "info")
+        t0 = time.perf_counter()
+        files = [(rel, info["size"], info["mtime"] / 1e9, lambda p=src / rel: open(p, "rb"))
+                 for rel, info in manifest["files"].items()]
+        archive = version_archive(source_dir, version_name)
+        stream = None
+        if archive is not None:
+            stream = ((rel, f) for rel, _size, _mtime, f in iter_archive(archive) if f is not None)
+        tmp_path = path.with_suffix(".tmp")
+        try:
+            sd_image.build_fat32_image(tmp_path, total_sectors, files, manifest["dirs"], label=IMAGE_LABEL,
+                                       stream=stream)
+            os.replace(tmp_path, path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+        for old in cache_dir.glob("*.img"):
+            if old != path and old.name.rsplit("@", 3)[0] == version_name and \
+                    old.name.rsplit("@", 3)[2] == str(total_sectors):
+                old.unlink(missing_ok=True)
+        log_cb(f"🧱  Image gebouwd: {format_bytes(path.stat().st_size)} in {time.perf_counter() - t0:.2f} s.", "info")
+        return path, len(manifest["files"])
+
+
+def image_version_to_drive(source_dir, version_name, drive_letter, log_cb, verify=False, progress_cb=None):
+    """
+    Schrijft de versie als kant-en-klaar FAT32-image in één sequentiële stroom naar
+    de kaart (of een imagebestand), in plaats van bestand voor bestand. Vervangt het
+    bestandssysteem volledig. Gooit sd_image.RawAccessError als het raw doel niet
+    geopend kan worden (bijv. geen administratorrechten). Geeft statistieken terug.
+    """
+    import sd_image
+
+    with sd_image.open_raw_target(drive_letter, log_cb) as raw:
+        image, n_files = version_image(source_dir, version_name, raw.total_sectors, log_cb)
+        size = image.stat().st_size
+        tracker = ProgressTracker(size, progress_cb)
+        written, write_time, verify_time = sd_image.write_image(image, raw, progress=tracker.file_callback(image.name),
+                                                                verify=verify)
+        tracker.finish()
+
+    now = datetime.now().strftime("%H:%M")
+    mbps = written / write_time / 1024 ** 2 if write_time else 0.0
+    log_cb(f"✅  Image [{version_name}] → [{drive_letter}] om {now}: {format_bytes(written)} "
+           f"in {write_time:.2f} s ({mbps:.1f} MB/s), sequentieel geschreven.", "success")
+    if verify:
+        log_cb(f"🔍  Verificatie: image OK in {verify_time:.2f} s.", "success")
+    return {"files": n_files, "bytes": written, "verify_time": verify_time, "verified": n_files if verify else 0}
+
+
+# ── Staging-cache ──────────────────────────────────────────────────────────────
+#
+# Staat de bronmap op een netwerkshare, dan wordt de gekozen versie eenmalig naar
+# <staging_dir>/<bron>-<sleutel>/ gespiegeld. Die map ziet eruit als een bronmap,
+# zodat kopiëren, synchroniseren en images bouwen daarna van lokale schijf lezen.
+# Per versie staat in .sdkaart/staged/<versie>.json de manifest-digest van de bron
+# en wanneer de kopie voor het laatst gebruikt is (voor LRU-opruimen).
+#
+# Bestandsinhoud staat één keer in <staging_dir>/blobs/<hash[:2]>/<hash>; de
+# versiemappen bestaan uit hardlinks daarnaar. Een bestand dat in tien versies
+# gelijk is, wordt dus één keer over het netwerk gelezen, gecontroleerd en bewaard.
+# Kent de staging-map geen hardlinks (FAT/exFAT), dan krijgt de versiemap kopieën;
+# die tellen per versie mee in het budget (state "linked": false).
+
+_staging_guard = threading.Lock()
+_staging_locks = {}     # (lokale bronmap, versie) -> Lock
+_staging_leases = {}    # (lokale bronmap, versie) -> aantal flashes dat nu van de kopie leest
+_pending_blobs = {}     # hash -> aantal versies dat nu klaargezet wordt en deze blob nodig heeft
+
+
+def _staging_source(staging_dir, source_dir):
+    source = os.path.abspath(source_dir)
+    key = hashlib.sha1(source.encode("utf-8")).hexdigest()[:10]
+    return Path(staging_dir) / f"{Path(source).name or 'bron'}-{key}"
+
+
+def _staging_state_path(staged_src, version_name):
+    return Path(staged_src) / CACHE_DIRNAME / "staged" / f"{version_name}.json"
+
+
+def _read_staging_state(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_staging_state(path, state):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _remove_staged(staged_src, version_name, entry):
+    """Verwijdert een gestagede versie met bijbehorende state, manifest en images."""
+    staged_src = Path(staged_src)
+    _staging_state_path(staged_src, version_name).unlink(missing_ok=True)
+    target = staged_src / entry
+    if target.is_dir():
+        shutil.rmtree(target, ignore_errors=True)
+    else:
+        target.unlink(missing_ok=True)
+    (staged_src / CACHE_DIRNAME / "manifests" / f"{version_name}.json").unlink(missing_ok=True)
+    for image in (staged_src / CACHE_DIRNAME / "images").glob(f"{version_name}@*.img"):
+        image.unlink(missing_ok=True)
+
+
+def _blob_path(staging_dir, digest):
+    return Path(staging_dir) / "blobs" / digest[:2] / digest
+
+
+def _fetch_blob(staging_dir, src_path, info):
+    """Haalt een bestand naar de blob-store als de inhoud er nog niet in staat.
+    Geeft het aantal over het netwerk gelezen bytes (0 als de blob er al was)."""
+    blob = _blob_path(staging_dir, info["hash"])
+    if blob.exists():
+        return blob, 0
+    blob.parent.mkdir(parents=True, exist_ok=True)
+    tmp = blob.with_name(f".{blob.name}.{threading.get_ident()}.tmp")
+    try:
+        digest = _copy_and_hash(src_path, tmp)
+        if digest != info["hash"]:
+            raise RuntimeError(f"{src_path} veranderde tijdens het klaarzetten")
+        os.utime(tmp, ns=(info["mtime"], info["mtime"]))
+        os.replace(tmp, blob)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return blob, info["size"]
+
+
+def _link_blob(blob, target):
+    """Hardlink naar de blob; kopie als het bestandssysteem geen hardlinks kent.
+    Geeft True bij een hardlink."""
+    try:
+        os.link(blob, target)
+        return True
+    except OSError:
+        shutil.copy2(blob, target)
+        return False
+
+
+def _stage_files(source_dir, version_name, staged_src, manifest, staging_dir):
+    """Bouwt de versiemap op uit blobs. Alleen inhoud die nog niet in de blob-store
+    staat wordt van de bron gelezen (en daarbij tegen de manifest-hash gecontroleerd)."""
+    src = Path(source_dir) / version_name
+    final = staged_src / version_name
+    tmp = staged_src / f".{version_name}.staging"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    fetched = 0
+    linked = True
+    for rel in manifest["dirs"]:
+        (tmp / rel).mkdir(parents=True, exist_ok=True)
+    files = {}
+    digests = {info["hash"] for info in manifest["files"].values()}
+    with _staging_guard:  # blobs die nog gelinkt moeten worden niet laten opruimen
+        for digest in digests:
+            _pending_blobs[digest] = _pending_blobs.get(digest, 0) + 1
+    try:
+        for rel, info in manifest["files"].items():
+            target = tmp / rel
+            target.parent.mkdir(parents=True, exist_ok=True)
+            blob, n = _fetch_blob(staging_dir, src / rel, info)
+            fetched += n
+            linked = _link_blob(blob, target) and linked
+            st = target.stat()
+            files[rel] = {"size": st.st_size, "mtime": st.st_mtime_ns, "hash": info["hash"]}
+        shutil.rmtree(final, ignore_errors=True)
+        os.replace(tmp, final)
+    finally:
+        with _staging_guard:
+            for digest in digests:
+                _pending_blobs[digest] -= 1
+                if not _pending_blobs[digest]:
+                    del _pending_blobs[digest]
+    # Lokaal manifest direct meegeven, zodat de versie hier niet opnieuw gehasht wordt
+    _save_manifest(staged_src / CACHE_DIRNAME / "manifests" / f"{version_name}.json",
+                   {"files": files, "dirs": manifest["dirs"], "digest": manifest["digest"]})
+    return version_name, fetched, linked
+
+
+def _collect_blobs(staging_dir):
+    """Verwijdert blobs waar geen enkele versiemap meer naar linkt. Geeft de vrijgekomen bytes.
+    Zonder hardlinks zijn dat alle blobs: de versiemappen hebben dan eigen kopieën."""
+    freed = 0
+    for blob in Path(staging_dir).glob("blobs/*/*"):
+        with _staging_guard:
+            if blob.name in _pending_blobs:
+                continue
+        try:
+            st = blob.stat()
+            if st.st_nlink <= 1 and not blob.name.startswith("."):
+                blob.unlink()
+                freed += st.st_size
+        except OSError:
+            pass
+    return freed
+
+
+def _own_bytes(state):
+    """Bytes van een gestagede versie die niet in de blob-store staan: een gekopieerd
+    versiepakket, of een versiemap met kopieën in plaats van hardlinks."""
+    if state["entry"] != state["version"] or not state.get("linked", True):
+        return state.get("bytes", 0)
+    return 0
+
+
+def _staging_usage(staging_dir, states):
+    """Werkelijk gebruikte ruimte: unieke blobs plus wat versies los daarvan innemen."""
+    total = 0
+    for blob in Path(staging_dir).glob("blobs/*/*"):
+        try:
+            total += blob.stat().st_size
+        except OSError:
+            pass
+    for _used, _staged_src, state in states:
+        total += _own_bytes(state)
+    return total
+
+
+def _stage_archive(archive, version_name, staged_src, manifest):
+    """Kopieert een versiepakket als één bestand naar de staging-map."""
+    target = staged_src / archive.name
+    tmp = target.with_name(f".{archive.name}.staging")
+    copy_file_fast(archive, tmp)
+    st = archive.stat()
+    os.utime(tmp, ns=(st.st_mtime_ns, st.st_mtime_ns))
+    os.replace(tmp, target)
+    local = target.stat()
+    key = {"name": target.name, "size": local.st_size, "mtime": local.st_mtime_ns}
+    _save_manifest(staged_src / CACHE_DIRNAME / "manifests" / f"{version_name}.json", dict(manifest, archive=key))
+    return archive.name, local.st_size
+
+
+def _staging_lock(key):
+    with _staging_guard:
+        return _staging_locks.setdefault(key, threading.Lock())
+
+
+def stage_version(source_dir, version_name, staging_dir, log_cb, budget_gb=STAGING_BUDGET_GB, lease=False):
+    """
+    Zorgt dat de versie actueel in de lokale staging-cache staat en geeft de lokale
+    bronmap terug (te gebruiken in plaats van `source_dir`). De kopie is actueel als
+    de manifest-digest van de bron gelijk is; het manifest van de bron wordt alleen
+    opnieuw gehasht voor bestanden waarvan grootte of mtime veranderde. Daarna wordt
+    de cache LRU opgeschoond tot binnen `budget_gb`.
+    Met `lease` telt de aanroeper als lezer van de kopie (vrijgeven met
+    _release_staging_lease). Een kopie waar nog gelezen wordt, wordt niet vervangen:
+    is de bron intussen veranderd, dan volgt een RuntimeError.
+    """
+    staged_src = _staging_source(staging_dir, source_dir)
+    state_path = _staging_state_path(staged_src, version_name)
+    key = (str(staged_src), version_name)
+    with _staging_lock(key):
+        manifest = load_version_manifest(source_dir, version_name)
+        state = _read_staging_state(state_path)
+        if state and state.get("digest") == manifest["digest"] and (staged_src / state["entry"]).exists():
+            state["used"] = time.time()
+            _write_staging_state(state_path, state)
+            if lease:
+                _take_staging_lease(key)
+            return staged_src
+
+        with _staging_guard:
+            readers = _staging_leases.get(key, 0)
+        if readers:
+            raise RuntimeError(f"[{version_name}] is gewijzigd, maar {readers} flash(es) lezen nog van de lokale "
+                               "kopie — opnieuw klaarzetten kan pas daarna")
+        log_cb(f"📦  [{version_name}] wordt lokaal klaargezet in {staging_dir}...", "info")
+        t0 = time.perf_counter()
+        staged_src.mkdir(parents=True, exist_ok=True)
+        state_path.unlink(missing_ok=True)  # halve kopie nooit als geldig zien
+        archive = version_archive(source_dir, version_name)
+        if state and state.get("entry") != (archive.name if archive is not None else version_name):
+            _remove_staged(staged_src, version_name, state["entry"])  # map werd pakket of andersom
+        linked = True
+        if archive is not None:
+            entry, fetched = _stage_archive(archive, version_name, staged_src, manifest)
+            size = fetched
+        else:
+            entry, fetched, linked = _stage_files(source_dir, version_name, staged_src, manifest, staging_dir)
+            size = sum(info["size"] for info in manifest["files"].values())
+            if not linked:
+                log_cb(f"⚠️   {staging_dir} ondersteunt geen hardlinks: [{version_name}] staat er als volledige "
+                       "kopie en telt apart mee in het budget.", "warning")
+        _write_staging_state(state_path, {
+            "version": version_name, "source": os.path.abspath(source_dir), "entry": entry,
+            "digest": manifest["digest"], "bytes": size, "linked": linked, "used": time.time(),
+        })
+        log_cb(f"📦  [{version_name}] klaargezet: {format_bytes(fetched)} over het netwerk gelezen "
+               f"in {time.perf_counter() - t0:.2f} s.", "info")
+        if lease:
+            _take_staging_lease(key)
+
+    try:
+        evict_staging(staging_dir, budget_gb, log_cb, keep=key)
+    except Exception:
+        if lease:
+            _release_staging_lease(key)
+        raise
+    return staged_src
+
+
+def _take_staging_lease(key):
+    with _staging_guard:
+        _staging_leases[key] = _staging_leases.get(key, 0) + 1
+
+
+def _release_staging_lease(key):
+    with _staging_guard:
+        _staging_leases[key] -= 1
+        if not _staging_leases[key]:
+            del _staging_leases[key]
+
+
+def evict_staging(staging_dir, budget_gb, log_cb, keep=None):
+    """Verwijdert de langst niet gebruikte versies tot de cache binnen het budget past.
+    Versies waar nu een flash van leest en `keep` (lokale bronmap, versie) worden
+    overgeslagen. Gedeelde blobs tellen één keer mee en verdwijnen pas als geen
+    enkele versie ze meer gebruikt."""
+    states = []
+    for state_path in Path(staging_dir).glob(f"*/{CACHE_DIRNAME}/staged/*.json"):
+        state = _read_staging_state(state_path)
+        if state:
+            states.append((state.get("used", 0), state_path.parents[2], state))
+    total = _staging_usage(staging_dir, states)
+    budget = budget_gb * 1024 ** 3
+    for _used, staged_src, state in sorted(states, key=lambda item: item[0]):
+        if total <= budget:
+            break
+        key = (str(staged_src), state["version"])
+        if key == keep:
+            continue
+        lock = _staging_lock(key)
+        if not lock.acquire(blocking=False):
+            continue  # wordt nu klaargezet
+        try:
+            with _staging_guard:
+                if _staging_leases.get(key):
+                    continue
+            _remove_staged(staged_src, state["version"], state["entry"])
+        finally:
+            lock.release()
+        freed = _own_bytes(state) + (_collect_blobs(staging_dir) if state["entry"] == state["version"] else 0)
+        total -= freed
+        log_cb(f"🧹  [{state['version']}] uit de staging-cache verwijderd ({format_bytes(freed)} vrijgekomen).",
+               "info")
+
+
+def prepare_version(source_dir, version_name, config, log_cb):
+    """Voorbereiden zodra een versie gekozen wordt: lokaal klaarzetten als er een
+    staging-map ingesteld is, anders alleen het manifest bijwerken."""
+    if config.get("staging_dir"):
+        stage_version(source_dir, version_name, config["staging_dir"], log_cb,
+                      config.get("staging_budget_gb", STAGING_BUDGET_GB))
+    elif version_archive(source_dir, version_name) is None:
+        load_version_manifest(source_dir, version_name)   # een pakket wordt gehasht tijdens het eerste schrijven
+
+
+@contextmanager
+def staged_source(source_dir, version_name, config, log_cb, timer=None):
+    """Geeft de bronmap om van te flashen: de lokale staging-kopie als die ingesteld
+    is, anders `source_dir`. De kopie wordt niet opgeruimd of vervangen zolang het
+    blok loopt."""
+    staging_dir = config.get("staging_dir", "")
+    if not staging_dir:
+        yield source_dir
+        return
+    key = (str(_staging_source(staging_dir, source_dir)), version_name)
+    leased = False
+    try:
+        if timer is not None:
+            with timer.phase("stage"):
+                local = stage_version(source_dir, version_name, staging_dir, log_cb,
+                                      config.get("staging_budget_gb", STAGING_BUDGET_GB), lease=True)
+        else:
+            local = stage_version(source_dir, version_name, staging_dir, log_cb,
+                                  config.get("staging_budget_gb", STAGING_BUDGET_GB), lease=True)
+        leased = True
+    except Exception as e:
+        log_cb(f"⚠️   Lokaal klaarzetten mislukt ({e}) — lezen vanaf de bron.", "warning")
+        local = source_dir
+    try:
+        yield str(local)
+    finally:
+        if leased:
+            _release_staging_lease(key)
+
+
+# ── Kaarttest ─────────────────────────────────────────────────────────────────
+
+def probe_drive(drive_letter, log_cb, budget=5.0):
+    """Niet-destructieve capaciteits- en snelheidstest van de kaart (zie sd_image.probe).
+    Gooit sd_image.RawAccessError als de kaart niet raw geopend kan worden."""
+    import sd_image
+
+    with sd_image.open_raw_target(drive_letter, log_cb) as raw:
+        return sd_image.probe(raw, budget=budget)
+
+
+def _probe_card(drive, config, log_cb, status_cb):
+    """Kaarttest uitvoeren en beoordelen. False = kaart weigeren."""
+    import sd_image
+
+    status_cb("🔬 kaarttest")
+    try:
+        result = probe_drive(drive, log_cb, budget=config.get("probe_budget_s", 5.0))
+    except sd_image.RawAccessError as e:
+        log_cb(f"⚠️   Kaarttest overgeslagen: geen raw toegang ({e}).", "warning")
+        return True
+
+    def mbps(value):
+        return f"{value:.1f} MB/s" if value is not None else "-"
+
+    iops = f"{result['random_iops']:.0f} IOPS" if result["random_iops"] is not None else "-"
+    partial = "" if result["complete"] else " (tijdslimiet bereikt)"
+    log_cb(f"🔬  Kaarttest: {result['samples'] - len(result['bad'])}/{result['samples']} steekproeven OK over "
+           f"{format_bytes(result['size'])} · schrijven {mbps(result['seq_write_mbps'])}, lezen "
+           f"{mbps(result['seq_read_mbps'])} · random 4K {iops} — {result['seconds']:.1f} s{partial}.", "info")
+    if result["bad"]:
+        log_cb(f"❌  Kaart geweigerd: {len(result['bad'])} steekproef/steekproeven kwamen niet goed terug — "
+               "waarschijnlijk een neppe kaart met minder capaciteit dan opgegeven, of een defecte kaart.", "error")
+        return False
+    min_mbps = config.get("probe_min_write_mbps", 0.0)
+    if min_mbps and result["seq_write_mbps"] is not None and result["seq_write_mbps"] < min_mbps:
+        log_cb(f"❌  Kaart geweigerd: schrijft {result['seq_write_mbps']:.1f} MB/s, minimaal "
+               f"{min_mbps:.1f} MB/s vereist.", "error")
+        return False
+    return True
+
+
+# ── Versiestempel ──────────────────────────────────────────────────────────────
+
+def read_stamp(drive_letter):
+    """Versiestempel van de kaart als dict, of None."""
+    try:
+        with open(Path(drive_letter) / STAMP_FILE, "r", encoding="utf-8") as f:
+            stamp = json.load(f)
+        return stamp if isinstance(stamp, dict) else None
+    except (OSError, ValueError):
+        return None
+
+
+def write_stamp(drive_letter, version_name, manifest, mode):
+    """Schrijft na een geslaagde flash welke versie (en welke inhoud) op de kaart staat."""
+    stamp = {
+        "version": version_name,
+        "digest": manifest["digest"],
+        "files": len(manifest["files"]),
+        "bytes": sum(info["size"] for info in manifest["files"].values()),
+        "mode": mode,
+        "written": datetime.now().isoformat(timespec="seconds"),
+    }
+    path = Path(drive_letter) / STAMP_FILE
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(stamp, f, indent=1, ensure_ascii=False)
+    flush_volume(drive_letter, [path])
+    return stamp
+
+
+def remove_stamp(drive_letter):
+    """Vóór het schrijven weghalen: een halfgeschreven kaart mag nooit als actueel gelden."""
+    try:
+        (Path(drive_letter) / STAMP_FILE).unlink()
+    except FileNotFoundError:
+        pass
+
+
+def card_up_to_date(drive_letter, version_name, manifest):
+    """
+    True als het stempel op de kaart dezelfde versie en manifest-digest noemt en elk
+    bestand van de versie met de juiste grootte op de kaart staat. Leest alleen het
+    stempel en de directory-informatie, geen bestandsinhoud.
+    """
+    stamp = read_stamp(drive_letter)
+    if not stamp or stamp.get("version") != version_name or stamp.get("digest") != manifest["digest"]:
+        return False
+    root = Path(drive_letter)
+    try:
+        return all(os.stat(root / rel).st_size == info["size"] for rel, info in manifest["files"].items())
+    except OSError:
+        return False
+
+
+# ── Flash procedure ────────────────────────────────────────────────────────────
+
+def flash_drive(drive, version, src, config, log_cb, status_cb=None, progress_cb=None, drive_size_gb=None,
+                jobs_db=None):
+    """
+    Volledige procedure voor één drive: valideren, zo nodig formatteren, leegmaken en
+    kopiëren (of differentieel synchroniseren). Gedeeld door GUI en CLI.
+    status_cb(tekst) krijgt korte statusupdates. Geeft True bij succes.
+    Elke fase wordt getimed; het resultaat gaat naar de historie (config "history_db").
+    `jobs_db` is de JobStore voor het schrijfjournaal; zonder wordt open_jobs(config) gebruikt.
+    Een kaart waarvan het versiestempel klopt wordt overgeslagen nog vóór het
+    klaarzetten van de versie en het wachten op een plek in de groep.
+    """
+    from sd_history import JobTimer
+
+    mode = "image" if config.get("image_mode") else "sync" if config.get("sync_mode") else "copy"
+    timer = JobTimer(drive, version, mode)
+    status_cb = status_cb or (lambda text: None)
+    provider = drive_provider(config)
+    scheduler = flash_scheduler(config)
+    jobs_db = jobs_db if jobs_db is not None else open_jobs(config)
+    ok = False
+    try:
+        # Staat deze versie er al op? Dan niet klaarzetten, niet op een plek wachten en niets schrijven
+        if _already_on_card(drive, version, src, config, log_cb, status_cb, timer):
+            ok = True
+            return ok
+        with staged_source(src, version, config, log_cb, timer) as local_src:
+            # plek in de groep (hub/lezer) van deze kaart; de regelaar bepaalt hoeveel tegelijk
+            t0 = time.perf_counter()
+            group = scheduler.acquire(drive, provider.group(drive), log_cb, status_cb)
+            waited = time.perf_counter() - t0
+            if waited > 0.01:
+                timer.add_phase("wait", waited)
+            try:
+                progress = scheduler.wrap_progress(drive, group, provider.wrap_progress(drive, progress_cb), log_cb)
+                ok = _flash_steps(drive, version, local_src, config, log_cb, status_cb, progress,
+                                  drive_size_gb, timer, jobs_db)
+            finally:
+                scheduler.release(drive, group, timer.bytes, ok)
+        return ok
+    finally:
+        timer.finish(ok)
+        log_cb(f"⏱️   {timer.summary()}", "info")
+        _record_history(config, timer, log_cb)
+
+
+def _already_on_card(drive, version, src, config, log_cb, status_cb, timer):
+    """True als het stempel op de kaart bij het bewaarde manifest van de versie past.
+    Leest alleen stempel en directory-informatie; een pakket zonder bewaard manifest
+    wordt hiervoor niet gelezen."""
+    image_file = config.get("image_mode") and (os.path.isfile(drive) or is_block_device(drive))
+    if image_file or not config.get("skip_up_to_date", True):
+        return False
+    with timer.phase("check"):
+        try:
+            manifest = cached_version_manifest(src, version)
+            up_to_date = manifest is not None and card_up_to_date(drive, version, manifest)
+        except Exception:
+            up_to_date = False
+    if up_to_date:
+        log_cb(f"✅  {drive} bevat al [{version}] (stempel van {read_stamp(drive).get('written', '?')}) "
+               "— niets geschreven.", "success")
+        status_cb("✅ al actueel")
+    return up_to_date
+
+
+def _record_history(config, timer, log_cb):
+    path = config.get("history_db", HISTORY_DB)
+    if not path:
+        return
+    try:
+        from sd_history import History
+        History(path).record(timer)
+    except Exception as e:
+        log_cb(f"⚠️   Historie bijwerken mislukt: {e}", "warning")
+
+
+def _phase_result(timer, phase, result):
+    """Bytes/bestanden van een schrijffase invullen en verificatie- en flushtijd als
+    eigen fasen boeken."""
+    phase["bytes"] = result.get("bytes", 0)
+    phase["files"] = result.get("files", 0)
+    verify_time = result.get("verify_time", 0.0)
+    if verify_time:
+        phase["seconds"] = max(phase["seconds"] - verify_time, 0.0)
+        timer.add_phase("verify", verify_time, phase["bytes"], result.get("verified", 0))
+    flush_time = result.get("flush_time", 0.0)
+    if flush_time:
+        phase["seconds"] = max(phase["seconds"] - flush_time, 0.0)
+        timer.add_phase("flush", flush_time)
+
+
+def _flash_steps(drive, version, src, config, log_cb, status_cb, progress_cb, drive_size_gb, timer, jobs_db=None):
+    def log_as(kind):
+        return lambda m, k=kind: log_cb(m, k)
+
+    allowed_exts = config.get("allowed_extensions", [])
+    max_files = config.get("max_files", 100)
+    max_drive_gb = config.get("max_drive_gb", 5.0)
+
+    image_mode = config.get("image_mode", False)
+    # imagebestand of blokdevice als doel: geen map om te valideren of te stempelen
+    image_file = image_mode and (os.path.isfile(drive) or is_block_device(drive))
+
+    if image_mode and is_block_device(drive):
+        size_gb = drive_size_gb if drive_size_gb is not None else _block_device_size_gb(drive)
+        if size_gb is None:
+            log_cb(f"🛑  Grootte van {drive} niet te bepalen — niet geschreven.", "error")
+            return False
+        if max_drive_gb and size_gb > max_drive_gb:
+            log_cb(f"🛑  {drive} is {size_gb:.1f} GB, maximaal toegestaan is {max_drive_gb:.1f} GB "
+                   "— mogelijk verkeerde drive, niet geschreven.", "error")
+            return False
+
+    # 1. Valideer drive (een imagebestand als doel heeft geen inhoud om te controleren)
+    ok, reason, is_corrupt = True, "", False
+    if not image_file:
+        with timer.phase("validate") as phase:
+            ok, reason, is_corrupt = validate_drive(drive, allowed_exts, max_files,
+                                                     allow_subdirs=config.get("allow_subdirs", False),
+                                                     max_drive_gb=max_drive_gb,
+                                                     drive_size_gb=drive_size_gb)
+            phase["ok"] = ok
+    if not ok:
+        log_cb(f"🛑  Drive validatie mislukt: {reason}", "error")
+        if is_corrupt and config.get("auto_format_corrupt", False) and drive_size_gb is None:
+            log_cb("🛑  Niet automatisch geformatteerd: de grootte van dit doel is onbekend, "
+                   "dus de grootte-controle kan niet uitgevoerd worden.", "error")
+            return False
+        if is_corrupt and config.get("auto_format_corrupt", False):
+            log_cb("🗂️   Corrupte SD-kaart gedetecteerd — automatisch formatteren...", "warning")
+            status_cb("🗂️ formatteren")
+            with timer.phase("format") as phase:
+                format_ok = phase["ok"] = drive_provider(config).format_drive(drive, log_as("warning"),
+                                                                              drive_size_gb=drive_size_gb)
+            if not format_ok:
+                log_cb("❌  Automatisch formatteren mislukt. Probeer als administrator.", "error")
+                return False
+            log_cb(f"✅  {drive} geformatteerd, doorgaan met kopiëren...", "success")
+        else:
+            log_cb("Schrijven naar deze drive is niet mogelijk.", "error")
+            return False
+
+    # 1b. Kaarttest: neppe of te trage kaarten weigeren voordat er iets geschreven wordt
+    if config.get("probe_cards", False) and not image_file:
+        with timer.phase("probe") as phase:
+            ok = phase["ok"] = _probe_card(drive, config, log_cb, status_cb)
         if not ok:
-            self.after(0, self.log, f"❌  Kon {drive} niet leegmaken.", "error")
-            self.after(0, self._reset_busy)
-            return
+            return False
+
+    if not image_file:
+        remove_stamp(drive)
 
-        # 3. Kopiëren
-        self.after(0, self.log, f"📋  Nieuwe bestanden worden gekopieerd vanuit [{version}]...", "info")
+    # 2+3. Volledig image raw schrijven in plaats van wissen en bestand voor bestand kopiëren
+    if image_mode:
+        import sd_image
+        log_cb(f"💾  Image van [{version}] wordt raw naar {drive} geschreven...", "info")
+        status_cb("💾 image schrijven")
         try:
-            copy_version_to_drive(src, version, drive,
-                                   lambda m, k="success": self.after(0, self.log, m, k))
+            with timer.phase("image") as phase:
+                result = image_version_to_drive(src, version, drive, log_as("success"),
+                                                verify=config.get("verify_writes", False),
+                                                progress_cb=progress_cb)
+            _phase_result(timer, phase, result)
+            if not image_file:
+                _finish_card(drive, version, src, "image", log_cb, status_cb)
+            return True
+        except sd_image.RawAccessError as e:
+            if image_file:
+                log_cb(f"❌  Image schrijven mislukt: {e}", "error")
+                return False
+            log_cb(f"⚠️   Raw schrijven niet mogelijk ({e}) — terugvallen op bestanden kopiëren.", "warning")
         except Exception as e:
-            self.after(0, self.log, f"❌  Fout bij kopiëren: {e}", "error")
+            log_cb(f"❌  Fout bij image schrijven: {e}", "error")
+            return False
 
-        self.after(0, self._reset_busy)
+    # 2+3. Differentieel synchroniseren in plaats van wissen en alles herschrijven
+    if config.get("sync_mode", False):
+        log_cb(f"🔁  Drive wordt gesynchroniseerd met [{version}]...", "info")
+        status_cb("🔁 synchroniseren")
+        try:
+            with timer.phase("sync") as phase:
+                result = sync_version_to_drive(src, version, drive, log_as("success"),
+                                               verify=config.get("verify_writes", False),
+                                               progress_cb=progress_cb,
+                                               engine=config.get("copy_engine", "auto"),
+                                               flush=config.get("flush_policy", "end"))
+            _phase_result(timer, phase, result)
+        except Exception as e:
+            log_cb(f"❌  Fout bij synchroniseren: {e}", "error")
+            return False
+        _finish_card(drive, version, src, "sync", log_cb, status_cb, result["manifest"])
+        return True
+
+    # 2. Leegmaken — tenzij deze kaart een onderbroken kopie van dezelfde versie bevat
+    journal = None
+    # zonder bewaard manifest (eerste gebruik van een pakket) is er niets te hervatten
+    manifest = cached_version_manifest(src, version) if jobs_db is not None else None
+    if manifest is not None:
+        digest = manifest["digest"]
+        card = card_identity(drive)
+        if card and jobs_db.resumable(card, version, digest):
+            journal = jobs_db.open_journal(card, version, digest)
+            if _journal_trusted(journal, drive, log_cb):
+                log_cb(f"⏯️   Onderbroken kopie van [{version}] op deze kaart gevonden — hervatten zonder te wissen.",
+                       "info")
+            else:
+                journal.finish(False)
+                journal = None
+    if journal is None:
+        log_cb(f"🗑️   Drive wordt leeg gemaakt: {drive}", "info")
+        status_cb("🗑️ leegmaken")
+        with timer.phase("wipe") as phase:
+            ok = phase["ok"] = clear_drive(drive, log_as("warning"), drive_size_gb=drive_size_gb,
+                                           strategy=config.get("wipe_strategy", "auto"))
+        if not ok:
+            log_cb(f"❌  Kon {drive} niet leegmaken.", "error")
+            return False
+        card = manifest is not None and card_identity(drive)  # formatteren geeft een nieuw serienummer
+        if card:
+            journal = jobs_db.open_journal(card, version, digest)
 
-    def _reset_busy(self):
-        self._busy = False
-        self.start_btn.configure(state="normal", text="▶  Start overschrijven")
-        self.format_btn.configure(state="normal", text="🗂  Formatteer geselecteerde drive")
+    # 3. Kopiëren
+    log_cb(f"📋  Nieuwe bestanden worden gekopieerd vanuit [{version}]...", "info")
+    status_cb("📋 kopiëren")
+    try:
+        with timer.phase("copy") as phase:
+            result = copy_version_to_drive(src, version, drive, log_as("success"),
+                                           verify=config.get("verify_writes", False),
+                                           progress_cb=progress_cb,
+                                           engine=config.get("copy_engine", "auto"),
+                                           flush=config.get("flush_policy", "end"),
+                                           journal=journal)
+        _phase_result(timer, phase, result)
+    except Exception as e:
+        log_cb(f"❌  Fout bij kopiëren: {e}", "error")
+        if journal is not None:
+            journal.finish(False)
+        return False
+    if journal is not None:
+        journal.finish(True)
+    _finish_card(drive, version, src, "copy", log_cb, status_cb, result["manifest"] or manifest)
+    return True
 
-    def _update_auto_format_switch_state(self):
-        """Schakel de corrupt-switch alleen in als grootte-limiet ingesteld is én drive uitgelezen kan worden."""
-        max_gb = self.config.get("max_drive_gb", None)
-        drive_size = self._get_selected_drive_size()
-        if max_gb and drive_size is not None:
-            self.auto_format_switch.configure(state="normal")
-        else:
-            self.auto_format_var.set(False)
-            self.auto_format_switch.configure(state="disabled")
 
-    def _on_auto_format_toggle(self):
-        self.config["auto_format_corrupt"] = self.auto_format_var.get()
-        save_config(self.config)
+def is_block_device(path):
+    """True voor een blokdevice (/dev/sdX) of een Windows-volumepad (\\\\.\\E:)."""
+    if path.startswith("\\\\.\\"):
+        return True
+    try:
+        return stat.S_ISBLK(os.stat(path).st_mode)
+    except OSError:
+        return False
 
-    def _format_selected_drive(self):
-        """Handmatig formatteren van de geselecteerde drive met bevestiging."""
-        if self._busy:
-            return
-        drive = self._get_selected_drive()
-        if not drive:
-            self.log("❌  Geen geldige drive geselecteerd.", "error")
-            return
 
-        drive_size = self._get_selected_drive_size()
-        max_gb = self.config.get("max_drive_gb", None)
+def _block_device_size_gb(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            return os.lseek(fd, 0, os.SEEK_END) / (1024 ** 3)
+        finally:
+            os.close(fd)
+    except OSError:
+        return None
+
 
-        # Grootte veiligheidscheck
-        if max_gb and drive_size is not None and drive_size > max_gb:
-            self.log(f"🛑  Formatteren geblokkeerd: drive is {drive_size:.1f} GB (max {max_gb:.1f} GB).", "error")
+def _finish_card(drive, version, src, mode, log_cb, status_cb, manifest=None):
+    """Versiestempel schrijven en flushen; pas daarna mag de kaart eruit. Geef het
+    manifest mee als het er al is: opnieuw laden kan een heel pakket opnieuw hashen."""
+    try:
+        write_stamp(drive, version, manifest or load_version_manifest(src, version), mode)
+    except Exception as e:
+        log_cb(f"⚠️   Versiestempel niet geschreven: {e}", "warning")
+    log_cb(f"⏏️   {drive} is veilig te verwijderen.", "success")
+    status_cb("⏏️ veilig verwijderen")
+
+
+# ── Drive detectie ─────────────────────────────────────────────────────────────
+
+class DriveWatcher(abc.ABC):
+    """
+    Basis voor drive-detectie. Een backend roept _notify() aan bij een (mogelijke)
+    mount/unmount; na `debounce` seconden stilte volgt één aanroep van on_change().
+    Zo levert een burst aan device-events maar één herscan op.
+    """
+    name = "basis"
+
+    def __init__(self, on_change, debounce=DRIVE_DEBOUNCE):
+        self.on_change = on_change
+        self.debounce = debounce
+        self._stop = threading.Event()
+        self._ready = threading.Event()
+        self._error = None
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start de backend-thread; gooit de fout door als de backend niet opstart."""
+        threading.Thread(target=self._thread_main, daemon=True, name=f"DriveWatcher-{self.name}").start()
+        self._ready.wait(2.0)
+        if self._error is not None:
+            raise self._error
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+
+    def _thread_main(self):
+        try:
+            self._setup()
+        except Exception as e:
+            self._error = e
+            self._ready.set()
             return
+        self._ready.set()
+        self._run()
+
+    def _setup(self):
+        pass
+
+    @abc.abstractmethod
+    def _run(self):
+        """Wacht op events tot _stop gezet is en roept daarbij _notify() aan."""
+
+    def _notify(self):
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.debounce, self._fire)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _fire(self):
+        if not self._stop.is_set():
+            self.on_change()
+
+
+class PollingDriveWatcher(DriveWatcher):
+    """Terugval: meldt elke `interval` seconden een mogelijke wijziging."""
+    name = "polling"
+
+    def __init__(self, on_change, interval=DRIVE_POLL_INTERVAL):
+        super().__init__(on_change)
+        self.interval = interval
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.on_change()
+
+
+class MountinfoDriveWatcher(DriveWatcher):
+    """Linux: de kernel markeert /proc/self/mountinfo met POLLPRI zodra de
+    mount-tabel verandert (ook bij automount van een SD-kaart)."""
+    name = "mountinfo"
 
-        # Bevestigingsvenster
-        win = ctk.CTkToplevel(self)
-        win.title("Bevestiging")
-        win.geometry("420x180")
-        win.grab_set()
-        win.grid_columnconfigure(0, weight=1)
-        self._center_window(win, 420, 180)
-
-        msg = f"Weet je zeker dat je {drive} wil formatteren?\nAlle data op de drive wordt gewist."
-        if drive_size:
-            msg += f"\n\nDrive grootte: {drive_size:.1f} GB"
-        ctk.CTkLabel(win, text=msg, wraplength=380, justify="center").grid(
-            row=0, column=0, columnspan=2, padx=20, pady=(20, 16))
-
-        def confirm():
-            win.destroy()
-            self._busy = True
-            self.format_btn.configure(state="disabled", text="Bezig met formatteren...")
-            self.start_btn.configure(state="disabled")
-            self.log(f"🗂️   Formatteren gestart voor {drive}...", "warning")
-            threading.Thread(target=self._format_thread, args=(drive,), daemon=True).start()
-
-        ctk.CTkButton(win, text="Ja, formatteren", fg_color="#b45309", hover_color="#92400e",
-                      command=confirm).grid(row=1, column=0, padx=(20, 8), pady=10, sticky="ew")
-        ctk.CTkButton(win, text="Annuleren", fg_color="gray30", hover_color="gray40",
-                      command=win.destroy).grid(row=1, column=1, padx=(8, 20), pady=10, sticky="ew")
-
-    def _format_thread(self, drive):
-        drive_size_gb = self._get_selected_drive_size()
-        ok = format_drive(drive, lambda m, k="warning": self.after(0, self.log, m, k),
-                          drive_size_gb=drive_size_gb)
-        if ok:
-            self.after(0, self.log, f"✅  {drive} is klaar voor gebruik.", "success")
+    def _setup(self):
+        import select
+        self._file = open("/proc/self/mountinfo", "rb")
+        self._file.read()
+        self._poller = select.poll()
+        self._poller.register(self._file.fileno(), select.POLLPRI | select.POLLERR)
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                if self._poller.poll(500):
+                    # opnieuw lezen bevestigt het event, anders blijft poll() afgaan
+                    self._file.seek(0)
+                    self._file.read()
+                    self._notify()
+        finally:
+            self._file.close()
+
+
+class WindowsDeviceWatcher(DriveWatcher):
+    """Windows: onzichtbaar top-level venster dat WM_DEVICECHANGE ontvangt
+    (DBT_DEVICEARRIVAL / DBT_DEVICEREMOVECOMPLETE, ook bij media in een kaartlezer).
+    Message-only vensters krijgen deze broadcasts niet, vandaar een gewoon venster."""
+    name = "WM_DEVICECHANGE"
+
+    WM_DESTROY = 0x0002
+    WM_CLOSE = 0x0010
+    WM_DEVICECHANGE = 0x0219
+    DBT_DEVICEARRIVAL = 0x8000
+    DBT_DEVICEREMOVECOMPLETE = 0x8004
+
+    def _setup(self):
+        import ctypes
+        from ctypes import wintypes
+
+        self._ctypes = ctypes
+        user32 = ctypes.WinDLL("user32", use_last_error=True)
+        k32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        LRESULT = ctypes.c_ssize_t
+        WNDPROC = ctypes.WINFUNCTYPE(LRESULT, wintypes.HWND, wintypes.UINT, wintypes.WPARAM, wintypes.LPARAM)
+
+        class WNDCLASSW(ctypes.Structure):
+            _fields_ = [("style", wintypes.UINT), ("lpfnWndProc", WNDPROC),
+                        ("cbClsExtra", ctypes.c_int), ("cbWndExtra", ctypes.c_int),
+                        ("hInstance", wintypes.HINSTANCE), ("hIcon", wintypes.HICON),
+                        ("hCursor", wintypes.HANDLE), ("hbrBackground", wintypes.HBRUSH),
+                        ("lpszMenuName", wintypes.LPCWSTR), ("lpszClassName", wintypes.LPCWSTR)]
+
+        user32.DefWindowProcW.restype = LRESULT
+        user32.DefWindowProcW.argtypes = [wintypes.HWND, wintypes.UINT, wintypes.WPARAM, wintypes.LPARAM]
+        user32.CreateWindowExW.restype = wintypes.HWND
+        user32.CreateWindowExW.argtypes = [wintypes.DWORD, wintypes.LPCWSTR, wintypes.LPCWSTR, wintypes.DWORD,
+                                           ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                                           wintypes.HWND, wintypes.HMENU, wintypes.HINSTANCE, wintypes.LPVOID]
+        user32.PostMessageW.argtypes = [wintypes.HWND, wintypes.UINT, wintypes.WPARAM, wintypes.LPARAM]
+        user32.GetMessageW.argtypes = [ctypes.POINTER(wintypes.MSG), wintypes.HWND, wintypes.UINT, wintypes.UINT]
+        k32.GetModuleHandleW.restype = wintypes.HMODULE
+
+        def wndproc(hwnd, msg, wparam, lparam):
+            if msg == self.WM_DEVICECHANGE and wparam in (self.DBT_DEVICEARRIVAL, self.DBT_DEVICEREMOVECOMPLETE):
+                self._notify()
+            elif msg == self.WM_DESTROY:
+                user32.PostQuitMessage(0)
+                return 0
+            return user32.DefWindowProcW(hwnd, msg, wparam, lparam)
+
+        self._user32 = user32
+        self._wndproc = WNDPROC(wndproc)  # referentie vasthouden, anders ruimt GC de callback op
+        hinst = k32.GetModuleHandleW(None)
+        wc = WNDCLASSW()
+        wc.lpfnWndProc = self._wndproc
+        wc.hInstance = hinst
+        wc.lpszClassName = "SDKaartDriveWatcher"
+        if not user32.RegisterClassW(ctypes.byref(wc)):
+            raise ctypes.WinError(ctypes.get_last_error())
+        self._hwnd = user32.CreateWindowExW(0, wc.lpszClassName, "SDKaartDriveWatcher", 0,
+                                            0, 0, 0, 0, None, None, hinst, None)
+        if not self._hwnd:
+            raise ctypes.WinError(ctypes.get_last_error())
+
+    def _run(self):
+        from ctypes import wintypes
+        msg = wintypes.MSG()
+        byref = self._ctypes.byref
+        while self._user32.GetMessageW(byref(msg), None, 0, 0) > 0:
+            self._user32.TranslateMessage(byref(msg))
+            self._user32.DispatchMessageW(byref(msg))
+
+    def stop(self):
+        super().stop()
+        if getattr(self, "_hwnd", None):
+            self._user32.PostMessageW(self._hwnd, self.WM_CLOSE, 0, 0)
+
+
+def create_drive_watcher(on_change, backend="auto", poll_interval=DRIVE_POLL_INTERVAL):
+    """
+    Start de beste beschikbare drive-watcher: device-notificaties op Windows,
+    mountinfo-events op Linux, anders polling. `backend` kan 'auto', 'windows',
+    'mountinfo' of 'polling' zijn. Valt een event-backend uit, dan wordt gepolld.
+    """
+    candidates = []
+    if backend in ("auto", "windows") and os.name == "nt":
+        candidates.append(WindowsDeviceWatcher)
+    if backend in ("auto", "mountinfo") and sys.platform.startswith("linux"):
+        candidates.append(MountinfoDriveWatcher)
+    for cls in candidates:
+        try:
+            return cls(on_change).start()
+        except Exception:
+            continue
+    return PollingDriveWatcher(on_change, poll_interval).start()
+
+
+class DriveMonitor:
+    """
+    Houdt in een achtergrondthread een gecachte momentopname van de verwisselbare
+    drives bij. Bij elke trigger wordt eerst de goedkope psutil-partitielijst
+    vergeleken met de vorige; alleen als die veranderd is worden disk_usage (voor
+    nieuwe partities) en zo nodig wmic aangeroepen. on_change(drives) volgt alleen
+    bij een echte wijziging (of bij refresh(force=True)).
+    """
+
+    def __init__(self, on_change, full_rescan=DRIVE_FULL_RESCAN):
+        self.on_change = on_change
+        self.full_rescan = full_rescan
+        self.drives = []
+        self._partitions_key = None
+        self._usage_cache = {}
+        self._force = False
+        self._trigger = threading.Event()
+        self._stop = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True, name="DriveMonitor").start()
+        self.refresh(force=True)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._trigger.set()
+
+    def refresh(self, force=False):
+        """Vraag een herscan aan (thread-safe, keert direct terug)."""
+        if force:
+            self._force = True
+        self._trigger.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            # zonder events toch af en toe volledig herscannen (bijv. drives die alleen wmic ziet)
+            if not self._trigger.wait(self.full_rescan):
+                self._force = True
+            self._trigger.clear()
+            if self._stop.is_set():
+                break
+            force, self._force = self._force, False
+            try:
+                self._scan(force)
+            except Exception:
+                pass  # volgende trigger probeert het opnieuw
+
+    def _scan(self, force):
+        import psutil
+        partitions = psutil.disk_partitions(all=False)
+        key = tuple(sorted((p.device, p.mountpoint, p.fstype, p.opts) for p in partitions))
+        if key == self._partitions_key and not force:
+            return
+        self._partitions_key = key
+        if force:
+            self._usage_cache.clear()
         else:
-            self.after(0, self.log, f"❌  Formatteren van {drive} mislukt. Probeer als administrator.", "error")
-        self.after(0, self._reset_busy)
-
-    # ── Instellingen venster ───────────────────────────────────────────────────
-
-    def _open_settings(self):
-        win = ctk.CTkToplevel(self)
-        win.title("Instellingen — SD-kaart (doeldrive)")
-        win.geometry("500x520")
-        win.grab_set()
-        win.grid_columnconfigure(0, weight=1)
-        self._center_window(win, 500, 520)
-
-        ctk.CTkLabel(win, text="Instellingen voor de SD-kaart (doeldrive)",
-                     font=ctk.CTkFont(weight="bold"), anchor="w").grid(
-            row=0, column=0, padx=16, pady=(16, 10), sticky="w")
-
-        ctk.CTkLabel(win, text="Toegestane bestandsextensies op SD-kaart (komma-gescheiden):",
-                     anchor="w").grid(row=1, column=0, padx=16, pady=(4, 2), sticky="w")
-        ext_entry = ctk.CTkEntry(win, width=440)
-        ext_entry.insert(0, ", ".join(self.config.get("allowed_extensions", [])))
-        ext_entry.grid(row=2, column=0, padx=16, pady=2, sticky="ew")
-        ctk.CTkLabel(win, text="Laat leeg om alle extensies toe te staan op de SD-kaart.",
-                     text_color="gray60", font=ctk.CTkFont(size=11)).grid(
-            row=3, column=0, padx=16, pady=(0, 4), sticky="w")
-
-        ctk.CTkLabel(win, text="Maximum aantal bestanden op SD-kaart (veiligheidscheck):",
-                     anchor="w").grid(row=4, column=0, padx=16, pady=(12, 2), sticky="w")
-        max_entry = ctk.CTkEntry(win, width=120)
-        max_entry.insert(0, str(self.config.get("max_files", 100)))
-        max_entry.grid(row=5, column=0, padx=16, pady=2, sticky="w")
-        ctk.CTkLabel(win, text="Overschrijdt de SD-kaart dit aantal, wordt het proces geblokkeerd.",
-                     text_color="gray60", font=ctk.CTkFont(size=11)).grid(
-            row=6, column=0, padx=16, pady=(0, 4), sticky="w")
-
-        ctk.CTkLabel(win, text="Maximum grootte SD-kaart in GB (veiligheidscheck):",
-                     anchor="w").grid(row=7, column=0, padx=16, pady=(12, 2), sticky="w")
-        maxgb_entry = ctk.CTkEntry(win, width=120)
-        maxgb_entry.insert(0, str(self.config.get("max_drive_gb", 5.0)))
-        maxgb_entry.grid(row=8, column=0, padx=16, pady=2, sticky="w")
-        ctk.CTkLabel(win, text="Drives groter dan dit worden geblokkeerd (bijv. 5 voor max 5 GB).",
-                     text_color="gray60", font=ctk.CTkFont(size=11)).grid(
-            row=9, column=0, padx=16, pady=(0, 4), sticky="w")
-
-        subdirs_var = ctk.BooleanVar(value=self.config.get("allow_subdirs", False))
-        ctk.CTkSwitch(win, text="Submappen toestaan op SD-kaart (doeldrive)",
-                      variable=subdirs_var).grid(row=10, column=0, padx=16, pady=(16, 2), sticky="w")
-        ctk.CTkLabel(win, text="Uit = veiligheidscheck blokkeert als SD-kaart submappen bevat.",
-                     text_color="gray60", font=ctk.CTkFont(size=11)).grid(
-            row=11, column=0, padx=16, pady=(0, 4), sticky="w")
-
-        def save():
-            raw_exts = ext_entry.get().strip()
-            exts = [e.strip() for e in raw_exts.split(",") if e.strip()] if raw_exts else []
-            exts = [e if e.startswith(".") else f".{e}" for e in exts]
+            live = {(p.device, p.mountpoint, p.fstype) for p in partitions}
+            for k in list(self._usage_cache):
+                if k not in live:
+                    del self._usage_cache[k]
+
+        drives = _drives_from_partitions(partitions, self._usage_cache)
+        if not drives:
+            drives = _wmic_removable_drives()
+        if drives != self.drives or force:
+            self.drives = drives
+            self.on_change(list(drives))
+
+
+# ── Drive-providers ────────────────────────────────────────────────────────────
+
+class SystemDriveProvider:
+    """Echte verwisselbare drives: psutil/wmic, device-events en format.com.
+    Een provider levert drives, detectie en formatteren; de flash-pipeline praat
+    alleen via deze interface met de kaarten (zie sd_simulator voor nepkaarten)."""
+    name = "systeem"
+
+    def list_drives(self):
+        return get_removable_drives()
+
+    def monitor(self, on_change):
+        return DriveMonitor(on_change).start()
+
+    def watcher(self, on_refresh, backend="auto"):
+        return create_drive_watcher(on_refresh, backend=backend)
+
+    def format_drive(self, drive_letter, log_cb, drive_size_gb=None):
+        return format_drive(drive_letter, log_cb, drive_size_gb=drive_size_gb)
+
+    def wrap_progress(self, drive_letter, progress_cb):
+        return progress_cb
+
+    def group(self, drive_letter):
+        """Hub of controller waar de kaart achter zit (alleen Linux), of None."""
+        if not sys.platform.startswith("linux"):
+            return None  # Windows: groepering via SetupAPI niet geïmplementeerd, alles één groep
+        try:
+            import psutil
+            from sd_scheduler import usb_group
+            path = os.path.abspath(drive_letter)
+            device = next((p.device for p in psutil.disk_partitions(all=False) if p.mountpoint == path), None)
+            return usb_group(device) if device else None
+        except Exception:
+            return None
+
+    def stop(self):
+        pass
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def drive_provider(config):
+    """De drive-provider uit de config ("drive_provider"). Eén instantie per
+    instelling, zodat GUI, CLI en flash_drive dezelfde (nep)kaarten zien."""
+    kind = config.get("drive_provider", "system")
+    if kind != "sim":
+        kind = "system"
+    settings = tuple(config.get(k, DEFAULT_CONFIG[k]) for k in DEFAULT_CONFIG if k.startswith("sim_")) \
+        if kind == "sim" else ()
+    with _providers_lock:
+        provider = _providers.get((kind, settings))
+        if provider is None:
+            if kind == "sim":
+                from sd_simulator import SimulatedDriveProvider
+                provider = SimulatedDriveProvider(root=config.get("sim_root") or None,
+                                                  cards=int(config.get("sim_cards", 8)),
+                                                  size_gb=config.get("sim_size_gb", 1.0),
+                                                  write_mbps=config.get("sim_write_mbps", 0.0),
+                                                  latency_ms=config.get("sim_latency_ms", 0.0),
+                                                  failure_rate=config.get("sim_failure_rate", 0.0),
+                                                  backing=config.get("sim_backing", "dir"),
+                                                  script=config.get("sim_script") or None,
+                                                  hubs=int(config.get("sim_hubs", 1)),
+                                                  hub_mbps=config.get("sim_hub_mbps", 0.0),
+                                                  contention=config.get("sim_contention", 0.0))
+            else:
+                provider = SystemDriveProvider()
+            _providers[(kind, settings)] = provider
+        return provider
+
+
+def stop_providers():
+    """Stopt alle aangemaakte drive-providers; een simulatie ruimt daarbij haar
+    tijdelijke kaartenmap op."""
+    with _providers_lock:
+        providers = list(_providers.values())
+        _providers.clear()
+    for provider in providers:
+        provider.stop()
+
+
+_schedulers = {}
+
+
+def flash_scheduler(config):
+    """De gedeelde ConcurrencyController voor deze instellingen ("concurrency",
+    "concurrency_max"), zodat alle kaartthreads dezelfde plekken verdelen."""
+    from sd_scheduler import ConcurrencyController
+
+    concurrency = config.get("concurrency", 0)
+    adaptive = concurrency == "auto"
+    key = (0 if adaptive else int(concurrency or 0), int(config.get("concurrency_max", 8)), adaptive)
+    with _providers_lock:
+        scheduler = _schedulers.get(key)
+        if scheduler is None:
+            scheduler = _schedulers[key] = ConcurrencyController(fixed=key[0], max_limit=key[1], adaptive=adaptive)
+        return scheduler
+
+
+# ── Versie-index ───────────────────────────────────────────────────────────────
+
+def load_cached_versions(source_dir, cache_path=VERSION_CACHE_FILE):
+    """Laatst bekende versielijst van deze bronmap uit de lokale cache, zonder de share
+    aan te raken. Geeft (versies, pad van versions.json) of ({}, None)."""
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            entry = json.load(f).get(os.path.abspath(source_dir))
+    except (OSError, ValueError):
+        return {}, None
+    if not entry:
+        return {}, None
+    return entry.get("versions", {}), Path(entry["json_path"]) if entry.get("json_path") else None
+
+
+def save_cached_versions(source_dir, versions, json_path, cache_path=VERSION_CACHE_FILE):
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    cache[os.path.abspath(source_dir)] = {"versions": versions, "json_path": str(json_path) if json_path else None}
+    try:
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=1, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+
+
+class VersionMonitor:
+    """
+    Houdt de versielijst van een bronmap bij in een achtergrondthread. Elke
+    VERSION_POLL_INTERVAL seconden worden alleen de mtimes van de bronmap en van
+    versions.json opgevraagd (twee stats); alleen als die veranderd zijn wordt de map
+    opnieuw gescand. on_change(versies, pad van versions.json) volgt alleen bij een
+    echte wijziging; de lijst wordt ook lokaal gecachet voor de volgende start.
+    Is de bronmap even onbereikbaar, dan blijft de laatst bekende lijst staan.
+    """
+
+    def __init__(self, source_dir, on_change, interval=VERSION_POLL_INTERVAL,
+                 full_rescan=VERSION_FULL_RESCAN, cache_path=VERSION_CACHE_FILE, log_cb=None):
+        self.source_dir = source_dir
+        self.on_change = on_change
+        self.log_cb = log_cb or (lambda m, k="info": None)
+        self.interval = interval
+        self.full_rescan = full_rescan
+        self.cache_path = cache_path
+        self.versions, self.json_path = load_cached_versions(source_dir, cache_path)
+        self._stamp = None
+        self._last_scan = 0.0
+        self._unreachable = False
+        self._trigger = threading.Event()
+        self._stop = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True, name="VersionMonitor").start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._trigger.set()
+
+    def refresh(self):
+        """Vraag een volledige herscan aan (thread-safe, keert direct terug)."""
+        self._stamp = None
+        self._trigger.set()
+
+    def _source_stamp(self):
+        stamps = []
+        for path in (self.source_dir, os.path.join(self.source_dir, "versions.json")):
             try:
-                max_f = int(max_entry.get())
-            except ValueError:
-                max_f = 100
+                stamps.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                stamps.append(None)
+        return tuple(stamps)
+
+    def _run(self):
+        while not self._stop.is_set():
             try:
-                max_gb = float(maxgb_entry.get())
-            except ValueError:
-                max_gb = 5.0
+                self._poll()
+            except Exception:
+                pass  # share even weg: volgende ronde opnieuw
+            self._trigger.wait(self.interval)
+            self._trigger.clear()
+
+    def _poll(self):
+        stamp = self._source_stamp()
+        if stamp[0] is None:
+            # share even weg: laatst bekende lijst houden, niet leegmaken
+            if not self._unreachable:
+                self._unreachable = True
+                self.log_cb(f"⚠️   Bronmap {self.source_dir} is niet bereikbaar — laatst bekende versielijst "
+                            "blijft staan.", "warning")
+            return
+        if self._unreachable:
+            self._unreachable = False
+            self.log_cb(f"🔌  Bronmap {self.source_dir} is weer bereikbaar.", "info")
+        due = time.monotonic() - self._last_scan >= self.full_rescan
+        if stamp == self._stamp and not due:
+            return
+        versions, json_path = load_versions_json(self.source_dir, present_only=True)
+        self._last_scan = time.monotonic()
+        self._stamp = self._source_stamp()  # na het scannen: load_versions_json kan versions.json herschrijven
+        if versions != self.versions or json_path != self.json_path:
+            self.versions, self.json_path = versions, json_path
+            if json_path is not None:
+                save_cached_versions(self.source_dir, versions, json_path, self.cache_path)
+            self.on_change(dict(versions), json_path)
+
+
+# ── Headless CLI ───────────────────────────────────────────────────────────────
+
+def _cli_logger(journal=None):
+    """Thread-safe logfunctie voor de CLI (fouten naar stderr), optioneel ook naar
+    het persistente JSONL-log."""
+    lock = threading.Lock()
+
+    def log(message, kind="info", drive=None):
+        ts = datetime.now().strftime("%H:%M:%S")
+        prefix = f"[{drive}]  " if drive else ""
+        with lock:
+            print(f"[{ts}]  {prefix}{message}", file=sys.stderr if kind == "error" else sys.stdout, flush=True)
+        if journal:
+            journal.write(message, kind, drive=drive, source="cli")
+    return log
 
-            self.config["allowed_extensions"] = exts
-            self.config["max_files"] = max_f
-            self.config["max_drive_gb"] = max_gb
-            self.config["allow_subdirs"] = subdirs_var.get()
-            save_config(self.config)
-            win.destroy()
-            self.log("⚙️   Instellingen opgeslagen.", "info")
 
-        ctk.CTkButton(win, text="Opslaan", command=save).grid(
-            row=12, column=0, padx=16, pady=20, sticky="e")
+def _cli_progress_cb(log, interval=2.0):
+    """Voortgang als logregel, hooguit eens per `interval` seconden."""
+    last = [0.0]
 
-    # ── Config opslaan ────────────────────────────────────────────────────────
+    def cb(event):
+        now = time.monotonic()
+        if now - last[0] < interval and event["done"] < event["total"]:
+            return
+        last[0] = now
+        pct = 100 * event["done"] / event["total"] if event["total"] else 100
+        eta = f", nog {event['eta']:.0f} s" if event["eta"] else ""
+        log(f"⏳  {pct:.0f}%  {event['mbps']:.1f} MB/s{eta}  {event['current']}", "info")
+    return cb
+
+
+def _cli_flash(drive, version, src, config, log, drive_size_gb=None):
+    drive_log = lambda m, k="info": log(m, k, drive=drive)  # noqa: E731
+    ok = flash_drive(drive, version, src, config, drive_log,
+                     progress_cb=_cli_progress_cb(drive_log), drive_size_gb=drive_size_gb)
+    drive_log("✅  Klaar." if ok else "❌  Mislukt.", "success" if ok else "error")
+    return ok
+
+
+def _cli_config(args):
+    """Config-bestand laden en CLI-opties eroverheen leggen."""
+    config = load_config(args.config)
+    if getattr(args, "source", None):
+        config["source_dir"] = args.source
+    for key in ("sync_mode", "verify_writes", "copy_engine", "image_mode", "wipe_strategy", "staging_dir",
+                "probe_cards", "concurrency", "sim_cards", "sim_write_mbps", "sim_script", "sim_root"):
+        value = getattr(args, key, None)
+        if value is not None:
+            config[key] = value
+    if getattr(args, "sim_cards", None):
+        config["drive_provider"] = "sim"
+    return config
+
+
+def _flash_on_insert(version, src, config, log, count=None, only=None):
+    """Wacht op kaarten en flasht elke nieuw geplaatste kaart in een eigen thread."""
+    lock = threading.Lock()
+    done = threading.Event()
+    known = set()
+    busy = set()
+    results = []
+
+    def worker(drive, size_gb):
+        ok = _cli_flash(drive, version, src, config, log, drive_size_gb=size_gb)
+        with lock:
+            busy.discard(drive)
+            results.append(ok)
+            if count and len(results) >= count:
+                done.set()
+
+    def on_change(drives):
+        current = {d[0]: d[2] for d in drives}
+        with lock:
+            new = [d for d in sorted(current) if d not in known and d not in busy and (not only or d in only)]
+            known.clear()
+            known.update(current)  # verwijderde kaarten vergeten, zodat terugplaatsen opnieuw flasht
+            for d in new:
+                if count and len(busy) + len(results) >= count:
+                    break
+                log(f"🔌  Nieuwe drive gevonden: {d}", "info")
+                busy.add(d)
+                threading.Thread(target=worker, args=(d, current[d]), daemon=True).start()
+
+    provider = drive_provider(config)
+    monitor = provider.monitor(on_change)
+    watcher = provider.watcher(monitor.refresh, backend=config.get("drive_watcher", "auto"))
+    log(f"⏳  Wachten op SD-kaarten via {watcher.name}... (Ctrl+C om te stoppen)", "info")
+    try:
+        while not done.wait(0.5):
+            pass
+    except KeyboardInterrupt:
+        log("Gestopt.", "warning")
+    finally:
+        watcher.stop()
+        monitor.stop()
+    return 0 if results and all(results) else 1
 
-    def _save_config(self):
-        self.config["auto_start"] = self.auto_var.get()
-        save_config(self.config)
+
+def cmd_flash(args):
+    config = _cli_config(args)
+    journal = open_log(config)
+    try:
+        return _cmd_flash(args, config, _cli_logger(journal))
+    finally:
+        stop_providers()
+        if journal:
+            journal.stop()
+
+
+def _cmd_flash(args, config, log):
+    src = config.get("source_dir", "")
+    if not src or not os.path.isdir(src):
+        log("❌  Hoofdmap niet ingesteld of niet gevonden (gebruik --source).", "error")
+        return 2
+    versions, _ = load_versions_json(src)
+    version = args.version or config.get("last_version", "")
+    if version not in versions:
+        log(f"❌  Onbekende versie: {version or '—'}. Beschikbaar: {', '.join(versions) or 'geen'}", "error")
+        return 2
+
+    if args.wait_for_cards:
+        return _flash_on_insert(version, src, config, log, count=args.count, only=set(args.drive or []))
+
+    sizes = {d[0]: d[2] for d in drive_provider(config).list_drives()}
+    targets = args.drive or (sorted(sizes) if args.all else [])
+    if not targets:
+        log("❌  Geen drive opgegeven (gebruik --drive, --all of --wait-for-cards).", "error")
+        return 2
+    # alleen gevonden verwisselbare drives (of een imagebestand in image-modus), tenzij expliciet anders
+    unlisted = [d for d in targets if d not in sizes
+                and not (config.get("image_mode") and os.path.isfile(d))]
+    if unlisted and not args.allow_unlisted:
+        log(f"❌  Geen verwisselbare drive: {', '.join(unlisted)}. Gevonden: {', '.join(sizes) or 'geen'} "
+            "(gebruik --allow-unlisted om toch te schrijven).", "error")
+        return 2
+
+    results = {}
+    threads = [threading.Thread(target=lambda d=d: results.__setitem__(
+        d, _cli_flash(d, version, src, config, log, drive_size_gb=sizes.get(d))), daemon=True) for d in targets]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return 0 if all(results.get(d) for d in targets) else 1
+
+
+def cmd_versions(args):
+    config = _cli_config(args)
+    src = config.get("source_dir", "")
+    if not src or not os.path.isdir(src):
+        print("Hoofdmap niet ingesteld of niet gevonden (gebruik --source).", file=sys.stderr)
+        return 2
+    versions, _ = load_versions_json(src)
+    for name, info in versions.items():
+        extra = "  ".join(p for p in (info.get("omschrijving", ""), info.get("functie", "")) if p)
+        print(f"{name}\t{extra}" if extra else name)
+    return 0
+
+
+def cmd_history(args):
+    from sd_history import History, PHASE_LABELS, export_csv, export_prometheus
+
+    config = load_config(args.config)
+    path = config.get("history_db", HISTORY_DB)
+    if not path or not os.path.exists(path):
+        print("Nog geen historie gevonden.", file=sys.stderr)
+        return 1
+    history = History(path)
+    filters = {"since": time.time() - args.days * 86400 if args.days else None,
+               "version": args.version, "drive": args.drive}
+    if args.csv:
+        print(f"{export_csv(history, args.csv, **filters)} job(s) geëxporteerd naar {args.csv}")
+    if args.prometheus:
+        export_prometheus(history, args.prometheus, **filters)
+        print(f"Prometheus-metrics geschreven naar {args.prometheus}")
+    if not (args.csv or args.prometheus):
+        for r in history.phase_summary(**filters):
+            mbps = r["bytes"] / r["seconds"] / 1024 ** 2 if r["bytes"] and r["seconds"] else 0.0
+            speed = f"  gem. {mbps:.1f} MB/s, traagst {r['min_mbps']:.1f} MB/s" if r["min_mbps"] else ""
+            failed = f"  ({r['failed']} mislukt)" if r["failed"] else ""
+            print(f"{r['drive']}\t{PHASE_LABELS.get(r['phase'], r['phase']):<15} {r['count']:>4}x  "
+                  f"gem. {r['seconds'] / r['count']:.2f} s{speed}{failed}")
+    return 0
+
+
+def cmd_drives(args):
+    for letter, label, _size in drive_provider(_cli_config(args)).list_drives():
+        print(label)
+    return 0
+
+
+def _parallel_arg(value):
+    if value == "auto":
+        return value
+    try:
+        return max(0, int(value))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"verwacht een aantal of 'auto', niet '{value}'")
+
+
+def _add_sim_arguments(p):
+    g = p.add_argument_group("simulatie", "nepkaarten in plaats van echte drives (load-tests)")
+    g.add_argument("--simulate", dest="sim_cards", type=int, metavar="N", help="N gesimuleerde kaarten")
+    g.add_argument("--sim-mbps", dest="sim_write_mbps", type=float, metavar="MB/S",
+                   help="schrijfsnelheid per nepkaart (0 = onbeperkt)")
+    g.add_argument("--sim-script", dest="sim_script", metavar="BESTAND", help="script met plaats/verwijder-momenten")
+    g.add_argument("--sim-root", dest="sim_root", metavar="MAP", help="map voor de nepkaarten")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="sd_manager",
+        description="SD Kaart Manager. Zonder commando start de GUI.")
+    parser.add_argument("--config", default=CONFIG_FILE, help="pad naar het config-bestand")
+    sub = parser.add_subparsers(dest="command")
+
+    sub.add_parser("gui", help="start de grafische interface")
+
+    p = sub.add_parser("flash", help="schrijf een versie naar één of meer SD-kaarten")
+    p.add_argument("--version", help="versie (submap van de bronmap); standaard de laatst gekozen")
+    p.add_argument("--source", help="bronmap met versies; standaard uit het config-bestand")
+    p.add_argument("--drive", action="append", help="doeldrive, bijv. E: (meerdere keren mogelijk)")
+    p.add_argument("--all", action="store_true", help="alle gevonden verwisselbare drives tegelijk")
+    p.add_argument("--allow-unlisted", action="store_true",
+                   help="ook naar een --drive schrijven die niet als verwisselbare drive gevonden is")
+    p.add_argument("--wait-for-cards", action="store_true", help="wacht op kaarten en flash elke nieuwe kaart")
+    p.add_argument("--count", type=int, help="stop na dit aantal kaarten (met --wait-for-cards)")
+    p.add_argument("--sync", dest="sync_mode", action="store_const", const=True, help="differentieel synchroniseren")
+    p.add_argument("--verify", dest="verify_writes", action="store_const", const=True, help="geschreven bestanden verifiëren")
+    p.add_argument("--engine", dest="copy_engine", choices=["auto", "kernel", "pipeline"], help="kopieerroute")
+    p.add_argument("--image", dest="image_mode", action="store_const", const=True,
+                   help="versie als FAT32-image raw schrijven (drive, device of imagebestand)")
+    p.add_argument("--wipe", dest="wipe_strategy", choices=["auto", "delete", "quickformat", "discard"],
+                   help="manier van leegmaken vóór het kopiëren")
+    p.add_argument("--probe", dest="probe_cards", action="store_const", const=True,
+                   help="kaarttest (capaciteit en snelheid) vóór het schrijven; neppe kaarten weigeren")
+    p.add_argument("--staging", dest="staging_dir", metavar="MAP",
+                   help="versie eerst naar deze lokale map kopiëren (voor een bronmap op een share)")
+    p.add_argument("--parallel", dest="concurrency", type=_parallel_arg, metavar="N|auto",
+                   help="vast aantal kaarten tegelijk per hub/lezer, of 'auto' voor adaptief "
+                        "(standaard geen limiet)")
+    _add_sim_arguments(p)
+    p.set_defaults(func=cmd_flash)
+
+    p = sub.add_parser("versions", help="toon de beschikbare versies")
+    p.add_argument("--source", help="bronmap met versies")
+    p.set_defaults(func=cmd_versions)
+
+    p = sub.add_parser("drives", help="toon de gevonden verwisselbare drives")
+    _add_sim_arguments(p)
+    p.set_defaults(func=cmd_drives)
+
+    p = sub.add_parser("history", help="tijden per fase uit de historie tonen of exporteren")
+    p.add_argument("--days", type=float, help="alleen de laatste N dagen")
+    p.add_argument("--version", help="alleen deze versie")
+    p.add_argument("--drive", help="alleen deze drive/lezer")
+    p.add_argument("--csv", help="exporteer één regel per job naar dit CSV-bestand")
+    p.add_argument("--prometheus", help="schrijf samenvattingen als Prometheus-tekstbestand")
+    p.set_defaults(func=cmd_history)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # als script gestart: GUI en sd_simulator moeten dezelfde module-instantie gebruiken
+    sys.modules.setdefault("sd_manager", sys.modules[__name__])
+    if args.command in (None, "gui"):
+        from sd_manager_gui import run
+        run(args.config)
+        return 0
+    return args.func(args)
 
 
 # ── Entry point ───────────────────────────────────────────────────────────────
 
 if __name__ == "__main__":
-    app = App()
-    app.mainloop()
\ No newline at end of file
+    sys.exit(main())
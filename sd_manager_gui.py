@@ -0,0 +1,853 @@
+"""GUI van de SD Kaart Manager. Wordt pas geïmporteerd als de GUI gestart wordt,
+zodat de CLI zonder customtkinter/tkinter opstart."""
+import customtkinter as ctk
+from tkinter import filedialog
+import json
+import os
+import queue
+import threading
+from datetime import datetime
+
+from sd_manager import (
+    CONFIG_FILE,
+    VersionMonitor,
+    card_identity,
+    drive_provider,
+    flash_drive,
+    format_bytes,
+    load_config,
+    open_jobs,
+    open_log,
+    prepare_version,
+    save_config,
+)
+
+LOG_FLUSH_MS = 100      # logpaneel hooguit zo vaak bijwerken
+LOG_MAX_LINES = 1000    # oudere regels vallen uit het logpaneel (staan wel in het logbestand)
+
+# ── Thema ──────────────────────────────────────────────────────────────────────
+ctk.set_appearance_mode("dark")
+ctk.set_default_color_theme("blue")
+
+
+# ── Hoofd applicatie ───────────────────────────────────────────────────────────
+
+class App(ctk.CTk):
+    def __init__(self, config_path=CONFIG_FILE):
+        super().__init__()
+        self.title("SD Kaart Overschrijven")
+        self.geometry("780x660")
+        self.resizable(False, False)
+
+        self.config_path = config_path
+        self.config = load_config(config_path)
+        self.config["auto_start"] = False  # altijd uit bij opstarten
+        self.versions_data = {}
+        self.versions_json_path = None
+        self.drive_provider = drive_provider(self.config)   # echte kaarten of simulatie
+        self.drive_watcher = None
+        self.drive_monitor = None
+        self.version_monitor = None
+        self.known_drives = set()
+        self._busy_drives = set()   # drives waar nu een thread op werkt
+        self._drive_status = {}     # drive letter -> statustekst
+        self._drive_progress = {}   # drive letter -> laatste voortgangsmelding
+        self._card_ids = {}         # drive letter -> card_identity, op de achtergrond bepaald
+        self._log_queue = queue.SimpleQueue()
+        self._log_lines = 0
+        self.journal = open_log(self.config)
+        self.jobs = open_jobs(self.config)   # wachtrij van kaarten, overleeft een herstart
+
+        self._build_ui()
+        self._recover_jobs()
+        self._load_source_if_set()
+        self._start_drive_watcher()
+        self._center_window(self, 780, 660)
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+        self.after(LOG_FLUSH_MS, self._flush_log)
+
+    def _center_window(self, win, width, height):
+        """Centreert een venster op het scherm."""
+        win.update_idletasks()
+        sw = win.winfo_screenwidth()
+        sh = win.winfo_screenheight()
+        x = (sw - width) // 2
+        y = (sh - height) // 2
+        win.geometry(f"{width}x{height}+{x}+{y}")
+
+    # ── UI opbouw ──────────────────────────────────────────────────────────────
+
+    def _build_ui(self):
+        self.grid_columnconfigure(0, weight=1)
+
+        # ── Titel ──
+        ctk.CTkLabel(self, text="SD Kaart Overschrijven", font=ctk.CTkFont(size=22, weight="bold")).grid(
+            row=0, column=0, pady=(12, 2), sticky="ew")
+
+        # ── Bronmap sectie ──
+        src_frame = ctk.CTkFrame(self)
+        src_frame.grid(row=1, column=0, padx=20, pady=3, sticky="ew")
+        src_frame.grid_columnconfigure(1, weight=1)
+
+        ctk.CTkLabel(src_frame, text="Bronmap:", width=100, anchor="w").grid(row=0, column=0, padx=12, pady=10)
+        self.src_label = ctk.CTkLabel(src_frame, text=self.config["source_dir"] or "— nog niet gekozen —",
+                                      anchor="w", wraplength=480)
+        self.src_label.grid(row=0, column=1, padx=8, pady=10, sticky="ew")
+        ctk.CTkButton(src_frame, text="Kiezen", width=90, command=self._choose_source).grid(
+            row=0, column=2, padx=12, pady=10)
+
+        # ── Versie dropdown ──
+        ver_frame = ctk.CTkFrame(self)
+        ver_frame.grid(row=2, column=0, padx=20, pady=3, sticky="ew")
+        ver_frame.grid_columnconfigure(1, weight=1)
+
+        ctk.CTkLabel(ver_frame, text="Schrijf versie:", width=100, anchor="w").grid(row=0, column=0, padx=12, pady=10)
+        self.version_var = ctk.StringVar(value="— kies versie om naar SD-kaart te schrijven —")
+        self.version_menu = ctk.CTkOptionMenu(ver_frame, variable=self.version_var,
+                                               values=["— kies versie om naar SD-kaart te schrijven —"],
+                                               command=self._on_version_change)
+        self.version_menu.grid(row=0, column=1, padx=8, pady=10, sticky="ew")
+        ctk.CTkButton(ver_frame, text="Info bewerken", width=110, command=self._edit_version_info).grid(
+            row=0, column=2, padx=12, pady=10)
+
+        # ── Versie info ──
+        self.ver_info_label = ctk.CTkLabel(self, text="", anchor="w", wraplength=720,
+                                            text_color="gray70", font=ctk.CTkFont(size=12))
+        self.ver_info_label.grid(row=3, column=0, padx=24, pady=(0, 4), sticky="ew")
+
+        # ── Drive sectie ──
+        drv_frame = ctk.CTkFrame(self)
+        drv_frame.grid(row=4, column=0, padx=20, pady=3, sticky="ew")
+        drv_frame.grid_columnconfigure(1, weight=1)
+
+        ctk.CTkLabel(drv_frame, text="Doeldrive\n(SD-kaart):", width=100, anchor="w").grid(row=0, column=0, padx=12, pady=10)
+        self.drive_var = ctk.StringVar(value="— geen verwisselbare SD-kaart gevonden —")
+        self.drive_menu = ctk.CTkOptionMenu(drv_frame, variable=self.drive_var, values=["— geen verwisselbare SD-kaart gevonden —"],
+                                             command=self._on_drive_change)
+        self.drive_menu.grid(row=0, column=1, padx=8, pady=10, sticky="ew")
+        ctk.CTkButton(drv_frame, text="↻", width=40, command=self._refresh_drives).grid(
+            row=0, column=2, padx=4, pady=10)
+
+        # ── Status per kaart ──
+        self.drive_status_label = ctk.CTkLabel(self, text="", anchor="w", wraplength=720,
+                                                text_color="gray70", font=ctk.CTkFont(size=12))
+        self.drive_status_label.grid(row=5, column=0, padx=24, pady=(0, 2), sticky="ew")
+
+        # ── Rij 1: Start overschrijven + auto-start switch ──
+        row1_frame = ctk.CTkFrame(self)
+        row1_frame.grid(row=6, column=0, padx=20, pady=(6, 3), sticky="ew")
+        row1_frame.grid_columnconfigure(0, weight=1)
+
+        self.start_btn = ctk.CTkButton(row1_frame, text="▶  Start overschrijven", height=42,
+                                        font=ctk.CTkFont(size=15, weight="bold"),
+                                        command=self._start_process)
+        self.start_btn.grid(row=0, column=0, padx=(12, 8), pady=10, sticky="ew")
+
+        # Voortgang onder de startknop zolang er kaarten bezig zijn; de knop blijft
+        # bruikbaar voor kaarten die nog vrij zijn
+        self.progress_frame = ctk.CTkFrame(row1_frame, fg_color="transparent", height=42)
+        self.progress_frame.grid(row=1, column=0, columnspan=3, padx=(12, 16), pady=(0, 10), sticky="ew")
+        self.progress_frame.grid_columnconfigure(0, weight=1)
+        self.progress_bar = ctk.CTkProgressBar(self.progress_frame, height=14)
+        self.progress_bar.grid(row=0, column=0, sticky="ew", pady=(4, 2))
+        self.progress_bar.set(0)
+        self.progress_label = ctk.CTkLabel(self.progress_frame, text="", anchor="w",
+                                           font=ctk.CTkFont(size=11), text_color="gray70")
+        self.progress_label.grid(row=1, column=0, sticky="ew")
+        self.progress_frame.grid_remove()
+
+        self.multi_var = ctk.BooleanVar(value=self.config.get("multi_drive", False))
+        ctk.CTkSwitch(row1_frame, text="Alle kaarten\ntegelijk",
+                      variable=self.multi_var, command=self._on_multi_toggle).grid(
+            row=0, column=1, padx=4, pady=10, sticky="e")
+
+        self.auto_var = ctk.BooleanVar(value=self.config["auto_start"])
+        ctk.CTkSwitch(row1_frame, text="Automatisch starten\nbij drive detectie",
+                      variable=self.auto_var, command=self._on_auto_toggle).grid(
+            row=0, column=2, padx=(4, 16), pady=10, sticky="e")
+
+        # ── Rij 2: Formateer knop + corrupt-switch ──
+        row2_frame = ctk.CTkFrame(self)
+        row2_frame.grid(row=7, column=0, padx=20, pady=(3, 6), sticky="ew")
+        row2_frame.grid_columnconfigure(0, weight=1)
+
+        self.format_btn = ctk.CTkButton(row2_frame, text="🗂  Formatteer geselecteerde drive", height=38,
+                                         fg_color="gray30", hover_color="#b45309",
+                                         font=ctk.CTkFont(size=13),
+                                         command=self._format_selected_drive)
+        self.format_btn.grid(row=0, column=0, padx=(12, 8), pady=10, sticky="ew")
+
+        self.auto_format_var = ctk.BooleanVar(value=self.config.get("auto_format_corrupt", False))
+        self.auto_format_switch = ctk.CTkSwitch(row2_frame, text="Automatisch formatteren\nbij corrupte SD-kaart",
+                                                  variable=self.auto_format_var,
+                                                  command=self._on_auto_format_toggle)
+        self.auto_format_switch.grid(row=0, column=1, padx=(4, 16), pady=10, sticky="e")
+        self._update_auto_format_switch_state()
+
+        # ── Log venster ──
+        log_frame = ctk.CTkFrame(self)
+        log_frame.grid(row=8, column=0, padx=20, pady=(4, 6), sticky="ew")
+        log_frame.grid_columnconfigure(0, weight=1)
+
+        ctk.CTkLabel(log_frame, text="Meldingen", anchor="w",
+                     font=ctk.CTkFont(weight="bold")).grid(row=0, column=0, padx=12, pady=(8, 2), sticky="w")
+        self.log_box = ctk.CTkTextbox(log_frame, height=130, state="disabled",
+                                       font=ctk.CTkFont(family="Consolas", size=12))
+        self.log_box.grid(row=1, column=0, padx=12, pady=(0, 12), sticky="ew")
+
+        # kleurtags instellen via onderliggende tk widget
+        self.log_box._textbox.tag_config("success", foreground="#4ade80")
+        self.log_box._textbox.tag_config("warning", foreground="#facc15")
+        self.log_box._textbox.tag_config("error", foreground="#f87171")
+        self.log_box._textbox.tag_config("info", foreground="#93c5fd")
+
+        # ── Instellingen knop ──
+        ctk.CTkButton(self, text="⚙  Instellingen", fg_color="gray30", hover_color="gray40",
+                      command=self._open_settings).grid(row=9, column=0, padx=20, pady=(0, 28), sticky="e")
+
+    # ── Logging ───────────────────────────────────────────────────────────────
+
+    def log(self, message, kind="info", drive=None):
+        """Thread-safe: zet de melding in de queue voor het logpaneel en het logbestand."""
+        ts = datetime.now().strftime("%H:%M:%S")
+        prefix = f"[{drive}]  " if drive else ""
+        self._log_queue.put((f"[{ts}]  {prefix}{message}\n", kind))
+        if self.journal:
+            self.journal.write(message, kind, drive=drive)
+
+    def _flush_log(self):
+        """Voegt alle wachtende meldingen in één keer toe en houdt het paneel begrensd."""
+        chunks = []
+        try:
+            while True:
+                chunks.extend(self._log_queue.get_nowait())
+        except queue.Empty:
+            pass
+        if chunks:
+            textbox = self.log_box._textbox
+            self.log_box.configure(state="normal")
+            textbox.insert("end", *chunks)
+            self._log_lines += sum(text.count("\n") for text in chunks[::2])  # meldingen kunnen meerdere regels hebben
+            if self._log_lines > LOG_MAX_LINES:
+                textbox.delete("1.0", f"{self._log_lines - LOG_MAX_LINES + 1}.0")
+                self._log_lines = LOG_MAX_LINES
+            textbox.see("end")
+            self.log_box.configure(state="disabled")
+        self.after(LOG_FLUSH_MS, self._flush_log)
+
+    def _on_close(self):
+        for stopper in (self.drive_watcher, self.drive_monitor, self.drive_provider, self.version_monitor,
+                        self.journal):
+            if stopper:
+                stopper.stop()
+        self.destroy()
+
+    # ── Drive detectie ─────────────────────────────────────────────────────────
+
+    def _start_drive_watcher(self):
+        """Enumeratie en drive-events draaien in achtergrondthreads; de Tk-thread
+        krijgt alleen wijzigingen binnen via after()."""
+        self.drive_monitor = self.drive_provider.monitor(
+            lambda drives: self.after(0, self._on_drives_changed, drives))
+        self.drive_watcher = self.drive_provider.watcher(self.drive_monitor.refresh,
+                                                         backend=self.config.get("drive_watcher", "auto"))
+        self.log(f"🔎  Drive-detectie via {self.drive_watcher.name}.", "info")
+
+    def _on_drives_changed(self, current_drives):
+        current = set(d[0] for d in current_drives)
+        new_drives = current - self.known_drives
+        removed_drives = self.known_drives - current
+        self._refresh_drives(current_drives)
+
+        if new_drives:
+            for d in new_drives:
+                self.log(f"🔌  Nieuwe drive gevonden: {d}", "info")
+                self._resolve_card(d)
+            if self.auto_var.get():
+                if self.jobs is not None:
+                    for d in sorted(new_drives):
+                        self._enqueue_drive(d)
+                    self._dispatch_queue()
+                elif self.multi_var.get():
+                    for d in sorted(new_drives):
+                        self._start_drive(d)
+                elif self._get_selected_drive() not in self._busy_drives:
+                    self._start_process()
+
+        if removed_drives:
+            for d in removed_drives:
+                self.log(f"📤  Drive verwijderd: {d}", "warning")
+                self._card_ids.pop(d, None)
+                if self.jobs is not None and self.jobs.cancel(d):
+                    self.log(f"📥  {d} uit de wachtrij gehaald.", "info")
+
+        # Alleen updaten als er iets veranderd is
+        if new_drives or removed_drives:
+            self._update_auto_format_switch_state()
+
+        self.known_drives = current
+
+    def _refresh_drives(self, drives=None):
+        if drives is None:
+            # handmatige ververs-knop: volledige herscan op de achtergrond
+            self.drive_monitor.refresh(force=True)
+            return
+        current_selection = self.drive_var.get()
+        if drives:
+            labels = [d[1] for d in drives]
+            letters = [d[0] for d in drives]
+            sizes = [d[2] for d in drives]
+            self.drive_menu.configure(values=labels)
+            self._drive_map = dict(zip(labels, letters))
+            self._drive_size_map = dict(zip(labels, sizes))
+            self._letter_size_map = dict(zip(letters, sizes))
+            # Bewaar huidige selectie als die nog bestaat, anders eerste
+            if current_selection in labels:
+                self.drive_var.set(current_selection)
+            else:
+                self.drive_var.set(labels[0])
+        else:
+            self.drive_menu.configure(values=["— geen verwisselbare SD-kaart gevonden —"])
+            self.drive_var.set("— geen verwisselbare SD-kaart gevonden —")
+            self._drive_map = {}
+            self._drive_size_map = {}
+            self._letter_size_map = {}
+        # statussen van verdwenen kaarten opruimen
+        present = set(getattr(self, "_letter_size_map", {}))
+        for d in list(self._drive_status):
+            if d not in present and d not in self._busy_drives:
+                del self._drive_status[d]
+        self._update_drive_status_label()
+        self._update_busy_ui()
+
+    def _on_drive_change(self, choice):
+        self._update_busy_ui()
+        self._update_auto_format_switch_state()
+
+    def _get_selected_drive(self):
+        return getattr(self, "_drive_map", {}).get(self.drive_var.get(), None)
+
+    def _get_selected_drive_size(self):
+        return getattr(self, "_drive_size_map", {}).get(self.drive_var.get(), None)
+
+    # ── Bronmap ───────────────────────────────────────────────────────────────
+
+    def _choose_source(self):
+        folder = filedialog.askdirectory(title="Kies de hoofdmap met versies")
+        if folder:
+            self.config["source_dir"] = folder
+            save_config(self.config, self.config_path)
+            self.src_label.configure(text=folder)
+            self._load_source_if_set()
+
+    def _load_source_if_set(self):
+        """Vult de versielijst direct uit de lokale cache en laat een achtergrondthread
+        de bronmap scannen en bijhouden; de UI-thread raakt de share niet aan."""
+        if self.version_monitor:
+            self.version_monitor.stop()
+            self.version_monitor = None
+        src = self.config.get("source_dir", "")
+        if not src:
+            return
+        self.version_monitor = VersionMonitor(src, lambda versions, path: self.after(
+            0, self._apply_versions, src, versions, path), log_cb=self.log)
+        if self.version_monitor.versions:
+            self._apply_versions(src, self.version_monitor.versions, self.version_monitor.json_path)
+        else:
+            self.version_menu.configure(values=["— versies laden... —"])
+            self.version_var.set("— versies laden... —")
+        self.version_monitor.start()
+
+    def _apply_versions(self, src, versions, json_path):
+        if src != self.config.get("source_dir", ""):
+            return  # melding van een eerder gekozen bronmap
+        self.versions_data, self.versions_json_path = versions, json_path
+        names = list(versions.keys())
+        if not names:
+            self.version_menu.configure(values=["— geen submappen gevonden —"])
+            self.version_var.set("— geen submappen gevonden —")
+            return
+        self.version_menu.configure(values=names)
+        current = self.version_var.get()
+        if current in names:
+            self._on_version_change(current)  # beschrijving kan gewijzigd zijn
+            return
+        # herstel laatste versie, of val terug op eerste
+        last = self.config.get("last_version", "")
+        selected = last if last in names else names[0]
+        self.version_var.set(selected)
+        self._on_version_change(selected)
+
+    def _on_version_change(self, choice):
+        # Onthoud de gekozen versie
+        if choice in self.versions_data:
+            self.config["last_version"] = choice
+            save_config(self.config, self.config_path)
+        info = self.versions_data.get(choice, {})
+        omschr = info.get("omschrijving", "")
+        functie = info.get("functie", "")
+        parts = []
+        if omschr:
+            parts.append(omschr)
+        if functie:
+            parts.append(f"Functie: {functie}")
+        self.ver_info_label.configure(text="  ".join(parts) if parts else "Geen beschrijving.")
+        if choice in self.versions_data:
+            self._warm_manifest(choice)
+
+    def _warm_manifest(self, version):
+        """Manifest van de gekozen versie op de achtergrond bijwerken en de versie,
+        als er een staging-map ingesteld is, alvast lokaal klaarzetten."""
+        src = self.config.get("source_dir", "")
+
+        def worker():
+            try:
+                prepare_version(src, version, self.config, self.log)
+            except Exception as e:
+                self.log(f"⚠️  Versie [{version}] voorbereiden mislukt: {e}", "warning")
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    # ── Versie info bewerken ───────────────────────────────────────────────────
+
+    def _edit_version_info(self):
+        version = self.version_var.get()
+        if version not in self.versions_data:
+            return
+
+        win = ctk.CTkToplevel(self)
+        win.title(f"Info bewerken — {version}")
+        win.geometry("440x240")
+        win.grab_set()
+        self._center_window(win, 440, 240)
+
+        ctk.CTkLabel(win, text="Omschrijving:").grid(row=0, column=0, padx=16, pady=(16, 4), sticky="w")
+        omschr_entry = ctk.CTkEntry(win, width=350)
+        omschr_entry.insert(0, self.versions_data[version].get("omschrijving", ""))
+        omschr_entry.grid(row=1, column=0, padx=16, pady=4, sticky="ew")
+
+        ctk.CTkLabel(win, text="Functie:").grid(row=2, column=0, padx=16, pady=(12, 4), sticky="w")
+        functie_entry = ctk.CTkEntry(win, width=350)
+        functie_entry.insert(0, self.versions_data[version].get("functie", ""))
+        functie_entry.grid(row=3, column=0, padx=16, pady=4, sticky="ew")
+
+        def save():
+            self.versions_data[version]["omschrijving"] = omschr_entry.get()
+            self.versions_data[version]["functie"] = functie_entry.get()
+            # versions.json kan ook beschrijvingen van (nu) ontbrekende versies bevatten
+            try:
+                with open(self.versions_json_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+            data[version] = self.versions_data[version]
+            with open(self.versions_json_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+            self._on_version_change(version)
+            win.destroy()
+
+        ctk.CTkButton(win, text="Opslaan", command=save).grid(row=4, column=0, padx=16, pady=16, sticky="e")
+        win.grid_columnconfigure(0, weight=1)
+
+    # ── Hoofdproces ───────────────────────────────────────────────────────────
+
+    def _start_process(self):
+        version = self.version_var.get()
+        src = self.config.get("source_dir", "")
+
+        if not src or not os.path.isdir(src):
+            self.log("❌  Hoofdmap niet ingesteld of niet gevonden.", "error")
+            return
+        if version not in self.versions_data:
+            self.log("❌  Geen geldige versie gekozen.", "error")
+            return
+
+        if self.multi_var.get():
+            drives = sorted(getattr(self, "_letter_size_map", {}))
+            idle = [d for d in drives if d not in self._busy_drives]
+            if not drives:
+                self.log("❌  Geen SD-kaarten gevonden.", "error")
+                return
+            if not idle:
+                return
+            self.log(f"🚀  {len(idle)} kaart(en) tegelijk starten: {', '.join(idle)}", "info")
+            for d in idle:
+                self._start_drive(d, version, src)
+            return
+
+        drive = self._get_selected_drive()
+        if not drive:
+            self.log("❌  Geen geldige drive geselecteerd.", "error")
+            return
+        self._start_drive(drive, version, src)
+
+    def _start_drive(self, drive, version=None, src=None, queue_id=None):
+        """Start een worker-thread voor één drive, tenzij die drive al bezig is."""
+        if drive in self._busy_drives:
+            return False
+        version = version or self.version_var.get()
+        src = src or self.config.get("source_dir", "")
+        if version not in self.versions_data or not src or not os.path.isdir(src):
+            return False
+
+        if self.jobs is not None:
+            # ook handmatige starts in de wachtrij, zodat een crash niet onopgemerkt blijft
+            queue_id = queue_id or self.jobs.enqueue(drive, version, src, self._card_ids.get(drive))
+            self.jobs.set_state(queue_id, "running")
+        drive_size_gb = getattr(self, "_letter_size_map", {}).get(drive)
+        self._busy_drives.add(drive)
+        self._set_drive_status(drive, "⏳ bezig")
+        self._update_busy_ui()
+        threading.Thread(target=self._process_thread, args=(drive, version, src, drive_size_gb, queue_id),
+                         daemon=True).start()
+        return True
+
+    # ── Wachtrij ──────────────────────────────────────────────────────────────
+
+    def _recover_jobs(self):
+        if self.jobs is None:
+            return
+        try:
+            queued, copies = self.jobs.recover()
+        except Exception as e:
+            self.log(f"⚠️  Wachtrij niet te openen: {e}", "warning")
+            self.jobs = None
+            return
+        waiting = len(self.jobs.queued())
+        if waiting or copies:
+            self.log(f"📥  Vorige sessie: {waiting} kaart(en) in de wachtrij, "
+                     f"{copies} onderbroken kopie(ën) — worden hervat zodra de kaart terug is.", "info")
+
+    def _resolve_card(self, drive):
+        """Kaartherkenning in een achtergrondthread bepalen (kan op Windows of bij een
+        trage lezer even duren) en via after() terugmelden."""
+        def worker():
+            card = card_identity(drive)
+            self.after(0, self._on_card_identity, drive, card)
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _on_card_identity(self, drive, card):
+        if drive not in self.known_drives:
+            return  # intussen verwijderd
+        self._card_ids[drive] = card
+        if self.jobs is not None and card:
+            self.jobs.set_card(drive, card)
+            self._dispatch_queue()
+
+    def _enqueue_drive(self, drive):
+        version = self.version_var.get()
+        src = self.config.get("source_dir", "")
+        if version not in self.versions_data or not src:
+            return
+        self.jobs.enqueue(drive, version, src, self._card_ids.get(drive))
+        if drive in self._busy_drives or (self._busy_drives and not self.multi_var.get()):
+            self.log(f"📥  {drive} in de wachtrij gezet ({len(self.jobs.queued())} wachtend).", "info")
+
+    def _dispatch_queue(self):
+        """Start wachtende kaarten die aanwezig en vrij zijn: allemaal tegelijk met
+        'Alle kaarten tegelijk', anders één voor één."""
+        if self.jobs is None or not self.auto_var.get():
+            return
+        present = getattr(self, "_letter_size_map", {})
+        for item in self.jobs.queued():
+            if self._busy_drives and not self.multi_var.get():
+                return
+            if item["drive"] not in present or item["drive"] in self._busy_drives:
+                continue
+            if item["card"] and item["drive"] not in self._card_ids:
+                continue  # herkenning nog onderweg; _on_card_identity start de wachtrij opnieuw
+            card = self._card_ids.get(item["drive"])
+            if item["card"] and card and card != item["card"]:
+                # in dezelfde drive zit intussen een andere kaart: die krijgt een eigen item
+                self.log(f"📥  Andere kaart in {item['drive']} dan in de wachtrij stond — opnieuw ingedeeld.",
+                         "info")
+                self.jobs.set_state(item["id"], "cancelled")
+                self._enqueue_drive(item["drive"])
+                return self._dispatch_queue()
+            if item["version"] not in self.versions_data:
+                self.log(f"⚠️  Versie [{item['version']}] voor {item['drive']} bestaat niet meer — "
+                         "uit de wachtrij gehaald.", "warning")
+                self.jobs.set_state(item["id"], "failed")
+                continue
+            self._start_drive(item["drive"], item["version"], item["source"], queue_id=item["id"])
+
+    def _on_auto_toggle(self):
+        self._save_config()
+        self._dispatch_queue()
+
+    def _drive_log_cb(self, drive, default_kind="info"):
+        """Log-callback voor worker-threads met de drive als prefix."""
+        return lambda m, k=default_kind: self.log(m, k, drive=drive)
+
+    def _drive_progress_cb(self, drive):
+        """Voortgangs-callback voor worker-threads (al gedempt door ProgressTracker)."""
+        return lambda event: self.after(0, self._on_progress, drive, event)
+
+    def _on_progress(self, drive, event):
+        if drive not in self._busy_drives:
+            return
+        self._drive_progress[drive] = event
+        if event["total"]:
+            self._set_drive_status(drive, f"📋 {100 * event['done'] / event['total']:.0f}%")
+        self._update_progress_ui()
+
+    def _update_progress_ui(self):
+        """Voortgangsbalk over alle actieve kaarten samen."""
+        events = [self._drive_progress[d] for d in self._busy_drives if d in self._drive_progress]
+        total = sum(e["total"] for e in events)
+        done = sum(e["done"] for e in events)
+        if not events or not total:
+            self.progress_bar.set(0)
+            self.progress_label.configure(text="Bezig...")
+            return
+        self.progress_bar.set(done / total)
+        mbps = sum(e["mbps"] for e in events)
+        etas = [e["eta"] for e in events if e["eta"] is not None]
+        eta_text = f"nog {max(etas):.0f} s" if etas else "ETA onbekend"
+        current = events[0]["current"] if len(events) == 1 else f"{len(events)} kaarten"
+        self.progress_label.configure(
+            text=f"{format_bytes(done)} / {format_bytes(total)}  ·  {mbps:.1f} MB/s  ·  {eta_text}  ·  {current}")
+
+    def _process_thread(self, drive, version, src, drive_size_gb=None, queue_id=None):
+        ok = False
+        try:
+            ok = self._flash_drive(drive, version, src, drive_size_gb)
+        except Exception as e:
+            self._drive_log_cb(drive, "error")(f"❌  Onverwachte fout: {e}")
+        if queue_id is not None:
+            self.jobs.set_state(queue_id, "done" if ok else "failed")
+            self.jobs.prune()
+        # formatteren geeft de kaart een nieuwe herkenning
+        self.after(0, self._on_card_identity, drive, card_identity(drive))
+        self.after(0, self._set_drive_status, drive, "✅ klaar, veilig verwijderen" if ok else "❌ mislukt")
+        self.after(0, self._reset_busy, drive)
+
+    def _flash_drive(self, drive, version, src, drive_size_gb):
+        """Valideren, leegmaken en kopiëren voor één drive. Geeft True bij succes."""
+        return flash_drive(drive, version, src, self.config, self._drive_log_cb(drive),
+                           status_cb=lambda text: self.after(0, self._set_drive_status, drive, text),
+                           progress_cb=self._drive_progress_cb(drive),
+                           drive_size_gb=drive_size_gb, jobs_db=self.jobs)
+
+    def _reset_busy(self, drive=None):
+        if drive is None:
+            self._busy_drives.clear()
+            self._drive_progress.clear()
+        else:
+            self._busy_drives.discard(drive)
+            self._drive_progress.pop(drive, None)
+        self._update_busy_ui()
+        self._dispatch_queue()
+
+    def _on_multi_toggle(self):
+        self._save_config()
+        self._update_busy_ui()
+
+    def _update_busy_ui(self):
+        """Knoppen bijwerken op basis van de drives die bezig zijn."""
+        n_busy = len(self._busy_drives)
+        selected_busy = self._get_selected_drive() in self._busy_drives
+        if self.multi_var.get():
+            all_drives = set(getattr(self, "_letter_size_map", {}))
+            start_blocked = bool(all_drives) and all_drives <= self._busy_drives
+        else:
+            start_blocked = selected_busy
+        start_text = f"Bezig... ({n_busy} kaart{'en' if n_busy > 1 else ''})" if n_busy else "▶  Start overschrijven"
+        self.start_btn.configure(state="disabled" if start_blocked else "normal", text=start_text)
+        if self._busy_drives:
+            self.progress_frame.grid()
+            self._update_progress_ui()
+        else:
+            self.progress_frame.grid_remove()
+        if selected_busy:
+            self.format_btn.configure(state="disabled")
+        else:
+            self.format_btn.configure(state="normal", text="🗂  Formatteer geselecteerde drive")
+
+    def _set_drive_status(self, drive, text):
+        self._drive_status[drive] = text
+        self._update_drive_status_label()
+
+    def _update_drive_status_label(self):
+        parts = [f"{d}  {t}" for d, t in sorted(self._drive_status.items())]
+        self.drive_status_label.configure(text="     ".join(parts))
+
+    def _update_auto_format_switch_state(self):
+        """Schakel de corrupt-switch alleen in als grootte-limiet ingesteld is én drive uitgelezen kan worden."""
+        max_gb = self.config.get("max_drive_gb", None)
+        drive_size = self._get_selected_drive_size()
+        if max_gb and drive_size is not None:
+            self.auto_format_switch.configure(state="normal")
+        else:
+            self.auto_format_var.set(False)
+            self.auto_format_switch.configure(state="disabled")
+
+    def _on_auto_format_toggle(self):
+        self.config["auto_format_corrupt"] = self.auto_format_var.get()
+        save_config(self.config, self.config_path)
+
+    def _format_selected_drive(self):
+        """Handmatig formatteren van de geselecteerde drive met bevestiging."""
+        drive = self._get_selected_drive()
+        if not drive:
+            self.log("❌  Geen geldige drive geselecteerd.", "error")
+            return
+        if drive in self._busy_drives:
+            return
+
+        drive_size = self._get_selected_drive_size()
+        max_gb = self.config.get("max_drive_gb", None)
+
+        # Grootte veiligheidscheck
+        if max_gb and drive_size is not None and drive_size > max_gb:
+            self.log(f"🛑  Formatteren geblokkeerd: drive is {drive_size:.1f} GB (max {max_gb:.1f} GB).", "error")
+            return
+
+        # Bevestigingsvenster
+        win = ctk.CTkToplevel(self)
+        win.title("Bevestiging")
+        win.geometry("420x180")
+        win.grab_set()
+        win.grid_columnconfigure(0, weight=1)
+        self._center_window(win, 420, 180)
+
+        msg = f"Weet je zeker dat je {drive} wil formatteren?\nAlle data op de drive wordt gewist."
+        if drive_size:
+            msg += f"\n\nDrive grootte: {drive_size:.1f} GB"
+        ctk.CTkLabel(win, text=msg, wraplength=380, justify="center").grid(
+            row=0, column=0, columnspan=2, padx=20, pady=(20, 16))
+
+        def confirm():
+            win.destroy()
+            if drive in self._busy_drives:
+                return
+            self._busy_drives.add(drive)
+            self._set_drive_status(drive, "🗂️ formatteren")
+            self._update_busy_ui()
+            self.format_btn.configure(text="Bezig met formatteren...")
+            self.log(f"🗂️   Formatteren gestart voor {drive}...", "warning")
+            threading.Thread(target=self._format_thread, args=(drive, drive_size), daemon=True).start()
+
+        ctk.CTkButton(win, text="Ja, formatteren", fg_color="#b45309", hover_color="#92400e",
+                      command=confirm).grid(row=1, column=0, padx=(20, 8), pady=10, sticky="ew")
+        ctk.CTkButton(win, text="Annuleren", fg_color="gray30", hover_color="gray40",
+                      command=win.destroy).grid(row=1, column=1, padx=(8, 20), pady=10, sticky="ew")
+
+    def _format_thread(self, drive, drive_size_gb=None):
+        ok = self.drive_provider.format_drive(drive, self._drive_log_cb(drive, "warning"),
+                                              drive_size_gb=drive_size_gb)
+        if ok:
+            self.log(f"✅  {drive} is klaar voor gebruik.", "success")
+        else:
+            self.log(f"❌  Formatteren van {drive} mislukt. Probeer als administrator.", "error")
+        self.after(0, self._set_drive_status, drive, "✅ geformatteerd" if ok else "❌ formatteren mislukt")
+        self.after(0, self._reset_busy, drive)
+
+    # ── Instellingen venster ───────────────────────────────────────────────────
+
+    def _open_settings(self):
+        win = ctk.CTkToplevel(self)
+        win.title("Instellingen — SD-kaart (doeldrive)")
+        win.geometry("500x720")
+        win.grab_set()
+        win.grid_columnconfigure(0, weight=1)
+        self._center_window(win, 500, 720)
+
+        ctk.CTkLabel(win, text="Instellingen voor de SD-kaart (doeldrive)",
+                     font=ctk.CTkFont(weight="bold"), anchor="w").grid(
+            row=0, column=0, padx=16, pady=(16, 10), sticky="w")
+
+        ctk.CTkLabel(win, text="Toegestane bestandsextensies op SD-kaart (komma-gescheiden):",
+                     anchor="w").grid(row=1, column=0, padx=16, pady=(4, 2), sticky="w")
+        ext_entry = ctk.CTkEntry(win, width=440)
+        ext_entry.insert(0, ", ".join(self.config.get("allowed_extensions", [])))
+        ext_entry.grid(row=2, column=0, padx=16, pady=2, sticky="ew")
+        ctk.CTkLabel(win, text="Laat leeg om alle extensies toe te staan op de SD-kaart.",
+                     text_color="gray60", font=ctk.CTkFont(size=11)).grid(
+            row=3, column=0, padx=16, pady=(0, 4), sticky="w")
+
+        ctk.CTkLabel(win, text="Maximum aantal bestanden op SD-kaart (veiligheidscheck):",
+                     anchor="w").grid(row=4, column=0, padx=16, pady=(12, 2), sticky="w")
+        max_entry = ctk.CTkEntry(win, width=120)
+        max_entry.insert(0, str(self.config.get("max_files", 100)))
+        max_entry.grid(row=5, column=0, padx=16, pady=2, sticky="w")
+        ctk.CTkLabel(win, text="Overschrijdt de SD-kaart dit aantal, wordt het proces geblokkeerd.",
+                     text_color="gray60", font=ctk.CTkFont(size=11)).grid(
+            row=6, column=0, padx=16, pady=(0, 4), sticky="w")
+
+        ctk.CTkLabel(win, text="Maximum grootte SD-kaart in GB (veiligheidscheck):",
+                     anchor="w").grid(row=7, column=0, padx=16, pady=(12, 2), sticky="w")
+        maxgb_entry = ctk.CTkEntry(win, width=120)
+        maxgb_entry.insert(0, str(self.config.get("max_drive_gb", 5.0)))
+        maxgb_entry.grid(row=8, column=0, padx=16, pady=2, sticky="w")
+        ctk.CTkLabel(win, text="Drives groter dan dit worden geblokkeerd (bijv. 5 voor max 5 GB).",
+                     text_color="gray60", font=ctk.CTkFont(size=11)).grid(
+            row=9, column=0, padx=16, pady=(0, 4), sticky="w")
+
+        subdirs_var = ctk.BooleanVar(value=self.config.get("allow_subdirs", False))
+        ctk.CTkSwitch(win, text="Submappen toestaan op SD-kaart (doeldrive)",
+                      variable=subdirs_var).grid(row=10, column=0, padx=16, pady=(16, 2), sticky="w")
+        ctk.CTkLabel(win, text="Uit = veiligheidscheck blokkeert als SD-kaart submappen bevat.",
+                     text_color="gray60", font=ctk.CTkFont(size=11)).grid(
+            row=11, column=0, padx=16, pady=(0, 4), sticky="w")
+
+        sync_var = ctk.BooleanVar(value=self.config.get("sync_mode", False))
+        ctk.CTkSwitch(win, text="Differentieel synchroniseren (niet wissen)",
+                      variable=sync_var).grid(row=12, column=0, padx=16, pady=(16, 2), sticky="w")
+        ctk.CTkLabel(win, text="Aan = alleen nieuwe/gewijzigde bestanden schrijven, extra bestanden verwijderen.",
+                     text_color="gray60", font=ctk.CTkFont(size=11)).grid(
+            row=13, column=0, padx=16, pady=(0, 4), sticky="w")
+
+        verify_var = ctk.BooleanVar(value=self.config.get("verify_writes", False))
+        ctk.CTkSwitch(win, text="Geschreven bestanden verifiëren (teruglezen)",
+                      variable=verify_var).grid(row=14, column=0, padx=16, pady=(16, 2), sticky="w")
+        ctk.CTkLabel(win, text="Aan = hash tijdens schrijven, teruglezen van de kaart en opnieuw schrijven bij fouten.",
+                     text_color="gray60", font=ctk.CTkFont(size=11)).grid(
+            row=15, column=0, padx=16, pady=(0, 4), sticky="w")
+
+        image_var = ctk.BooleanVar(value=self.config.get("image_mode", False))
+        ctk.CTkSwitch(win, text="Als image schrijven (raw, sequentieel)",
+                      variable=image_var).grid(row=16, column=0, padx=16, pady=(16, 2), sticky="w")
+        ctk.CTkLabel(win, text="Aan = kant-en-klaar FAT32-image in één keer schrijven. Vereist administratorrechten.",
+                     text_color="gray60", font=ctk.CTkFont(size=11)).grid(
+            row=17, column=0, padx=16, pady=(0, 4), sticky="w")
+
+        def save():
+            raw_exts = ext_entry.get().strip()
+            exts = [e.strip() for e in raw_exts.split(",") if e.strip()] if raw_exts else []
+            exts = [e if e.startswith(".") else f".{e}" for e in exts]
+            try:
+                max_f = int(max_entry.get())
+            except ValueError:
+                max_f = 100
+            try:
+                max_gb = float(maxgb_entry.get())
+            except ValueError:
+                max_gb = 5.0
+
+            self.config["allowed_extensions"] = exts
+            self.config["max_files"] = max_f
+            self.config["max_drive_gb"] = max_gb
+            self.config["allow_subdirs"] = subdirs_var.get()
+            self.config["sync_mode"] = sync_var.get()
+            self.config["verify_writes"] = verify_var.get()
+            self.config["image_mode"] = image_var.get()
+            save_config(self.config, self.config_path)
+            win.destroy()
+            self.log("⚙️   Instellingen opgeslagen.", "info")
+
+        ctk.CTkButton(win, text="Opslaan", command=save).grid(
+            row=18, column=0, padx=16, pady=20, sticky="e")
+
+    # ── Config opslaan ────────────────────────────────────────────────────────
+
+    def _save_config(self):
+        self.config["auto_start"] = self.auto_var.get()
+        self.config["multi_drive"] = self.multi_var.get()
+        save_config(self.config, self.config_path)
+
+
+def run(config_path=CONFIG_FILE):
+    app = App(config_path)
+    app.mainloop()
@@ -0,0 +1,195 @@
+"""Adaptieve regeling van het aantal kaarten dat tegelijk geschreven wordt.
+
+Kaarten achter dezelfde USB-hub of kaartlezer delen één verbinding: met te veel
+gelijktijdige schrijvers daalt de totale doorvoer (wisselende toegang, kleinere
+blokken per kaart). Per groep (hub/controller, voor zover het besturingssysteem
+dat laat zien) houdt de ConcurrencyController een limiet bij en meet hij in vaste
+tijdvensters de totale doorvoer terwijl alle plekken bezet zijn. Met een simpele
+hill-climb worden de buren van de beste limiet geprobeerd; daarna blijft de limiet
+staan op het aantal dat de meeste MB/s — en dus kaarten per uur — oplevert, met af
+en toe een nieuwe meting omdat een andere batch kaarten anders kan presteren.
+De regeling begint bij de bovengrens, zodat er nooit stilletjes minder kaarten
+tegelijk lopen dan ingesteld; zonder regeling of vaste limiet is er geen limiet.
+"""
+import math
+import os
+import re
+import threading
+import time
+
+CONCURRENCY_WINDOW = 10.0       # seconden per meetvenster
+CONCURRENCY_REPROBE = 600.0     # na zoveel seconden de buren van de beste limiet opnieuw meten
+CONCURRENCY_MARGIN = 0.05       # een hogere limiet moet minstens zoveel sneller zijn
+DEFAULT_GROUP = "standaard"
+
+_USB_PORT = re.compile(r"\d+-\d+(\.\d+)*")
+_MMC_HOST = re.compile(r"mmc\d+")
+
+
+def usb_group(device):
+    """
+    Groep (gedeelde verbinding) van een blokdevice op Linux, uit het sysfs-pad:
+    kaarten op poorten van dezelfde hub delen de uplink van die hub, lezers direct
+    op een rootpoort delen de USB-controller, ingebouwde lezers hun MMC-host.
+    None als dat niet te bepalen is.
+    """
+    try:
+        name = os.path.basename(os.path.realpath(device))
+        parts = os.path.realpath(f"/sys/class/block/{name}").split("/")
+    except OSError:
+        return None
+    ports = [p for p in parts if _USB_PORT.fullmatch(p)]
+    if ports:
+        port = ports[-1]
+        hub = port.rsplit(".", 1)[0] if "." in port else f"usb{port.split('-')[0]}"
+        return f"usb:{hub}"
+    hosts = [p for p in parts if _MMC_HOST.fullmatch(p)]
+    return f"mmc:{hosts[0]}" if hosts else None
+
+
+class _Group:
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.active = set()
+        self.waiting = 0
+        self.stats = {}             # limiet -> gemeten MB/s
+        self.settled_at = None
+        self.jobs = 0
+        self.job_bytes = 0
+        self._new_window(time.monotonic())
+
+    def _new_window(self, now):
+        self.window_start = now
+        self.window_bytes = 0
+        self.window_full = len(self.active) == self.limit
+
+    def cards_per_hour(self, mbps):
+        if not self.jobs or not self.job_bytes:
+            return None
+        return mbps * 1024 ** 2 * 3600 / (self.job_bytes / self.jobs)
+
+
+class ConcurrencyController:
+    """
+    Verdeelt schrijfplekken per groep. `fixed` > 0 zet een vaste limiet per groep;
+    met `adaptive` wordt de limiet tussen 1 en `max_limit` geregeld op de gemeten
+    doorvoer, beginnend bij `max_limit`. Anders is het aantal plekken onbeperkt.
+    """
+
+    def __init__(self, fixed=0, max_limit=8, adaptive=False, window=CONCURRENCY_WINDOW,
+                 reprobe=CONCURRENCY_REPROBE):
+        self.fixed = fixed
+        self.adaptive = adaptive and not fixed
+        self.max_limit = max(1, max_limit)
+        self.window = window
+        self.reprobe = reprobe
+        self.groups = {}
+        self._cond = threading.Condition()
+
+    def _group(self, name):
+        name = name or DEFAULT_GROUP
+        group = self.groups.get(name)
+        if group is None:
+            if self.fixed:
+                start = self.fixed
+            else:
+                start = self.max_limit if self.adaptive else math.inf
+            group = self.groups[name] = _Group(name, start)
+        return group
+
+    def acquire(self, drive, group_name, log_cb=None, status_cb=None):
+        """Wacht op een vrije plek in de groep. Geeft de groep terug (voor release)."""
+        with self._cond:
+            group = self._group(group_name)
+            if len(group.active) >= group.limit:
+                if status_cb:
+                    status_cb(f"⏳ wacht op plek ({group.name})")
+                if log_cb:
+                    log_cb(f"⏳  Wacht op een vrije plek in {group.name} "
+                           f"({len(group.active)}/{group.limit} bezet).", "info")
+                group.waiting += 1
+                try:
+                    while len(group.active) >= group.limit:
+                        self._cond.wait()
+                finally:
+                    group.waiting -= 1
+            group.active.add(drive)
+            return group
+
+    def release(self, drive, group, n_bytes=0, ok=True):
+        with self._cond:
+            group.active.discard(drive)
+            if ok and n_bytes:
+                group.jobs += 1
+                group.job_bytes += n_bytes
+            if not group.waiting:
+                group.window_full = False   # plek blijft leeg: dit venster zegt niets over de limiet
+            self._cond.notify_all()
+
+    def wrap_progress(self, drive, group, progress_cb, log_cb=None):
+        """Voortgangscallback die de geschreven bytes per groep telt."""
+        last = [0]
+
+        def cb(event):
+            delta = event["done"] - last[0] if event["done"] >= last[0] else event["done"]
+            last[0] = event["done"]
+            self._record(group, delta, log_cb)
+            if progress_cb:
+                progress_cb(event)
+        return cb
+
+    def _record(self, group, n_bytes, log_cb):
+        with self._cond:
+            group.window_bytes += n_bytes
+            now = time.monotonic()
+            elapsed = now - group.window_start
+            if elapsed < self.window:
+                return
+            if group.window_full and len(group.active) >= group.limit:
+                self._decide(group, group.window_bytes / elapsed / 1024 ** 2, now, log_cb)
+            group._new_window(now)
+
+    def _decide(self, group, mbps, now, log_cb):
+        """Hill-climb: meting boeken en de volgende limiet kiezen."""
+        old = group.stats.get(group.limit)
+        group.stats[group.limit] = mbps if old is None else (old + mbps) / 2
+        if not self.adaptive:
+            return
+        if group.settled_at is not None and now - group.settled_at > self.reprobe:
+            best = self._best(group)
+            group.stats = {best: group.stats[best]}
+            group.settled_at = None
+
+        best = self._best(group)
+        if best + 1 <= self.max_limit and best + 1 not in group.stats:
+            target = best + 1
+        elif best - 1 >= 1 and best - 1 not in group.stats:
+            target = best - 1
+        else:
+            target = best
+        current = group.limit
+        group.limit = target
+        if target != current:
+            self._cond.notify_all()
+            if log_cb:
+                log_cb(f"⚖️   {group.name}: {current} tegelijk gaf {mbps:.1f} MB/s — nu {target} proberen.", "info")
+        elif group.settled_at is None:
+            group.settled_at = now
+            if log_cb:
+                per_hour = group.cards_per_hour(group.stats[target])
+                rate = f", ≈ {per_hour:.0f} kaarten/uur" if per_hour else ""
+                log_cb(f"⚖️   {group.name}: {target} kaart(en) tegelijk is het snelst "
+                       f"({group.stats[target]:.1f} MB/s{rate}).", "info")
+
+    @staticmethod
+    def _best(group):
+        """Kleinste limiet die binnen de marge van de hoogste gemeten doorvoer zit."""
+        top = max(group.stats.values())
+        return min(limit for limit, mbps in group.stats.items() if mbps >= top * (1 - CONCURRENCY_MARGIN))
+
+    def snapshot(self):
+        """Per groep de huidige limiet, bezetting en metingen (voor weergave)."""
+        with self._cond:
+            return {name: {"limit": g.limit, "active": len(g.active), "waiting": g.waiting,
+                           "stats": dict(g.stats)} for name, g in self.groups.items()}
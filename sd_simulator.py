@@ -0,0 +1,298 @@
+"""Gesimuleerde SD-kaarten voor load-tests zonder fysieke kaarten.
+
+Een SimulatedDriveProvider biedt dezelfde interface als de echte drive-provider
+in sd_manager (drives opsommen, detectie, formatteren), maar dan voor N nepkaarten
+onder een tijdelijke hoofdmap: elke kaart is een map (bestanden kopiëren,
+synchroniseren) of een imagebestand (image-modus). Per kaart gelden een
+capaciteit, een maximale schrijfsnelheid, een vertraging per bestand en een kans
+op een schrijffout; een script plaatst en verwijdert kaarten op vaste tijdstippen.
+Zo zijn detectie, wachtrij en het gelijktijdig flashen van tientallen kaarten te
+testen op een gewone Linux-machine.
+
+Scriptregels (bestand of lijst), tijd in seconden vanaf de start:
+
+    0    plaats alle
+    2.5  plaats 3
+    10   verwijder 3
+"""
+import errno
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+SIM_PREFIX = "kaart-"
+SIM_ACTIONS = {"plaats": True, "verwijder": False}
+
+
+class ScriptError(ValueError):
+    pass
+
+
+def parse_script(lines):
+    """Scriptregels naar een gesorteerde lijst (tijd, plaatsen?, kaartnummer of None = alle)."""
+    events = []
+    for number, line in enumerate(lines, 1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        parts = line.split()
+        try:
+            at, action, which = float(parts[0]), parts[1].lower(), parts[2].lower()
+            insert = SIM_ACTIONS[action]
+            card = None if which == "alle" else int(which)
+        except (IndexError, KeyError, ValueError):
+            raise ScriptError(f"regel {number}: '{line}' — verwacht '<seconden> plaats|verwijder <nr>|alle'")
+        events.append((at, insert, card))
+    return sorted(events, key=lambda e: e[0])
+
+
+def load_script(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_script(f)
+
+
+class SimulatedCard:
+    def __init__(self, number, path, size_gb):
+        self.number = number
+        self.path = path
+        self.size_gb = size_gb
+        self.present = False
+        self.generation = 0     # telt plaatsingen, zodat een schrijfactie merkt dat de kaart eruit was
+
+    @property
+    def label(self):
+        return f"{self.path}  [SIM {self.size_gb:.1f} GB]"
+
+
+class SimulatedDriveProvider:
+    """
+    Drive-provider met nepkaarten onder `root` (standaard een nieuwe tijdelijke map,
+    die stop() weer opruimt).
+
+    backing       'dir' (map per kaart) of 'image' (imagebestand per kaart, voor image-modus)
+    write_mbps    maximale schrijfsnelheid per kaart in MB/s; 0 = onbeperkt
+    latency_ms    vertraging bij het openen van de kaart en per nieuw bestand
+    failure_rate  kans dat het schrijven van een kaart halverwege mislukt (0..1)
+    hubs          aantal gesimuleerde hubs; kaarten worden om en om verdeeld
+    hub_mbps      gedeelde bandbreedte per hub in MB/s; 0 = geen gedeelde limiet
+    contention    verlies per extra gelijktijdige schrijver op een hub (0.1 = 10%)
+    script        scriptregels of pad naar een scriptbestand; zonder script zijn alle kaarten geplaatst
+    """
+    name = "simulatie"
+
+    def __init__(self, root=None, cards=8, size_gb=1.0, write_mbps=0.0, latency_ms=0.0, failure_rate=0.0,
+                 backing="dir", script=None, seed=None, hubs=1, hub_mbps=0.0, contention=0.0):
+        self._own_root = not root
+        self.root = root or tempfile.mkdtemp(prefix="sdkaart-sim-")
+        self.write_mbps = write_mbps
+        self.hubs = max(1, hubs)
+        self.hub_mbps = hub_mbps
+        self.contention = contention
+        self._writing = {}      # kaartpad -> tot wanneer de kaart met schrijven bezig is
+        self.latency = latency_ms / 1000.0
+        self.failure_rate = failure_rate
+        self.backing = backing
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._stop = threading.Event()
+        os.makedirs(self.root, exist_ok=True)
+
+        self.cards = {}
+        for number in range(1, cards + 1):
+            path = os.path.join(self.root, f"{SIM_PREFIX}{number:02d}")
+            if backing == "image":
+                path += ".img"
+                if not os.path.exists(path):
+                    with open(path, "wb") as f:
+                        f.truncate(int(size_gb * 1024 ** 3))
+            else:
+                os.makedirs(path, exist_ok=True)
+            self.cards[path] = SimulatedCard(number, path, size_gb)
+
+        if isinstance(script, str):
+            script = load_script(script)
+        elif script is not None:
+            script = parse_script(script)
+        self._script = script
+        if script is None:
+            for card in self.cards.values():
+                self._set_present(card, True)
+        else:
+            threading.Thread(target=self._run_script, daemon=True, name="SimScript").start()
+
+    def stop(self):
+        self._stop.set()
+        if self._own_root:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+    # ── Plaatsen en verwijderen ──
+
+    def _set_present(self, card, present):
+        if card.present != present:
+            card.present = present
+            if present:
+                card.generation += 1
+
+    def insert(self, number=None):
+        self._apply(True, number)
+
+    def remove(self, number=None):
+        self._apply(False, number)
+
+    def _apply(self, insert, number):
+        with self._lock:
+            for card in self.cards.values():
+                if number is None or card.number == number:
+                    self._set_present(card, insert)
+            listeners = list(self._listeners)
+        for notify in listeners:
+            notify()
+
+    def _run_script(self):
+        t0 = time.monotonic()
+        for at, insert, number in self._script:
+            if self._stop.wait(max(0.0, at - (time.monotonic() - t0))):
+                return
+            self._apply(insert, number)
+
+    # ── Provider-interface ──
+
+    def list_drives(self):
+        with self._lock:
+            return [(c.path, c.label, c.size_gb) for c in self.cards.values() if c.present]
+
+    def monitor(self, on_change):
+        return _SimulatedMonitor(self, on_change).start()
+
+    def watcher(self, on_refresh, backend="auto"):
+        return _SimulatedWatcher(self, on_refresh).start()
+
+    def group(self, drive_letter):
+        card = self.cards.get(drive_letter)
+        return f"sim-hub-{(card.number - 1) % self.hubs + 1}" if card else None
+
+    def _bandwidth(self, card, now):
+        """Schrijfsnelheid van deze kaart in bytes/s (0 = onbeperkt): de eigen limiet,
+        of het deel van de hub-bandbreedte dat na het contentieverlies overblijft."""
+        per_card = self.write_mbps * 1024 ** 2
+        if not self.hub_mbps:
+            return per_card
+        hub = self.group(card.path)
+        with self._lock:
+            self._writing[card.path] = max(self._writing.get(card.path, 0.0), now)
+            writers = sum(1 for path, busy in self._writing.items()
+                          if busy > now - 0.3 and self.group(path) == hub)
+        share = self.hub_mbps * 1024 ** 2 / (1 + self.contention * (writers - 1)) / writers
+        return min(per_card, share) if per_card else share
+
+    def format_drive(self, drive_letter, log_cb, drive_size_gb=None):
+        card = self.cards.get(drive_letter)
+        if card is None or not card.present:
+            log_cb(f"❌  Formatteren van {drive_letter} niet mogelijk: kaart niet geplaatst.", "error")
+            return False
+        if self.backing == "image":
+            from sd_manager import quick_format_drive
+            return quick_format_drive(drive_letter, log_cb)
+        for item in os.scandir(drive_letter):
+            if item.is_dir(follow_symlinks=False):
+                shutil.rmtree(item.path)
+            else:
+                os.remove(item.path)
+        log_cb(f"✅  {drive_letter} geformatteerd (simulatie).", "success")
+        return True
+
+    def wrap_progress(self, drive_letter, progress_cb):
+        """Voortgangscallback die het schrijven van deze kaart afremt en fouten
+        injecteert. Wordt aangeroepen vanuit de schrijfthread, dus slapen of een
+        OSError gooien remt of onderbreekt het schrijven zelf."""
+        card = self.cards.get(drive_letter)
+        if card is None:
+            return progress_cb
+        generation = card.generation
+        if self.latency:
+            time.sleep(self.latency)
+        state = {"last": time.monotonic(), "ready": 0.0, "done": 0, "current": None, "fail_at": None}
+        capacity = card.size_gb * 1024 ** 3
+
+        def check_present():
+            if not card.present or card.generation != generation:
+                raise OSError(errno.ENODEV, f"{drive_letter} is verwijderd tijdens het schrijven")
+
+        def cb(event):
+            check_present()
+            # bij een nieuwe schrijffase (nieuwe ProgressTracker) begint done weer bij 0
+            delta = event["done"] - state["done"] if event["done"] >= state["done"] else event["done"]
+            if state["done"] == 0 and event["done"] and state["fail_at"] is None:
+                fails = self._random.random() < self.failure_rate
+                state["fail_at"] = self._random.uniform(0, event["total"]) if fails else -1
+            state["done"] = event["done"]
+            if event["done"] > capacity:
+                raise OSError(errno.ENOSPC, f"{drive_letter} is vol (simulatie)")
+            if state["fail_at"] is not None and 0 <= state["fail_at"] <= event["done"]:
+                raise OSError(errno.EIO, f"gesimuleerde schrijffout op {drive_letter}")
+            if self.latency and event["current"] != state["current"]:
+                state["current"] = event["current"]
+                time.sleep(self.latency)
+            now = time.monotonic()
+            bandwidth = self._bandwidth(card, now)
+            if bandwidth:
+                # deze bytes kosten delta/bandbreedte vanaf de vorige melding; geen opgespaard tegoed
+                state["ready"] = max(state["ready"], state["last"]) + delta / bandwidth
+                with self._lock:
+                    self._writing[card.path] = state["ready"]
+                while now < state["ready"]:
+                    time.sleep(min(state["ready"] - now, 0.1))  # in stukjes, zodat verwijderen opvalt
+                    check_present()
+                    now = time.monotonic()
+            state["last"] = now
+            if progress_cb:
+                progress_cb(event)
+        return cb
+
+
+class _SimulatedMonitor:
+    """Zelfde interface als sd_manager.DriveMonitor, voor nepkaarten."""
+
+    def __init__(self, provider, on_change):
+        self.provider = provider
+        self.on_change = on_change
+        self.drives = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.refresh(force=True)
+        return self
+
+    def stop(self):
+        pass
+
+    def refresh(self, force=False):
+        drives = self.provider.list_drives()
+        with self._lock:
+            if drives == self.drives and not force:
+                return
+            self.drives = drives
+        self.on_change(list(drives))
+
+
+class _SimulatedWatcher:
+    """Meldt plaatsen en verwijderen uit het script, zoals een DriveWatcher."""
+    name = "simulatie"
+
+    def __init__(self, provider, on_refresh):
+        self.provider = provider
+        self.on_refresh = on_refresh
+
+    def start(self):
+        with self.provider._lock:
+            self.provider._listeners.append(self.on_refresh)
+        return self
+
+    def stop(self):
+        with self.provider._lock:
+            if self.on_refresh in self.provider._listeners:
+                self.provider._listeners.remove(self.on_refresh)
@@ -0,0 +1,312 @@
+"""FAT32-builder en quick-format: het geproduceerde image wordt hier onafhankelijk
+van sd_image uitgelezen (BPB, FAT-ketens, mapregels met LFN) en vergeleken."""
+import io
+import os
+import struct
+
+import pytest
+
+from sd_image import (FAT_EOC, SECTOR, Fat32Layout, _lfn_checksum, _short_name, build_fat32_image,
+                      open_raw_target, probe, quick_format)
+
+TOTAL_SECTORS = 80 * 1024 * 1024 // SECTOR     # 80 MB: spc 1, ruim boven 65525 clusters
+
+
+class Fat32Reader:
+    """Minimale FAT32-lezer voor de tests."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.data = f.read()
+        bs = self.data[:SECTOR]
+        (self.bytes_per_sector, self.spc, self.reserved, self.num_fats, self.root_entries,
+         self.total16, self.media, self.fat16, _spt, _heads, self.hidden,
+         self.total_sectors) = struct.unpack_from("<HBHBHHBHHHII", bs, 11)
+        (self.fat_sectors, _flags, _ver, self.root_cluster, self.fsinfo_sector, self.backup_sector,
+         _res, _drive, _r1, self.boot_sig, self.volume_id, self.label,
+         self.fs_type) = struct.unpack_from("<IHHIHH12sBBBI11s8s", bs, 36)
+        self.signature = bs[510:512]
+        self.data_start = self.reserved + self.num_fats * self.fat_sectors
+        self.cluster_bytes = self.spc * self.bytes_per_sector
+
+    def sector(self, n):
+        return self.data[n * SECTOR:(n + 1) * SECTOR].ljust(SECTOR, b"\0")
+
+    def fat(self, copy=0):
+        start = (self.reserved + copy * self.fat_sectors) * SECTOR
+        raw = self.data[start:start + self.fat_sectors * SECTOR].ljust(self.fat_sectors * SECTOR, b"\0")
+        return struct.unpack(f"<{len(raw) // 4}I", raw)
+
+    def chain(self, cluster):
+        fat = self.fat()
+        out = []
+        while cluster < 0x0FFFFFF8:
+            assert 2 <= cluster < len(fat) and cluster not in out, f"kapotte keten bij {cluster}"
+            out.append(cluster)
+            cluster = fat[cluster] & 0x0FFFFFFF
+        return out
+
+    def read_chain(self, cluster, size=None):
+        out = bytearray()
+        for c in self.chain(cluster):
+            offset = (self.data_start + (c - 2) * self.spc) * SECTOR
+            out += self.data[offset:offset + self.cluster_bytes].ljust(self.cluster_bytes, b"\0")
+        return bytes(out if size is None else out[:size])
+
+    def entries(self, cluster):
+        """(lange of korte naam, 8.3-naam, attr, cluster, grootte) per mapregel."""
+        raw = self.read_chain(cluster)
+        lfn = {}
+        for i in range(0, len(raw), 32):
+            entry = raw[i:i + 32]
+            if entry[0] == 0:
+                break
+            if entry[0] == 0xE5:
+                continue
+            attr = entry[11]
+            if attr == 0x0F:
+                seq = entry[0] & 0x1F
+                units = entry[1:11] + entry[14:26] + entry[28:32]
+                lfn[seq] = (units, entry[13])
+                continue
+            short = entry[:11]
+            hi, = struct.unpack_from("<H", entry, 20)
+            lo, size = struct.unpack_from("<HI", entry, 26)
+            name = None
+            if lfn:
+                assert all(chk == _lfn_checksum(short) for _units, chk in lfn.values())
+                units = b"".join(lfn[s][0] for s in sorted(lfn))
+                name = units.decode("utf-16-le").split("\0", 1)[0]
+                lfn = {}
+            if name is None:
+                base, ext = short[:8].decode().rstrip(), short[8:].decode().rstrip()
+                name = f"{base}.{ext}" if ext else base
+            yield name, short, attr, (hi << 16) | lo, size
+
+    def walk(self, cluster=None, prefix=""):
+        """Alle bestanden als {pad: inhoud}, recursief."""
+        files = {}
+        for name, _short, attr, first, size in self.entries(cluster or self.root_cluster):
+            if attr & 0x08 or name in (".", ".."):
+                continue
+            rel = f"{prefix}{name}"
+            if attr & 0x10:
+                files.update(self.walk(first, rel + "/"))
+            else:
+                files[rel] = self.read_chain(first, size) if first else b""
+        return files
+
+
+def _build(tmp_path, contents, dirs=(), label="TESTKAART"):
+    files = [(rel, len(data), 1700000000.0, lambda data=data: io.BytesIO(data))
+             for rel, data in contents.items()]
+    out = tmp_path / "kaart.img"
+    layout = build_fat32_image(str(out), TOTAL_SECTORS, files, dirs=dirs, label=label)
+    return layout, Fat32Reader(str(out))
+
+
+CONTENTS = {
+    "README.TXT": b"hallo kaart\n",
+    "lange naam met spaties.bin": os.urandom(3 * 512 + 17),
+    "Gemengd.Txt": b"x" * 512,
+    "leeg.dat": b"",
+    "sub/dir/genest.dat": os.urandom(5000),
+    "sub/Ééntje.txt": "ünicode".encode("utf-8"),
+}
+
+
+def test_layout_fat32_minimum():
+    layout = Fat32Layout(TOTAL_SECTORS)
+    assert layout.spc == 1
+    assert layout.cluster_count >= 65525
+    assert layout.data_start == layout.reserved + 2 * layout.fat_sectors
+    assert layout.fat_sectors * SECTOR >= (layout.cluster_count + 2) * 4
+    with pytest.raises(ValueError):
+        Fat32Layout(16 * 1024 * 1024 // SECTOR)
+
+
+def test_boot_sector_and_fsinfo(tmp_path):
+    layout, img = _build(tmp_path, CONTENTS)
+    assert img.signature == b"\x55\xAA"
+    assert img.bytes_per_sector == SECTOR
+    assert img.spc == layout.spc
+    assert img.reserved == layout.reserved
+    assert img.num_fats == 2
+    assert (img.root_entries, img.total16, img.fat16) == (0, 0, 0)
+    assert img.media == 0xF8
+    assert img.total_sectors == TOTAL_SECTORS
+    assert img.fat_sectors == layout.fat_sectors
+    assert img.root_cluster == 2
+    assert (img.fsinfo_sector, img.backup_sector) == (1, 6)
+    assert img.boot_sig == 0x29
+    assert img.label == b"TESTKAART  "
+    assert img.fs_type == b"FAT32   "
+    assert img.sector(6) == img.sector(0)
+
+    fsinfo = img.sector(1)
+    assert struct.unpack_from("<I", fsinfo, 0)[0] == 0x41615252
+    assert struct.unpack_from("<I", fsinfo, 484)[0] == 0x61417272
+    assert struct.unpack_from("<I", fsinfo, 508)[0] == 0xAA550000
+    free, next_free = struct.unpack_from("<II", fsinfo, 488)
+    used = sum(1 for v in img.fat()[2:layout.cluster_count + 2] if v)
+    assert free == layout.cluster_count - used
+    assert next_free == used + 2
+    assert img.sector(7) == fsinfo
+
+
+def test_fat_chains(tmp_path):
+    layout, img = _build(tmp_path, CONTENTS)
+    fat = img.fat()
+    assert fat == img.fat(1)
+    assert fat[0] == 0x0FFFFFF8 and fat[1] == FAT_EOC
+    entries = {name: (first, size) for name, _s, _a, first, size in img.entries(2)}
+    first, size = entries["lange naam met spaties.bin"]
+    chain = img.chain(first)
+    assert len(chain) == layout.clusters_for(size) == 4
+    assert chain == list(range(first, first + 4))      # aaneengesloten
+    assert entries["leeg.dat"] == (0, 0)
+
+
+def test_directory_entries_and_names(tmp_path):
+    _layout, img = _build(tmp_path, CONTENTS, dirs=("lege map",))
+    root = list(img.entries(2))
+    assert root[0][2] == 0x08 and root[0][1] == b"TESTKAART  "   # volumelabel eerst
+    by_name = {name: (short, attr) for name, short, attr, _c, _s in root}
+    assert by_name["README.TXT"] == (b"README  TXT", 0x20)
+    assert by_name["Gemengd.Txt"][0] == b"GEMENG~1TXT"
+    assert by_name["lange naam met spaties.bin"][0] == b"LANGEN~1BIN"
+    assert by_name["sub"][1] == 0x10
+    assert by_name["lege map"][1] == 0x10
+
+    sub_cluster = next(c for name, _s, _a, c, _z in root if name == "sub")
+    sub = list(img.entries(sub_cluster))
+    assert (sub[0][1], sub[0][3]) == (b".          ", sub_cluster)
+    assert (sub[1][1], sub[1][3]) == (b"..         ", 0)     # ouder is de root
+    nested = next(c for name, _s, _a, c, _z in sub if name == "dir")
+    dotdot = list(img.entries(nested))[1]
+    assert dotdot[3] == sub_cluster
+
+
+def test_contents_round_trip(tmp_path):
+    _layout, img = _build(tmp_path, CONTENTS, dirs=("lege map",))
+    assert img.walk() == CONTENTS
+
+
+def test_stream_source(tmp_path):
+    files = [(rel, len(data), 0.0, None) for rel, data in CONTENTS.items()]
+    stream = [(rel.upper(), io.BytesIO(data)) for rel, data in reversed(list(CONTENTS.items()))]
+    out = tmp_path / "stream.img"
+    build_fat32_image(str(out), TOTAL_SECTORS, files, stream=stream)
+    assert Fat32Reader(str(out)).walk() == CONTENTS
+
+
+def test_does_not_fit(tmp_path):
+    files = [("groot.bin", TOTAL_SECTORS * SECTOR, 0.0, None)]
+    with pytest.raises(ValueError):
+        build_fat32_image(str(tmp_path / "x.img"), TOTAL_SECTORS, files)
+
+
+@pytest.mark.parametrize("name, taken, expected", [
+    ("README.TXT", set(), (b"README  TXT", False)),
+    ("KERNEL", set(), (b"KERNEL     ", False)),
+    ("readme.txt", set(), (b"README~1TXT", True)),
+    ("README.TXT", {b"README  TXT"}, (b"README~1TXT", True)),
+    ("lange naam.jpeg", set(), (b"LANGEN~1JPE", True)),
+    ("a.b.c", set(), (b"AB~1    C  ", True)),
+    (".hidden", set(), (b"HIDDEN~1   ", True)),
+    ("café.txt", set(), (b"CAF_~1  TXT", True)),
+    ("lange naam.jpeg", {b"LANGEN~1JPE"}, (b"LANGEN~2JPE", True)),
+])
+def test_short_name(name, taken, expected):
+    assert _short_name(name, taken) == expected
+
+
+def test_short_name_unique_in_directory(tmp_path):
+    contents = {f"bestand nummer {i}.txt": str(i).encode() for i in range(12)}
+    _layout, img = _build(tmp_path, contents)
+    shorts = [short for _n, short, attr, _c, _s in img.entries(2) if not attr & 0x08]
+    assert len(set(shorts)) == len(shorts) == 12
+    assert b"BESTAN~1TXT" in shorts and b"BESTA~10TXT" in shorts
+    assert img.walk() == contents
+
+
+def test_quick_format_image_file(tmp_path):
+    path = tmp_path / "leeg.img"
+    with open(path, "wb") as f:
+        f.truncate(TOTAL_SECTORS * SECTOR)
+        f.seek(123 * SECTOR)
+        f.write(b"oud")
+    with open_raw_target(str(path)) as raw:
+        assert raw.kind == "bestand"
+        layout = quick_format(raw, label="LEEG", hidden_sectors=2048)
+    img = Fat32Reader(str(path))
+    assert img.signature == b"\x55\xAA"
+    assert img.hidden == 2048
+    assert img.total_sectors == TOTAL_SECTORS
+    assert img.label == b"LEEG       "
+    assert img.sector(6) == img.sector(0)
+    fat = img.fat()
+    assert fat == img.fat(1)
+    assert fat[:3] == (0x0FFFFFF8, FAT_EOC, FAT_EOC)
+    assert not any(fat[3:])
+    free = struct.unpack_from("<I", img.sector(1), 488)[0]
+    assert free == layout.cluster_count - 1
+    assert [e[2] for e in img.entries(2)] == [0x08]
+    assert img.walk() == {}
+
+
+def test_quick_format_keeps_hidden_sectors(tmp_path):
+    path = tmp_path / "kaart.img"
+    with open(path, "wb") as f:
+        f.truncate(TOTAL_SECTORS * SECTOR)
+    with open_raw_target(str(path)) as raw:
+        quick_format(raw, hidden_sectors=8192)
+    with open_raw_target(str(path)) as raw:
+        quick_format(raw)
+    assert Fat32Reader(str(path)).hidden == 8192
+
+
+def _random_image(path, size):
+    data = os.urandom(size)
+    path.write_bytes(data)
+    return data
+
+
+def test_probe_restores_original_blocks(tmp_path):
+    path = tmp_path / "kaart.img"
+    original = _random_image(path, 16 * 1024 * 1024)
+    with open_raw_target(str(path)) as raw:
+        result = probe(raw, seq_bytes=1024 * 1024, budget=30.0)
+    assert result["complete"] and result["bad"] == []
+    assert result["samples"] == 16
+    assert result["seq_write_mbps"] and result["seq_read_mbps"] and result["random_iops"]
+    assert path.read_bytes() == original
+
+
+class _FakeCapacity:
+    """Neppe kaart: meldt het dubbele van de echte opslag, adressen lopen rond."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.size = raw.size * 2
+
+    def read_at(self, offset, length):
+        return self.raw.read_at(offset % self.raw.size, length)
+
+    def write_at(self, offset, data):
+        self.raw.write_at(offset % self.raw.size, data)
+
+    def flush(self):
+        self.raw.flush()
+
+    def drop_cache(self):
+        self.raw.drop_cache()
+
+
+def test_probe_detects_fake_capacity_and_restores(tmp_path):
+    path = tmp_path / "nep.img"
+    original = _random_image(path, 8 * 1024 * 1024)
+    with open_raw_target(str(path)) as raw:
+        result = probe(_FakeCapacity(raw), seq_bytes=512 * 1024, random_writes=8, budget=30.0)
+    assert result["bad"]
+    assert path.read_bytes() == original
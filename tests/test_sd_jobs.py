@@ -0,0 +1,162 @@
+import sqlite3
+import time
+from contextlib import closing
+
+import pytest
+
+from sd_jobs import JOURNAL_CHECKPOINT_FILES, JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite"))
+
+
+def _rows(store, table):
+    with closing(store._connect()) as db:
+        return [dict(r) for r in db.execute(f"SELECT * FROM {table}")]
+
+
+# ── Wachtrij ──
+
+def test_enqueue_once_per_drive_and_refresh(store):
+    first = store.enqueue("E:", "v1", "/bron", card="vol:1")
+    assert store.enqueue("E:", "v2", "/andere", card="vol:2") == first
+    [item] = store.queued()
+    assert (item["version"], item["source"], item["card"]) == ("v2", "/andere", "vol:2")
+    store.enqueue("E:", "v3", "/andere")           # onbekende kaart: herkenning blijft staan
+    assert store.queued()[0]["card"] == "vol:2"
+    assert store.enqueue("F:", "v1", "/bron") != first
+    assert [i["drive"] for i in store.queued()] == ["E:", "F:"]
+
+
+def test_running_item_is_not_refreshed(store):
+    job = store.enqueue("E:", "v1", "/bron", card="vol:1")
+    store.set_state(job, "running")
+    assert store.enqueue("E:", "v2", "/bron", card="vol:2") == job
+    [row] = _rows(store, "queue")
+    assert (row["version"], row["card"]) == ("v1", "vol:1")
+
+
+def test_cancel_removed_drive(store):
+    queued = store.enqueue("E:", "v1", "/bron")
+    running = store.enqueue("F:", "v1", "/bron")
+    store.set_state(running, "running")
+    assert store.cancel("E:") == 1
+    assert store.cancel("F:") == 0                 # lopend item blijft staan
+    assert store.queued() == []
+    states = {r["id"]: r["state"] for r in _rows(store, "queue")}
+    assert states == {queued: "cancelled", running: "running"}
+    assert store.enqueue("E:", "v1", "/bron") != queued
+
+
+def test_recover_requeues_running(store):
+    job = store.enqueue("E:", "v1", "/bron")
+    store.set_state(job, "running")
+    store.open_journal("vol:1", "v1", "d1")
+    assert store.recover() == (1, 1)
+    assert [i["id"] for i in store.queued()] == [job]
+
+
+def test_prune_removes_old_finished_rows(store):
+    done = store.enqueue("E:", "v1", "/bron")
+    store.set_state(done, "done")
+    failed = store.enqueue("F:", "v1", "/bron")
+    store.set_state(failed, "failed")
+    waiting = store.enqueue("G:", "v1", "/bron")
+    old = store.open_journal("vol:1", "v1", "d1")
+    old.add("a.bin", "h", 1, None)
+    old.checkpoint()
+    old.finish(False)
+    current = store.open_journal("vol:2", "v1", "d1")
+    with closing(store._connect()) as db, db:
+        db.execute("UPDATE queue SET updated = ? WHERE id != ?", (time.time() - 30 * 86400, waiting))
+        db.execute("UPDATE copies SET updated = ?", (time.time() - 30 * 86400,))
+
+    assert store.prune() == 3                      # twee wachtrij-items en de mislukte kopie
+    assert {r["id"] for r in _rows(store, "queue")} == {waiting}
+    assert [r["id"] for r in _rows(store, "copies")] == [current.id]
+    assert _rows(store, "journal") == []
+    assert store.prune() == 0
+
+
+def test_old_database_gets_card_column(tmp_path):
+    path = str(tmp_path / "oud.sqlite")
+    with closing(sqlite3.connect(path)) as db, db:
+        db.execute("CREATE TABLE queue (id TEXT PRIMARY KEY, created REAL NOT NULL, drive TEXT NOT NULL, "
+                   "version TEXT NOT NULL, source TEXT NOT NULL, state TEXT NOT NULL, updated REAL)")
+        db.execute("INSERT INTO queue VALUES ('x', 0, 'E:', 'v1', '/bron', 'queued', 0)")
+    store = JobStore(path)
+    assert store.queued()[0]["card"] is None
+    store.enqueue("E:", "v2", "/bron", card="vol:1")
+    assert store.queued()[0]["card"] == "vol:1"
+
+
+# ── Schrijfjournaal ──
+
+def test_journal_resume_after_interruption(store, tmp_path):
+    journal = store.open_journal("vol:1", "v1", "digest")
+    journal.add("a.bin", "ha", 10, tmp_path / "a.bin")
+    journal.add("b.bin", "hb", 20, tmp_path / "b.bin")
+    assert journal.pending_targets() == [tmp_path / "a.bin", tmp_path / "b.bin"]
+    journal.checkpoint()
+    journal.add("c.bin", "hc", 30, tmp_path / "c.bin")    # niet geflusht: telt niet
+    assert not store.resumable("vol:1", "v2", "digest")
+    assert not store.resumable("vol:1", "v1", "ander")
+
+    store.recover()                                # programma viel weg
+    assert store.resumable("vol:1", "v1", "digest")
+    resumed = store.open_journal("vol:1", "v1", "digest")
+    assert resumed.id == journal.id
+    assert resumed.done == {"a.bin": {"hash": "ha", "size": 10}, "b.bin": {"hash": "hb", "size": 20}}
+
+    resumed.add("c.bin", "hc", 30, tmp_path / "c.bin")
+    resumed.checkpoint()
+    resumed.finish(True)
+    assert not store.resumable("vol:1", "v1", "digest")
+    assert _rows(store, "journal") == []
+    assert store.open_journal("vol:1", "v1", "digest").done == {}
+
+
+def test_journal_checkpoint_due(store):
+    journal = store.open_journal("vol:1", "v1", "digest")
+    for i in range(JOURNAL_CHECKPOINT_FILES - 1):
+        journal.add(f"{i}.bin", "h", 1, None)
+    assert not journal.due()
+    journal.add("laatste.bin", "h", 1, None)
+    assert journal.due()
+    journal.checkpoint()
+    assert not journal.due() and journal.pending_targets() == []
+    assert len(journal.done) == JOURNAL_CHECKPOINT_FILES
+
+
+def test_failed_copy_is_not_resumed(store):
+    journal = store.open_journal("vol:1", "v1", "digest")
+    journal.add("a.bin", "ha", 10, None)
+    journal.checkpoint()
+    journal.finish(False)
+    assert not store.resumable("vol:1", "v1", "digest")
+    fresh = store.open_journal("vol:1", "v1", "digest")
+    assert fresh.id != journal.id and fresh.done == {}
+
+
+def test_open_jobs_reuses_store_per_path(tmp_path):
+    from sd_manager import open_jobs
+    path = str(tmp_path / "jobs.sqlite")
+    store = open_jobs({"job_db": path})
+    assert isinstance(store, JobStore)
+    assert open_jobs({"job_db": path}) is store
+    assert open_jobs({"job_db": str(tmp_path / "ander.sqlite")}) is not store
+    assert open_jobs({"job_db": ""}) is None
+
+
+def test_set_card_fills_unknown_card_only(store):
+    job = store.enqueue("E:", "v1", "/bron")
+    store.set_card("E:", "vol:1")
+    assert store.queued()[0]["card"] == "vol:1"
+    store.set_card("E:", "vol:2")                  # andere kaart: niet overschrijven
+    assert store.queued()[0]["card"] == "vol:1"
+    store.set_state(job, "done")
+    store.enqueue("F:", "v1", "/bron")
+    store.set_card("E:", "vol:3")
+    assert {r["drive"]: r["card"] for r in _rows(store, "queue")} == {"E:": "vol:1", "F:": None}
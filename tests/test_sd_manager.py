@@ -0,0 +1,443 @@
+import hashlib
+import os
+import zipfile
+from types import SimpleNamespace
+
+import pytest
+
+import sd_manager
+from sd_history import JobTimer
+from sd_manager import (DEFAULT_CONFIG, WIPE_DELETE_MAX_ENTRIES, WIPE_DISCARD_MIN_BYTES, _count_tree,
+                        is_block_device, plan_wipe)
+
+
+def test_is_block_device(tmp_path):
+    path = tmp_path / "kaart.img"
+    path.write_bytes(b"\0" * 512)
+    assert not is_block_device(str(path))
+    assert not is_block_device(str(tmp_path))
+    assert not is_block_device(str(tmp_path / "bestaat-niet"))
+    assert is_block_device("\\\\.\\E:")
+
+
+def test_image_mode_block_device_size_guard(monkeypatch, tmp_path):
+    """Een blokdevice in image-modus wordt niet als map gevalideerd, maar te groot of
+    onbekend groot wordt geweigerd voordat er iets geschreven wordt."""
+    monkeypatch.setattr(sd_manager, "is_block_device", lambda path: True)
+    monkeypatch.setattr(sd_manager, "validate_drive", lambda *a, **k: (_ for _ in ()).throw(AssertionError))
+    config = dict(DEFAULT_CONFIG, image_mode=True, max_drive_gb=5.0)
+    logs = []
+
+    def flash(size_gb, probed):
+        monkeypatch.setattr(sd_manager, "_block_device_size_gb", lambda path: probed)
+        logs.clear()
+        return sd_manager._flash_steps("/dev/sdz", "v1", str(tmp_path), config, lambda m, k="info": logs.append((k, m)),
+                                       lambda s: None, None, size_gb, JobTimer("/dev/sdz", "v1", "image"))
+
+    assert flash(64.0, None) is False
+    assert logs[-1][0] == "error" and "maximaal" in logs[-1][1]
+    assert flash(None, 64.0) is False
+    assert "maximaal" in logs[-1][1]
+    assert flash(None, None) is False
+    assert "niet te bepalen" in logs[-1][1]
+
+
+@pytest.mark.parametrize("entries, used, expected", [
+    (0, 0, "none"),
+    (1, 10, "delete"),
+    (WIPE_DELETE_MAX_ENTRIES, WIPE_DISCARD_MIN_BYTES - 1, "delete"),
+    (WIPE_DELETE_MAX_ENTRIES + 1, 0, "quickformat"),
+    (WIPE_DELETE_MAX_ENTRIES + 1, WIPE_DISCARD_MIN_BYTES - 1, "quickformat"),
+    (1, WIPE_DISCARD_MIN_BYTES, "discard"),
+    (WIPE_DELETE_MAX_ENTRIES + 1, WIPE_DISCARD_MIN_BYTES, "discard"),
+])
+def test_plan_wipe_thresholds(entries, used, expected):
+    assert plan_wipe(entries, used) == expected
+
+
+def test_count_tree_complete(tmp_path):
+    (tmp_path / "map" / "sub").mkdir(parents=True)
+    (tmp_path / "a.bin").write_bytes(b"x" * 100)
+    (tmp_path / "map" / "sub" / "b.bin").write_bytes(b"y" * 50)
+    assert _count_tree(tmp_path, 10, 1000) == (4, 150, True)
+    assert _count_tree(tmp_path) == (4, 150, True)
+
+
+def test_count_tree_stops_at_entry_limit(tmp_path):
+    for i in range(20):
+        (tmp_path / f"d{i}").mkdir()
+        for j in range(20):
+            (tmp_path / f"d{i}" / f"f{j}").write_bytes(b"")
+    entries, used, complete = _count_tree(tmp_path, max_entries=30)
+    assert not complete
+    assert entries == 31
+
+
+def test_count_tree_limits_decide_like_full_count(tmp_path):
+    for i in range(WIPE_DELETE_MAX_ENTRIES + 50):
+        (tmp_path / f"f{i}").write_bytes(b"")
+    entries, used, complete = _count_tree(tmp_path, WIPE_DELETE_MAX_ENTRIES, WIPE_DISCARD_MIN_BYTES)
+    assert not complete and entries == WIPE_DELETE_MAX_ENTRIES + 1
+    assert plan_wipe(entries, used) == plan_wipe(*_count_tree(tmp_path)[:2]) == "quickformat"
+
+
+def test_count_tree_stops_at_byte_limit(tmp_path):
+    for i in range(10):
+        (tmp_path / f"f{i}.bin").write_bytes(b"z" * 100)
+    entries, used, complete = _count_tree(tmp_path, max_bytes=250)
+    assert not complete
+    assert (entries, used) == (3, 300)
+
+
+def _make_zip(path, contents):
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("lege map/", b"")
+        for rel, data in contents.items():
+            zf.writestr(rel, data)
+
+
+def test_archive_first_use_reads_package_once(monkeypatch, tmp_path):
+    source = tmp_path / "bron"
+    card = tmp_path / "kaart"
+    source.mkdir()
+    card.mkdir()
+    contents = {"a.bin": os.urandom(70000), "map/b.txt": b"hallo", "map/diep/c.dat": b"x" * 1000}
+    _make_zip(source / "v1.zip", contents)
+    reads = []
+    real_iter = sd_manager.iter_archive
+    monkeypatch.setattr(sd_manager, "iter_archive", lambda *a, **k: (reads.append(a), real_iter(*a, **k))[1])
+
+    assert sd_manager.cached_version_manifest(str(source), "v1") is None
+    sd_manager.copy_version_to_drive(str(source), "v1", str(card), lambda m, k="info": None, verify=True)
+    assert len(reads) == 1
+    for rel, data in contents.items():
+        assert (card / rel).read_bytes() == data
+    assert (card / "lege map").is_dir()
+
+    manifest = sd_manager.cached_version_manifest(str(source), "v1")
+    assert manifest is not None
+    assert manifest["files"]["map/b.txt"]["hash"] == hashlib.sha256(b"hallo").hexdigest()
+    assert set(manifest["dirs"]) == {"lege map", "map", "map/diep"}
+    assert manifest == sd_manager._archive_manifest(source / "v1.zip")
+    assert sd_manager.load_version_manifest(str(source), "v1") == manifest
+    assert len(reads) == 2      # alleen de expliciete _archive_manifest hierboven
+
+
+def test_unsupported_archive_suffix_is_not_a_version():
+    assert sd_manager.archive_version_name("v1.tar.xz") == "v1"
+    assert sd_manager.archive_version_name("v1.tar.gz") is None
+    assert sd_manager.archive_version_name("v1.tgz") is None
+
+
+def test_version_monitor_keeps_list_while_source_unreachable(tmp_path):
+    source = tmp_path / "share"
+    (source / "v1").mkdir(parents=True)
+    (source / "v1" / "app.bin").write_bytes(b"1")
+    changes, logs = [], []
+    monitor = sd_manager.VersionMonitor(str(source), lambda versions, path: changes.append(versions),
+                                        cache_path=str(tmp_path / "cache.json"),
+                                        log_cb=lambda m, k="info": logs.append(k))
+    monitor._poll()
+    assert len(changes) == 1 and "v1" in changes[0]
+    known = dict(monitor.versions)
+
+    source.rename(tmp_path / "weg")
+    monitor._poll()
+    monitor._poll()
+    assert len(changes) == 1
+    assert monitor.versions == known
+    assert logs == ["warning"]
+
+    (tmp_path / "weg").rename(source)
+    monitor._poll()
+    assert len(changes) == 1
+    assert logs == ["warning", "info"]
+
+
+def test_restaging_waits_for_readers(tmp_path):
+    source = tmp_path / "share"
+    (source / "v1").mkdir(parents=True)
+    (source / "v1" / "app.bin").write_bytes(b"oud")
+    config = dict(DEFAULT_CONFIG, staging_dir=str(tmp_path / "staging"))
+    logs = []
+    log = lambda m, k="info": logs.append((k, m))  # noqa: E731
+
+    with sd_manager.staged_source(str(source), "v1", config, log) as local:
+        assert local != str(source)
+        staged_file = os.path.join(local, "v1", "app.bin")
+        (source / "v1" / "app.bin").write_bytes(b"nieuw!")
+        with pytest.raises(RuntimeError):
+            sd_manager.stage_version(str(source), "v1", config["staging_dir"], log)
+        with sd_manager.staged_source(str(source), "v1", config, log) as second:
+            assert second == str(source)        # leest de nieuwe inhoud van de bron
+        assert logs[-1][0] == "warning"
+        with open(staged_file, "rb") as f:
+            assert f.read() == b"oud"           # lopende flash leest ongestoord verder
+
+    assert not sd_manager._staging_leases
+    with sd_manager.staged_source(str(source), "v1", config, log) as local:
+        with open(os.path.join(local, "v1", "app.bin"), "rb") as f:
+            assert f.read() == b"nieuw!"
+    assert not sd_manager._staging_leases
+
+
+def _staging_states(staging_dir):
+    states = []
+    for path in sorted(staging_dir.glob(f"*/{sd_manager.CACHE_DIRNAME}/staged/*.json")):
+        state = sd_manager._read_staging_state(path)
+        states.append((state["used"], path.parents[2], state))
+    return states
+
+
+def test_staging_without_hardlinks_counts_copies(monkeypatch, tmp_path):
+    def no_link(src, dst):
+        raise OSError("geen hardlinks")
+    monkeypatch.setattr(os, "link", no_link)
+    source = tmp_path / "share"
+    staging = tmp_path / "staging"
+    for version in ("v1", "v2"):
+        (source / version).mkdir(parents=True)
+        (source / version / "app.bin").write_bytes(version.encode() * 5000)
+    logs = []
+    log = lambda m, k="info": logs.append(k)  # noqa: E731
+
+    sd_manager.stage_version(str(source), "v1", str(staging), log)
+    sd_manager.stage_version(str(source), "v2", str(staging), log)
+    assert "warning" in logs
+    states = _staging_states(staging)
+    assert [s["linked"] for _u, _p, s in states] == [False, False]
+    # twee blobs plus twee losse kopieën
+    assert sd_manager._staging_usage(str(staging), states) == 4 * 10000
+
+    budget_gb = 25000 / 1024 ** 3
+    sd_manager.evict_staging(str(staging), budget_gb, log, keep=(str(states[1][1]), "v2"))
+    states = _staging_states(staging)
+    assert [s["version"] for _u, _p, s in states] == ["v2"]
+    assert sd_manager._staging_usage(str(staging), states) == 10000
+    assert (states[0][1] / "v2" / "app.bin").read_bytes() == b"v2" * 5000
+
+
+def test_staging_with_hardlinks_shares_blobs(tmp_path):
+    source = tmp_path / "share"
+    staging = tmp_path / "staging"
+    for version in ("v1", "v2"):
+        (source / version).mkdir(parents=True)
+        (source / version / "gedeeld.bin").write_bytes(b"s" * 8000)
+    sd_manager.stage_version(str(source), "v1", str(staging), lambda m, k="info": None)
+    sd_manager.stage_version(str(source), "v2", str(staging), lambda m, k="info": None)
+    states = _staging_states(staging)
+    assert all(s["linked"] for _u, _p, s in states)
+    assert sd_manager._staging_usage(str(staging), states) == 8000
+
+
+def test_archive_first_sync_reads_package_once(monkeypatch, tmp_path):
+    source = tmp_path / "bron"
+    card = tmp_path / "kaart"
+    source.mkdir()
+    card.mkdir()
+    (card / "oud.bin").write_bytes(b"weg")
+    contents = {"a.bin": os.urandom(70000), "map/b.txt": b"hallo"}
+    _make_zip(source / "v1.zip", contents)
+    reads = []
+    real_iter = sd_manager.iter_archive
+    monkeypatch.setattr(sd_manager, "iter_archive", lambda *a, **k: (reads.append(a), real_iter(*a, **k))[1])
+    config = dict(DEFAULT_CONFIG, sync_mode=True, job_db="", allow_subdirs=True)
+
+    assert sd_manager._flash_steps(str(card), "v1", str(source), config, lambda m, k="info": None,
+                                   lambda s: None, None, None, JobTimer(str(card), "v1", "sync"))
+    assert len(reads) == 1
+    assert not (card / "oud.bin").exists()
+    for rel, data in contents.items():
+        assert (card / rel).read_bytes() == data
+    manifest = sd_manager.cached_version_manifest(str(source), "v1")
+    assert sd_manager.read_stamp(str(card))["digest"] == manifest["digest"]
+    assert sd_manager.card_up_to_date(str(card), "v1", manifest)
+
+
+def test_journal_spot_check_catches_other_card(tmp_path):
+    contents = {f"f{i}.bin": os.urandom(100) for i in range(20)}
+    for rel, data in contents.items():
+        (tmp_path / rel).write_bytes(data)
+    journal = SimpleNamespace(done={rel: {"hash": hashlib.sha256(data).hexdigest(), "size": 100}
+                                    for rel, data in contents.items()})
+    assert sd_manager._journal_trusted(journal, str(tmp_path), lambda m, k="info": None)
+
+    # kloonkaart: zelfde herkenning en groottes, andere inhoud
+    for rel in contents:
+        (tmp_path / rel).write_bytes(os.urandom(100))
+    logs = []
+    assert not sd_manager._journal_trusted(journal, str(tmp_path), lambda m, k="info": logs.append(k))
+    assert logs == ["warning"]
+
+
+def test_sync_skips_unchanged_and_deletes_extra(monkeypatch, tmp_path):
+    source = tmp_path / "bron"
+    card = tmp_path / "kaart"
+    (source / "v1" / "map").mkdir(parents=True)
+    (source / "v1" / "gelijk.bin").write_bytes(b"g" * 1000)
+    (source / "v1" / "anders.bin").write_bytes(b"nieuw")
+    (source / "v1" / "map" / "nieuw.dat").write_bytes(b"n" * 10)
+    (card / "weg").mkdir(parents=True)
+    (card / "gelijk.bin").write_bytes(b"g" * 1000)
+    (card / "anders.bin").write_bytes(b"oud!!")
+    (card / "extra.bin").write_bytes(b"x")
+    (card / "weg" / "ook.bin").write_bytes(b"y")
+    gelijk_mtime = (card / "gelijk.bin").stat().st_mtime_ns
+    log = lambda m, k="info": None  # noqa: E731
+
+    stats = sd_manager.sync_version_to_drive(str(source), "v1", str(card), log, verify=True)
+    assert (stats["written"], stats["skipped"], stats["deleted"], stats["delete_errors"]) == (2, 1, 2, 0)
+    assert stats["skipped_bytes"] == 1000
+    assert (card / "gelijk.bin").stat().st_mtime_ns == gelijk_mtime
+    assert (card / "anders.bin").read_bytes() == b"nieuw"
+    assert (card / "map" / "nieuw.dat").read_bytes() == b"n" * 10
+    assert not (card / "extra.bin").exists() and not (card / "weg").exists()
+    assert stats["manifest"] == sd_manager.load_version_manifest(str(source), "v1")
+
+    # wat niet weg kan wordt gelogd en geteld, de sync gaat gewoon door
+    (card / "vast.bin").write_bytes(b"v")
+    real_remove = sd_manager.force_remove
+
+    def stuck(path):
+        if path.name == "vast.bin":
+            raise PermissionError("alleen-lezen")
+        real_remove(path)
+    monkeypatch.setattr(sd_manager, "force_remove", stuck)
+    logs = []
+    stats = sd_manager.sync_version_to_drive(str(source), "v1", str(card), lambda m, k="info": logs.append(k))
+    assert (stats["written"], stats["skipped"], stats["deleted"], stats["delete_errors"]) == (0, 3, 0, 1)
+    assert "warning" in logs and (card / "vast.bin").exists()
+
+
+def test_force_remove_clears_readonly(tmp_path):
+    (tmp_path / "map").mkdir()
+    for path in (tmp_path / "los.bin", tmp_path / "map" / "binnen.bin"):
+        path.write_bytes(b"x")
+        os.chmod(path, 0o444)
+    sd_manager.force_remove(tmp_path / "los.bin")
+    sd_manager.force_remove(tmp_path / "map")
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize("engine", ["kernel", "pipeline"])
+def test_verify_retries_then_fails_on_corrupt_readback(monkeypatch, tmp_path, engine):
+    source = tmp_path / "bron"
+    (source / "v1").mkdir(parents=True)
+    (source / "v1" / "app.bin").write_bytes(os.urandom(5000))
+    reads = []
+    real_hash = sd_manager.hash_card_file
+
+    def flaky(path, bad):
+        reads.append(path)
+        return "0" * 64 if len(reads) <= bad else real_hash(path)
+
+    def copy(card, bad):
+        card.mkdir()
+        reads.clear()
+        monkeypatch.setattr(sd_manager, "hash_card_file", lambda path, *a: flaky(path, bad))
+        logs = []
+        result = sd_manager.copy_version_to_drive(str(source), "v1", str(card), lambda m, k="info": logs.append(k),
+                                                  verify=True, engine=engine)
+        return result, logs
+
+    # één slechte teruglezing: opnieuw geschreven en daarna goed
+    result, logs = copy(tmp_path / "kaart1", bad=1)
+    assert result["retries"] == 1 and result["verified"] == 1
+    assert "warning" in logs
+    assert (tmp_path / "kaart1" / "app.bin").read_bytes() == (source / "v1" / "app.bin").read_bytes()
+
+    # blijvend corrupt: na de extra pogingen opgeven
+    with pytest.raises(IOError, match="verificatie"):
+        copy(tmp_path / "kaart2", bad=100)
+    assert len(reads) >= 1 + sd_manager.VERIFY_RETRIES
+
+
+def test_validate_drive_stops_at_max_files(monkeypatch, tmp_path):
+    for i in range(500):
+        (tmp_path / f"f{i:03}.bin").write_bytes(b"")
+    seen = []
+    real_scandir = os.scandir
+
+    class CountingScandir:
+        def __init__(self, path):
+            self.it = real_scandir(path)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            self.it.close()
+
+        def __iter__(self):
+            for entry in self.it:
+                seen.append(entry.name)
+                yield entry
+    monkeypatch.setattr(sd_manager.os, "scandir", CountingScandir)
+
+    ok, reason, corrupt = sd_manager.validate_drive(str(tmp_path), [".bin"], max_files=10)
+    assert (ok, corrupt) == (False, False)
+    assert reason == "Drive bevat meer dan 10 bestanden — mogelijk verkeerde drive."
+    assert len(seen) == 11
+    assert sd_manager.validate_drive(str(tmp_path), [".bin"], max_files=500) == (True, "OK", False)
+
+
+def test_card_write_order_largest_first():
+    jobs = [("s", "t", "b.bin", 10), ("s", "t", "a.bin", 10), ("s", "t", "groot.bin", 1000), ("s", "t", "leeg", 0)]
+    assert [job[2] for job in sd_manager.card_write_order(jobs)] == ["groot.bin", "a.bin", "b.bin", "leeg"]
+
+
+@pytest.mark.parametrize("engine", ["kernel", "pipeline"])
+@pytest.mark.parametrize("policy, per_file", [("end", False), ("file", True)])
+def test_flush_policy(monkeypatch, tmp_path, engine, policy, per_file):
+    source = tmp_path / "bron"
+    card = tmp_path / "kaart"
+    (source / "v1").mkdir(parents=True)
+    card.mkdir()
+    sizes = {"klein.bin": 10, "middel.bin": 2000, "groot.bin": 70000}
+    for rel, size in sizes.items():
+        (source / "v1" / rel).write_bytes(os.urandom(size))
+    fsyncs, flushes = [], []
+    real_fsync = os.fsync
+    monkeypatch.setattr(sd_manager.os, "fsync", lambda fd: (fsyncs.append(fd), real_fsync(fd))[1])
+    monkeypatch.setattr(sd_manager, "flush_volume", lambda drive, written=(): (flushes.append(list(written)), 0.0)[1])
+    # een journaal dat nooit checkpoint, alleen om de schrijfvolgorde te zien
+    journal = SimpleNamespace(done={}, order=[], due=lambda: False, checkpoint=lambda: None)
+    journal.add = lambda rel, digest, size, target: journal.order.append(rel)
+
+    sd_manager.copy_version_to_drive(str(source), "v1", str(card), lambda m, k="info": None,
+                                     engine=engine, flush=policy, journal=journal)
+    assert journal.order == ["groot.bin", "middel.bin", "klein.bin"]
+    assert len(fsyncs) == (len(sizes) if per_file else 0)
+    assert len(flushes) == 1                                   # volume altijd aan het eind
+    assert sorted(p.name for p in flushes[0]) == sorted(sizes)
+
+
+def test_stamp_skips_second_flash_until_card_changes(monkeypatch, tmp_path):
+    source = tmp_path / "bron"
+    card = tmp_path / "kaart"
+    (source / "v1").mkdir(parents=True)
+    card.mkdir()
+    (source / "v1" / "app.bin").write_bytes(b"a" * 4000)
+    (source / "v1" / "data.dat").write_bytes(b"d" * 100)
+    config = dict(DEFAULT_CONFIG, history_db="", job_db="", log_file="")
+    log = lambda m, k="info": None  # noqa: E731
+
+    assert sd_manager.flash_drive(str(card), "v1", str(source), config, log)
+    assert sd_manager.read_stamp(str(card))["version"] == "v1"
+
+    # tweede keer: niet klaarzetten, niet wachten, niets wissen of schrijven
+    def forbidden(*a, **k):
+        raise AssertionError("niet verwacht bij een actuele kaart")
+    for name in ("staged_source", "clear_drive", "copy_version_to_drive", "write_stamp"):
+        monkeypatch.setattr(sd_manager, name, forbidden)
+    monkeypatch.setattr(sd_manager.flash_scheduler(config), "acquire", forbidden)
+    statuses = []
+    assert sd_manager.flash_drive(str(card), "v1", str(source), config, log, status_cb=statuses.append)
+    assert statuses == ["✅ al actueel"]
+    monkeypatch.undo()
+
+    # afwijkende grootte op de kaart: stempel telt niet meer, de kaart wordt opnieuw geschreven
+    (card / "data.dat").write_bytes(b"d" * 99)
+    assert not sd_manager.card_up_to_date(str(card), "v1", sd_manager.load_version_manifest(str(source), "v1"))
+    assert sd_manager.flash_drive(str(card), "v1", str(source), config, log)
+    assert (card / "data.dat").read_bytes() == b"d" * 100
@@ -0,0 +1,94 @@
+import math
+
+from sd_scheduler import CONCURRENCY_MARGIN, ConcurrencyController
+
+
+def _climb(controller, throughput, rounds=20, group_name="hub"):
+    """Voert _decide met synthetische metingen: throughput(limiet) -> MB/s."""
+    group = controller._group(group_name)
+    tried = []
+    now = 0.0
+    for _ in range(rounds):
+        tried.append(group.limit)
+        with controller._cond:
+            controller._decide(group, throughput(group.limit), now, None)
+        now += 10.0
+    return group, tried
+
+
+def test_default_is_unlimited():
+    controller = ConcurrencyController()
+    groups = [controller.acquire(f"kaart{i}", "hub") for i in range(50)]
+    group = groups[0]
+    assert group.limit == math.inf and len(group.active) == 50
+    with controller._cond:
+        controller._decide(group, 100.0, 0.0, None)
+    assert group.limit == math.inf
+
+
+def test_fixed_limit_is_kept():
+    controller = ConcurrencyController(fixed=3, max_limit=8, adaptive=True)
+    group, tried = _climb(controller, lambda limit: 10.0 * limit)
+    assert set(tried) == {3}
+
+
+def test_adaptive_starts_at_max():
+    controller = ConcurrencyController(max_limit=6, adaptive=True)
+    assert controller._group("hub").limit == 6
+    assert controller._group(None).limit == 6
+
+
+def test_adaptive_stays_at_max_when_more_is_faster():
+    controller = ConcurrencyController(max_limit=6, adaptive=True)
+    group, tried = _climb(controller, lambda limit: 10.0 * limit)
+    assert tried[:2] == [6, 5]
+    assert group.limit == 6
+    assert group.settled_at is not None
+
+
+def test_adaptive_climbs_down_to_the_knee():
+    # gedeelde hub: boven 3 schrijvers daalt de totale doorvoer
+    curve = {1: 20.0, 2: 36.0, 3: 45.0, 4: 40.0, 5: 35.0, 6: 30.0}
+    controller = ConcurrencyController(max_limit=6, adaptive=True)
+    group, tried = _climb(controller, curve.__getitem__)
+    assert tried[:5] == [6, 5, 4, 3, 2]
+    assert group.limit == 3
+    assert set(tried[5:]) == {3}
+
+
+def test_adaptive_prefers_fewer_within_margin():
+    flat = 50.0
+    controller = ConcurrencyController(max_limit=4, adaptive=True)
+    group, _tried = _climb(controller, lambda limit: flat if limit > 1 else flat * (1 - 2 * CONCURRENCY_MARGIN))
+    assert group.limit == 2
+
+
+def test_adaptive_reprobes_after_interval():
+    curve = {1: 10.0, 2: 30.0, 3: 20.0}
+    controller = ConcurrencyController(max_limit=3, adaptive=True, reprobe=100.0)
+    group, _tried = _climb(controller, curve.__getitem__, rounds=6)
+    assert group.limit == 2
+    settled = group.settled_at
+    with controller._cond:
+        controller._decide(group, 30.0, settled + 101.0, None)
+    assert group.stats == {2: 30.0}             # oude metingen vergeten
+    assert group.limit == 3                      # buren worden opnieuw gemeten
+
+
+def test_release_frees_slot_and_counts_job():
+    controller = ConcurrencyController(fixed=1)
+    group = controller.acquire("a", "hub")
+    assert len(group.active) == 1
+    controller.release("a", group, n_bytes=100)
+    assert group.jobs == 1 and group.job_bytes == 100
+    assert controller.acquire("b", "hub") is group
+
+
+def test_flash_scheduler_config():
+    from sd_manager import DEFAULT_CONFIG, flash_scheduler
+    default = flash_scheduler(dict(DEFAULT_CONFIG))
+    assert not default.adaptive and default._group("x").limit == math.inf
+    auto = flash_scheduler(dict(DEFAULT_CONFIG, concurrency="auto", concurrency_max=5))
+    assert auto.adaptive and auto._group("x").limit == 5
+    fixed = flash_scheduler(dict(DEFAULT_CONFIG, concurrency=2))
+    assert not fixed.adaptive and fixed._group("x").limit == 2
@@ -0,0 +1,22 @@
+import os
+
+from sd_simulator import SimulatedDriveProvider, parse_script
+
+
+def test_own_temp_root_removed_on_stop():
+    provider = SimulatedDriveProvider(cards=2)
+    root = provider.root
+    assert len(provider.list_drives()) == 2
+    provider.stop()
+    assert not os.path.exists(root)
+
+
+def test_given_root_is_kept(tmp_path):
+    provider = SimulatedDriveProvider(root=str(tmp_path / "sim"), cards=2)
+    provider.stop()
+    assert sorted(os.listdir(tmp_path / "sim")) == ["kaart-01", "kaart-02"]
+
+
+def test_parse_script_sorted():
+    events = parse_script(["5 verwijder 3  # halverwege", "", "0 plaats alle", "8 Plaats 3"])
+    assert events == [(0.0, True, None), (5.0, False, 3), (8.0, True, 3)]